@@ -1,7 +1,10 @@
 from __future__ import annotations
 import asyncio
 import logging
+import queue
 import sys
+import time
+from contextvars import ContextVar
 
 from telegram import BotCommand
 from telegram.ext import (
@@ -10,44 +13,119 @@ from telegram.ext import (
 
 from src.config import settings
 from src.services.sei_client import SeiClient
+from src.services.price_oracles import PriceOracle
+from src.services.portfolio_manager import portfolio_manager
 from src.handlers.start import start
 from src.handlers.help import help_cmd
 from src.handlers.ping import ping
 from src.handlers.balance import balance
-from src.handlers.watch import watch, unwatch, watches, test_monitor, rescan_watches, setup_watch_job
+from src.handlers.watch import watch, unwatch, watches, test_monitor, rescan_watches, setup_watch_job, stop_watch_job
 from src.handlers.portfolio import portfolio_add, portfolio_rm, portfolio, insights, targets, rebal
 from src.handlers.alerts import alerts_on, alerts_off, setup_alerts_job
-from src.db import init_db
+from src.db import init_db, close_db
 from src.db_migrations import run_migrations
 from src.services.eliza_client import ElizaClient
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+# Run the whole program on uvloop where available
+_runner = asyncio.run
 if sys.platform != "win32":
     try:
         import uvloop  # type: ignore
-        uvloop.install()
-    except Exception:
+        _runner = uvloop.run
+    except (ImportError, AttributeError):
         pass
 
+class FastFormatter(logging.Formatter):
+    """Same layout as "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    built with one f-string and a timestamp prefix reused within the second"""
+    
+    _last_second = -1
+    _last_stamp = ""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        second = int(record.created)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        line = (
+            f"{self._last_stamp},{int(record.msecs):03d} | {record.levelname} | "
+            f"{record.name} | {record.getMessage()}"
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        if record.stack_info:
+            line = f"{line}\n{self.formatStack(record.stack_info)}"
+        return line
+
 log_handler = RotatingFileHandler(
     "seiagentbot.log", maxBytes=10*1024*1024, backupCount=5, encoding="utf-8"
 )
+log_handler.setFormatter(FastFormatter())
+
+# Records are queued on the event loop and written to file by a background thread
+_log_queue: queue.Queue = queue.Queue(-1)
+log_listener = QueueListener(_log_queue, log_handler, respect_handler_level=True)
 logging.basicConfig(
     level=getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO),
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    handlers=[log_handler]
+    handlers=[QueueHandler(_log_queue)]
 )
+log_listener.start()
 log = logging.getLogger("sei-bot")
 
+# Bot commands registered with Telegram (shared by startup and /refresh)
+_BOT_COMMANDS: tuple[BotCommand, ...] = (
+    BotCommand("start", "🚀 Start the bot"),
+    BotCommand("help", "❓ Show help and commands"),
+    BotCommand("ping", "🏓 Health check"),
+    BotCommand("chain", "🌐 Show Sei network status"),
+    BotCommand("balance", "💰 Check wallet balance"),
+    BotCommand("watch", "👀 Watch an address"),
+    BotCommand("unwatch", "❌ Stop watching address"),
+    BotCommand("watches", "📋 List watched addresses"),
+    BotCommand("test_monitor", "🧪 Test transaction monitoring"),
+    BotCommand("rescan_watches", "🔍 Extended scan for missed transactions"),
+
+    BotCommand("portfolio_add", "➕ Add address to portfolio"),
+    BotCommand("portfolio_rm", "➖ Remove address from portfolio"),
+    BotCommand("portfolio", "💼 Show portfolio summary"),
+    BotCommand("insights", "🔍 Portfolio insights & risk analysis"),
+    BotCommand("targets", "🎯 Set stable allocation target"),
+    BotCommand("rebal", "⚖️ Rebalancing advice"),
+    BotCommand("alerts_on", "🔔 Enable portfolio drop alerts"),
+    BotCommand("alerts_off", "🔕 Disable portfolio alerts"),
+)
+
+_BOT_DESCRIPTION = (
+    "🤖 Advanced DeFi Portfolio Management & AI-Powered Blockchain Monitoring for Sei Network\n\n"
+    "Features:\n"
+    "• 📊 Real-time portfolio tracking with USD valuations\n"
+    "• 🤖 AI-powered analytics and risk assessment\n"
+    "• 🔔 Intelligent portfolio drop alerts\n"
+    "• ⚖️ Smart rebalancing recommendations\n"
+    "• 🌐 Multi-network support (Testnet/Mainnet)\n"
+    "• 📈 Price oracle integration with Rivalz ADCS\n"
+    "• 🧠 ElizaOS AI advisory integration\n\n"
+    "Built for AI/Accelathon 2024 - Where AI agents go from smart to sovereign!"
+)
+_BOT_SHORT_DESCRIPTION = "🤖 AI-Powered DeFi Portfolio Management for Sei Network"
+
 async def chain_info(update, context):
     sei: SeiClient = context.bot_data["sei_client"]
     
-    # Test connection
-    is_connected = await sei.test_connection()
+    # One RPC: a successful chain info probe means we're connected
+    try:
+        info = await sei.get_chain_info()
+        is_connected = True
+    except Exception as e:
+        log.warning(f"Chain info probe failed: {e}")
+        info = {"chain_id": settings.SEI_CHAIN_ID, "rpc": settings.SEI_RPC_URL}
+        is_connected = False
     status_emoji = "🟢" if is_connected else "🔴"
     status_text = "Connected" if is_connected else "Disconnected"
     
-    info = await sei.get_chain_info()
     text = (
         f"<b>Sei Network Status</b>\n\n"
         f"🌐 <b>Network:</b> <code>{info['chain_id']}</code>\n"
@@ -63,28 +141,9 @@ async def chain_info(update, context):
 async def refresh_commands(update, context):
     """Manually refresh bot commands"""
     try:
-        commands = [
-            BotCommand("start", "🚀 Start the bot"),
-            BotCommand("help", "❓ Show help and commands"),
-            BotCommand("ping", "🏓 Health check"),
-            BotCommand("chain", "🌐 Show Sei network status"),
-            BotCommand("balance", "💰 Check wallet balance"),
-            BotCommand("watch", "👀 Watch an address"),
-            BotCommand("unwatch", "❌ Stop watching address"),
-            BotCommand("watches", "📋 List watched addresses"),
-            BotCommand("portfolio_add", "➕ Add address to portfolio"),
-            BotCommand("portfolio_rm", "➖ Remove address from portfolio"),
-            BotCommand("portfolio", "💼 Show portfolio summary"),
-            BotCommand("insights", "🔍 Portfolio insights & risk analysis"),
-            BotCommand("targets", "🎯 Set stable allocation target"),
-            BotCommand("rebal", "⚖️ Rebalancing advice"),
-            BotCommand("alerts_on", "🔔 Enable portfolio drop alerts"),
-            BotCommand("alerts_off", "🔕 Disable portfolio alerts"),
-        ]
-        
-        await context.bot.set_my_commands(commands)
+        await context.bot.set_my_commands(_BOT_COMMANDS)
         await update.message.reply_text(
-            f"✅ Successfully refreshed {len(commands)} commands!\n\n"
+            f"✅ Successfully refreshed {len(_BOT_COMMANDS)} commands!\n\n"
             "The bot commands should now appear in your Telegram menu."
         )
         log.info("Commands refreshed manually")
@@ -103,7 +162,8 @@ async def on_startup(app: Application) -> None:
             eliza_client = ElizaClient(
                 base_url=settings.ELIZA_API_URL,
                 api_key=settings.ELIZA_API_KEY,
-                timeout_s=settings.ELIZA_TIMEOUT_S
+                timeout_s=settings.ELIZA_TIMEOUT_S,
+                stream=settings.ELIZA_STREAM,
             )
             app.bot_data["eliza_client"] = eliza_client
             log.info("ElizaOS client initialized")
@@ -111,47 +171,13 @@ async def on_startup(app: Application) -> None:
             log.error(f"Error initializing ElizaOS client: {e}")
             app.bot_data["eliza_client"] = None
         
-        # Define all bot commands
-        commands = [
-            BotCommand("start", "🚀 Start the bot"),
-            BotCommand("help", "❓ Show help and commands"),
-            BotCommand("ping", "🏓 Health check"),
-            BotCommand("chain", "🌐 Show Sei network status"),
-            BotCommand("balance", "💰 Check wallet balance"),
-            BotCommand("watch", "👀 Watch an address"),
-            BotCommand("unwatch", "❌ Stop watching address"),
-            BotCommand("watches", "📋 List watched addresses"),
-            BotCommand("test_monitor", "🧪 Test transaction monitoring"),
-            BotCommand("rescan_watches", "🔍 Extended scan for missed transactions"),
-
-            BotCommand("portfolio_add", "➕ Add address to portfolio"),
-            BotCommand("portfolio_rm", "➖ Remove address from portfolio"),
-            BotCommand("portfolio", "💼 Show portfolio summary"),
-            BotCommand("insights", "🔍 Portfolio insights & risk analysis"),
-            BotCommand("targets", "🎯 Set stable allocation target"),
-            BotCommand("rebal", "⚖️ Rebalancing advice"),
-            BotCommand("alerts_on", "🔔 Enable portfolio drop alerts"),
-            BotCommand("alerts_off", "🔕 Disable portfolio alerts"),
-        ]
-        
         # Set the commands
-        await app.bot.set_my_commands(commands)
-        log.info(f"Successfully registered {len(commands)} commands")
+        await app.bot.set_my_commands(_BOT_COMMANDS)
+        log.info(f"Successfully registered {len(_BOT_COMMANDS)} commands")
         
         # Also set the bot description and short description
-        await app.bot.set_my_description(
-            "🤖 Advanced DeFi Portfolio Management & AI-Powered Blockchain Monitoring for Sei Network\n\n"
-            "Features:\n"
-            "• 📊 Real-time portfolio tracking with USD valuations\n"
-            "• 🤖 AI-powered analytics and risk assessment\n"
-            "• 🔔 Intelligent portfolio drop alerts\n"
-            "• ⚖️ Smart rebalancing recommendations\n"
-            "• 🌐 Multi-network support (Testnet/Mainnet)\n"
-            "• 📈 Price oracle integration with Rivalz ADCS\n"
-            "• 🧠 ElizaOS AI advisory integration\n\n"
-            "Built for AI/Accelathon 2024 - Where AI agents go from smart to sovereign!"
-        )
-        await app.bot.set_my_short_description("🤖 AI-Powered DeFi Portfolio Management for Sei Network")
+        await app.bot.set_my_description(_BOT_DESCRIPTION)
+        await app.bot.set_my_short_description(_BOT_SHORT_DESCRIPTION)
         
         log.info("Bot startup completed successfully")
         
@@ -160,12 +186,12 @@ async def on_startup(app: Application) -> None:
         print(f"Error during startup: {str(e)}")
         # Don't raise the exception, let the bot continue running
 
-# Global app instance for background monitoring
-_app_instance = None
+# App instance for background monitoring; tasks spawned from main() inherit it
+_app_var: ContextVar[Application | None] = ContextVar("app", default=None)
 
 def get_application():
     """Get the application instance for background monitoring"""
-    return _app_instance
+    return _app_var.get()
 
 async def main() -> None:
     await init_db()  # Ensure DB and table are created before anything else
@@ -174,8 +200,10 @@ async def main() -> None:
     app = (
         Application.builder()
         .token(settings.TELEGRAM_BOT_TOKEN)
-        .rate_limiter(AIORateLimiter())
-        .post_init(on_startup)
+        # Every bot API call (handler replies, alerts, notifications) is paced here;
+        # stay a little under Telegram's ~30 msg/s and ride out up to 3 RetryAfters
+        # so notification bursts from rescans are delayed rather than dropped
+        .rate_limiter(AIORateLimiter(overall_max_rate=25, overall_time_period=1, max_retries=3))
         .build()
     )
 
@@ -186,6 +214,8 @@ async def main() -> None:
         explorer_base=settings.SEI_EXPLORER_BASE,
     )
     app.bot_data["sei_client"] = sei_client
+    price_oracle = PriceOracle()
+    app.bot_data["price_oracle"] = price_oracle
 
     # Handlers
     app.add_handler(CommandHandler("start", start))
@@ -210,8 +240,7 @@ async def main() -> None:
     app.add_handler(CommandHandler("refresh", refresh_commands))
 
     # Store app instance for background monitoring
-    global _app_instance
-    _app_instance = app
+    _app_var.set(app)
 
     log.info("Starting bot (polling mode)...")
     await app.initialize()
@@ -222,12 +251,13 @@ async def main() -> None:
         setup_alerts_job(app.job_queue)
         # Pass the application instance directly to the watch setup
         from src.handlers.watch import setup_watch_job_with_app
-        setup_watch_job_with_app(app)
+        await setup_watch_job_with_app(app)
         log.info("Job queues setup completed")
     except Exception as e:
         log.error(f"Error setting up job queues: {e}")
     
-    # Ensure commands are set after bot is fully started
+    # The only startup hook: builder post_init is run by run_polling(), not by
+    # this manual initialize/start lifecycle, so it is called exactly once here
     try:
         await on_startup(app)
     except Exception as e:
@@ -237,12 +267,34 @@ async def main() -> None:
         await app.updater.start_polling(allowed_updates=[])  # no webhook yet
         await asyncio.Event().wait()  # run forever
     finally:
-        await app.updater.stop()
-        await app.stop()
-        await app.shutdown()
+        try:
+            await app.updater.stop()
+            await stop_watch_job()
+            await app.stop()
+            eliza_client = app.bot_data.get("eliza_client")
+            if eliza_client:
+                await eliza_client.close()
+            await app.shutdown()
+        finally:
+            # Shared HTTP clients are only ever closed here, so close them even
+            # if the Telegram side of shutdown fails; each step runs whatever
+            # the one before it raised, and the DB and log flush always run last
+            try:
+                try:
+                    await price_oracle.close()
+                finally:
+                    try:
+                        await sei_client.aclose()
+                    finally:
+                        await portfolio_manager.close()
+            finally:
+                try:
+                    await close_db()
+                finally:
+                    log_listener.stop()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        _runner(main())
     except (KeyboardInterrupt, SystemExit):
         log.info("Bot stopped")
@@ -1,7 +1,7 @@
 from __future__ import annotations
-from typing import Literal
+from typing import Dict, Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field, computed_field
+from pydantic import Field, model_validator
 
 class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str = Field(..., description="BotFather token")
@@ -30,6 +30,21 @@ class Settings(BaseSettings):
     SEI_MAINNET_CHAIN_ID: str = Field("13290x531", description="Sei Mainnet Chain ID")
     SEI_MAINNET_EXPLORER: str = Field("https://seitrace.com/?chain=pacific-1", description="Sei Mainnet Explorer")
 
+    # Optional EVM WebSocket endpoint; when set, watch monitoring wakes on new blocks
+    # (eth_subscribe newHeads) instead of polling on a fixed interval
+    SEI_EVM_WS_URL: str = Field("", description="Sei EVM WebSocket URL for newHeads subscriptions")
+
+    # Watch scans fetch blocks as JSON-RPC batches; some providers bill each batch item
+    # like a separate call or cap batch sizes, so this is tunable and can be turned off
+    EVM_RPC_BATCH_SIZE: int = Field(50, ge=0, description="eth_getBlockByNumber calls per JSON-RPC batch (0 = one request per block)")
+    EVM_RPC_MAX_CONCURRENCY: int = Field(32, ge=1, description="Max in-flight EVM RPC requests from the transaction monitor")
+    SEI_TX_CACHE_TTL: float = Field(5.0, ge=0, description="Seconds an LCD tx-search result for a SEI watch is reused (0 = always re-query)")
+    WATCH_FETCH_CONCURRENCY: int = Field(16, ge=1, description="Max watch fetches (EVM block-range groups, SEI addresses) run at once per monitoring scan")
+    # Optional Etherscan-compatible explorer API (module=account&action=txlist); long
+    # watch scans ask it for an address's transactions instead of walking every block
+    EVM_INDEXER_URL: str = Field("", description="Etherscan-compatible API URL for address transaction lookups")
+    EVM_INDEXER_API_KEY: str = Field("", description="API key for EVM_INDEXER_URL, if it needs one")
+
     # API Keys (Optional)
     RIVALZ_API_KEY: str | None = Field("", description="Rivalz ADCS API key for price oracle access")
     SEITRACE_API_KEY: str | None = Field("", description="SeiTrace API key for enhanced explorer features")
@@ -39,49 +54,46 @@ class Settings(BaseSettings):
     ELIZA_API_URL: str = Field("https://elizaos.ai/api", description="ElizaOS API endpoint URL")
     ELIZA_API_KEY: str = Field("", description="ElizaOS API key for AI advisory services")
     ELIZA_TIMEOUT_S: int = Field(10, description="ElizaOS API timeout in seconds")
+    ELIZA_STREAM: bool = Field(False, description="Stream ElizaOS advice into the chat as it arrives (endpoint must send chunked text)")
 
     # Rivalz ADCS Configuration (AI Oracle infrastructure)
     # Reference: https://docs.rivalz.ai/ and https://blog.rivalz.ai/rivalz-ai-oracles-launch-on-base-unveiling-smart-contract-based-ai-agents/
     RIVALZ_ADCS_BASE_URL: str = Field("https://api.rivalz.ai/adcs/v1", description="Rivalz ADCS API base URL")
     RIVALZ_ADCS_TEST_MODE: bool = Field(True, description="Enable test mode for Rivalz ADCS (simulates API responses)")
 
-    # Computed fields for current network
-    @computed_field
-    @property
-    def SEI_EVM_RPC_URL(self) -> str:
-        """Current Sei EVM RPC URL based on network setting"""
-        return self.SEI_MAINNET_RPC_URL if self.NETWORK == "mainnet" else self.SEI_TESTNET_RPC_URL
-    
-    @computed_field
-    @property
-    def SEI_LCD_URL(self) -> str:
-        """Current Sei LCD REST API URL based on network setting"""
-        return self.SEI_MAINNET_LCD_URL if self.NETWORK == "mainnet" else self.SEI_TESTNET_LCD_URL
-    
-    @computed_field
-    @property
-    def SEI_CHAIN_ID(self) -> str:
-        """Current Sei Chain ID based on network setting"""
-        return self.SEI_MAINNET_CHAIN_ID if self.NETWORK == "mainnet" else self.SEI_TESTNET_CHAIN_ID
-    
-    @computed_field
-    @property
-    def SEI_EXPLORER_BASE(self) -> str:
-        """Current Sei Explorer URL based on network setting"""
-        return self.SEI_MAINNET_EXPLORER if self.NETWORK == "mainnet" else self.SEI_TESTNET_EXPLORER
+    # Price cache: per-symbol freshness (stables barely move, SEI moves a lot), and how
+    # long past that an expired price may still be served while it refreshes in the background
+    PRICE_CACHE_TTLS: Dict[str, float] = Field(
+        default_factory=lambda: {"USDC": 300.0, "BTC": 10.0, "ETH": 10.0, "SOL": 10.0, "SEI": 3.0},
+        description="Per-symbol price cache TTL in seconds (JSON object in env)",
+    )
+    PRICE_CACHE_DEFAULT_TTL: float = Field(5.0, description="Price cache TTL for symbols not in PRICE_CACHE_TTLS")
+    PRICE_STALE_GRACE_S: float = Field(60.0, description="Serve an expired price for this long while refreshing it")
+    # Optional shared price cache so bot processes and restarts reuse each other's lookups
+    CACHE_BACKEND: Literal["memory", "redis"] = Field("memory", description="Price cache backend behind the in-process cache")
+    REDIS_URL: str = Field("redis://localhost:6379/0", description="Redis URL for CACHE_BACKEND=redis")
+
+    # Resolved once for the current network in _resolve_network (not read from env)
+    SEI_EVM_RPC_URL: str = Field("", description="Current Sei EVM RPC URL based on network setting")
+    SEI_LCD_URL: str = Field("", description="Current Sei LCD REST API URL based on network setting")
+    SEI_CHAIN_ID: str = Field("", description="Current Sei Chain ID based on network setting")
+    SEI_EXPLORER_BASE: str = Field("", description="Current Sei Explorer URL based on network setting")
 
     # Backward compatibility aliases
-    @computed_field
-    @property
-    def SEI_RPC_URL(self) -> str:
-        """Alias for SEI_EVM_RPC_URL (backward compatibility)"""
-        return self.SEI_EVM_RPC_URL
-    
-    @computed_field
-    @property
-    def RIVALZ_ADCS_API_KEY(self) -> str | None:
-        """Alias for RIVALZ_API_KEY (backward compatibility)"""
-        return self.RIVALZ_API_KEY
+    SEI_RPC_URL: str = Field("", description="Alias for SEI_EVM_RPC_URL (backward compatibility)")
+    RIVALZ_ADCS_API_KEY: str | None = Field("", description="Alias for RIVALZ_API_KEY (backward compatibility)")
+
+    @model_validator(mode="after")
+    def _resolve_network(self) -> "Settings":
+        """Pick the URLs and chain ID for the configured network once at construction"""
+        mainnet = self.NETWORK == "mainnet"
+        self.SEI_EVM_RPC_URL = self.SEI_MAINNET_RPC_URL if mainnet else self.SEI_TESTNET_RPC_URL
+        self.SEI_LCD_URL = self.SEI_MAINNET_LCD_URL if mainnet else self.SEI_TESTNET_LCD_URL
+        self.SEI_CHAIN_ID = self.SEI_MAINNET_CHAIN_ID if mainnet else self.SEI_TESTNET_CHAIN_ID
+        self.SEI_EXPLORER_BASE = self.SEI_MAINNET_EXPLORER if mainnet else self.SEI_TESTNET_EXPLORER
+        self.SEI_RPC_URL = self.SEI_EVM_RPC_URL
+        self.RIVALZ_ADCS_API_KEY = self.RIVALZ_API_KEY
+        return self
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", case_sensitive=False, extra="ignore")
 
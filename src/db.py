@@ -1,58 +1,284 @@
 from __future__ import annotations
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 import aiosqlite
 from typing import List, Tuple
 
 DB_PATH = "sei_bot.db"
 
+# Applied once when the shared connection is opened
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-64000;
+"""
+
+# Per-connection tuning for the read-only pool (journal mode is set by the writer)
+_READER_PRAGMAS = """
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-16000;
+"""
+
+# SQL text lives in constants so every call hands sqlite3 the identical string
+# and hits its prepared-statement cache instead of re-parsing
+_SQL_ADD_WATCH = "INSERT OR IGNORE INTO watches (user_id, address) VALUES (?, ?)"
+_SQL_REMOVE_WATCH = "DELETE FROM watches WHERE user_id = ? AND address = ?"
+_SQL_REMOVE_USER_WATCHES = "DELETE FROM watches WHERE user_id = ?"
+_SQL_LIST_WATCHES = "SELECT address FROM watches WHERE user_id = ? ORDER BY created_at DESC"
+_SQL_ALL_WATCHES = "SELECT user_id, address, last_tx_hash FROM watches"
+_SQL_SET_LAST_TX = "UPDATE watches SET last_tx_hash = ? WHERE user_id = ? AND address = ?"
+# Upserts touch only their own columns, so alerts and targets don't clobber each other
+_SQL_ENABLE_ALERTS = """
+INSERT INTO user_prefs (user_id, alerts_enabled, alert_drop_pct) VALUES (?, 1, ?)
+ON CONFLICT(user_id) DO UPDATE SET alerts_enabled = 1, alert_drop_pct = excluded.alert_drop_pct
+"""
+_SQL_DISABLE_ALERTS = "UPDATE user_prefs SET alerts_enabled = 0 WHERE user_id = ?"
+_SQL_ALERT_USERS = "SELECT user_id, alert_drop_pct FROM user_prefs WHERE alerts_enabled = 1"
+_SQL_ADD_PORTFOLIO = """
+INSERT INTO portfolio_addresses (user_id, address, label, kind) VALUES (?, ?, ?, ?)
+ON CONFLICT(user_id, address) DO UPDATE SET label = excluded.label, kind = excluded.kind
+"""
+_SQL_REMOVE_PORTFOLIO = "DELETE FROM portfolio_addresses WHERE user_id = ? AND address = ?"
+_SQL_LIST_PORTFOLIO = "SELECT address, label FROM portfolio_addresses WHERE user_id = ?"
+_SQL_SET_TARGET = """
+INSERT INTO user_prefs (user_id, target_stable_pct) VALUES (?, ?)
+ON CONFLICT(user_id) DO UPDATE SET target_stable_pct = excluded.target_stable_pct
+"""
+_SQL_REBAL_INPUTS = """
+SELECT pa.address, pa.label, up.target_stable_pct
+FROM portfolio_addresses pa
+LEFT JOIN user_prefs up ON up.user_id = pa.user_id
+WHERE pa.user_id = ?
+"""
+# User ids are bound as one JSON array so the SQL text stays constant
+_SQL_PORTFOLIO_ADDRESSES = """
+SELECT user_id, address, kind
+FROM portfolio_addresses
+WHERE user_id IN (SELECT value FROM json_each(?))
+ORDER BY user_id
+"""
+
+# Single long-lived connection shared by every helper (autocommit mode)
+_conn: aiosqlite.Connection | None = None
+_conn_lock = asyncio.Lock()
+# Serializes writers on the shared connection
+_write_lock = asyncio.Lock()
+
+# Portfolio adds are coalesced: callers queue a row and wait while a single
+# flush, started by the first add, writes the batch after a short delay
+_PORTFOLIO_FLUSH_DELAY = 0.2
+_pending_portfolio_adds: List[Tuple[Tuple[int, str, str, str], asyncio.Future[None]]] = []
+_portfolio_flush_task: asyncio.Task[None] | None = None
+
+# Small pool of read-only connections so user-facing reads don't queue
+# behind writes on the shared connection (WAL lets them run concurrently)
+_READ_POOL_SIZE = 4
+_read_pool: asyncio.Queue[aiosqlite.Connection] | None = None
+_read_conns: List[aiosqlite.Connection] = []
+
+async def _get_conn() -> aiosqlite.Connection:
+    global _conn
+    if _conn is None:
+        async with _conn_lock:
+            if _conn is None:
+                conn = await aiosqlite.connect(
+                    DB_PATH, isolation_level=None, detect_types=0, cached_statements=256
+                )
+                await conn.executescript(_PRAGMAS)
+                _conn = conn
+    return _conn
+
+async def _get_read_pool() -> asyncio.Queue[aiosqlite.Connection]:
+    global _read_pool
+    if _read_pool is None:
+        # The writer must have created the file (and switched it to WAL) first
+        await _get_conn()
+        async with _conn_lock:
+            if _read_pool is None:
+                pool: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+                for _ in range(_READ_POOL_SIZE):
+                    conn = await aiosqlite.connect(
+                        f"file:{DB_PATH}?mode=ro", uri=True, detect_types=0, cached_statements=256
+                    )
+                    await conn.executescript(_READER_PRAGMAS)
+                    _read_conns.append(conn)
+                    pool.put_nowait(conn)
+                _read_pool = pool
+    return _read_pool
+
+@asynccontextmanager
+async def _reader() -> AsyncIterator[aiosqlite.Connection]:
+    pool = await _get_read_pool()
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+
+async def close_db() -> None:
+    global _conn, _read_pool
+    # Let a pending portfolio batch land before the connection goes away
+    if _portfolio_flush_task is not None:
+        await _portfolio_flush_task
+    for conn in _read_conns:
+        await conn.close()
+    _read_conns.clear()
+    _read_pool = None
+    if _conn is not None:
+        await _conn.close()
+        _conn = None
+
 async def init_db() -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS watches (
-                user_id INTEGER NOT NULL,
-                address TEXT NOT NULL,
-                last_tx_hash TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, address)
-            )
-            """
+    db = await _get_conn()
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS watches (
+            user_id INTEGER NOT NULL,
+            address TEXT NOT NULL,
+            last_tx_hash TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, address)
         )
-        await db.commit()
+        """
+    )
 
 async def add_watch(user_id: int, address: str) -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO watches (user_id, address) VALUES (?, ?)",
-            (user_id, address),
-        )
-        await db.commit()
+    db = await _get_conn()
+    async with _write_lock:
+        await db.execute(_SQL_ADD_WATCH, (user_id, address))
 
 async def remove_watch(user_id: int, address: str) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "DELETE FROM watches WHERE user_id = ? AND address = ?",
-            (user_id, address),
-        )
-        await db.commit()
-        return cur.rowcount
+    db = await _get_conn()
+    async with _write_lock:
+        cur = await db.execute(_SQL_REMOVE_WATCH, (user_id, address))
+    return cur.rowcount
+
+async def remove_watches_for_user(user_id: int) -> int:
+    db = await _get_conn()
+    async with _write_lock:
+        cur = await db.execute(_SQL_REMOVE_USER_WATCHES, (user_id,))
+    return cur.rowcount
 
 async def list_watches(user_id: int) -> List[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT address FROM watches WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,),
-        )
-        return [row[0] for row in await cur.fetchall()]
+    db = await _get_conn()
+    cur = await db.execute(_SQL_LIST_WATCHES, (user_id,))
+    return [row[0] for row in await cur.fetchall()]
 
 async def get_all_watches() -> List[Tuple[int, str, str | None]]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT user_id, address, last_tx_hash FROM watches")
-        return await cur.fetchall()
+    db = await _get_conn()
+    cur = await db.execute(_SQL_ALL_WATCHES)
+    return await cur.fetchall()
 
 async def set_last_tx_hash(user_id: int, address: str, tx_hash: str) -> None:
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE watches SET last_tx_hash = ? WHERE user_id = ? AND address = ?",
-            (tx_hash, user_id, address),
-        )
-        await db.commit()
+    db = await _get_conn()
+    async with _write_lock:
+        await db.execute(_SQL_SET_LAST_TX, (tx_hash, user_id, address))
+
+async def enable_alerts(user_id: int, drop_pct: float) -> None:
+    db = await _get_conn()
+    async with _write_lock:
+        await db.execute(_SQL_ENABLE_ALERTS, (user_id, drop_pct))
+
+async def disable_alerts(user_id: int) -> None:
+    db = await _get_conn()
+    async with _write_lock:
+        await db.execute(_SQL_DISABLE_ALERTS, (user_id,))
+
+async def get_alert_users() -> List[Tuple[int, float]]:
+    db = await _get_conn()
+    cur = await db.execute(_SQL_ALERT_USERS)
+    return await cur.fetchall()
+
+def address_kind(address: str) -> str:
+    """Classify an address as 'evm' (0x...) or 'sei' (native) for storage"""
+    return "evm" if address.startswith("0x") else "sei"
+
+async def get_portfolio_addresses(user_ids: List[int]) -> List[Tuple[int, str, str]]:
+    """(user_id, address, kind) for the given users' portfolios, ordered by user"""
+    db = await _get_conn()
+    cur = await db.execute(_SQL_PORTFOLIO_ADDRESSES, (json.dumps(user_ids),))
+    return await cur.fetchall()
+
+async def set_last_tx_hashes(rows: List[Tuple[str, int, str]]) -> None:
+    """Batch form of set_last_tx_hash; rows are (tx_hash, user_id, address)"""
+    if not rows:
+        return
+    db = await _get_conn()
+    async with _write_lock:
+        # One transaction for the whole batch instead of a commit per row
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            await db.executemany(_SQL_SET_LAST_TX, rows)
+            await db.execute("COMMIT")
+        except BaseException:
+            await db.execute("ROLLBACK")
+            raise
+
+async def _flush_portfolio_adds() -> None:
+    """Write every queued portfolio add in one transaction, then wake the callers"""
+    global _portfolio_flush_task
+    await asyncio.sleep(_PORTFOLIO_FLUSH_DELAY)
+    batch = _pending_portfolio_adds[:]
+    _pending_portfolio_adds.clear()
+    _portfolio_flush_task = None
+    
+    error: BaseException | None = None
+    try:
+        db = await _get_conn()
+        async with _write_lock:
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                await db.executemany(_SQL_ADD_PORTFOLIO, [row for row, _ in batch])
+                await db.execute("COMMIT")
+            except BaseException:
+                await db.execute("ROLLBACK")
+                raise
+    except Exception as e:
+        error = e
+    
+    for _, fut in batch:
+        if fut.done():
+            continue
+        if error is None:
+            fut.set_result(None)
+        else:
+            fut.set_exception(error)
+
+async def add_portfolio_address(user_id: int, address: str, label: str) -> None:
+    """Queue a portfolio upsert; returns once the batch containing it is committed"""
+    global _portfolio_flush_task
+    fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+    _pending_portfolio_adds.append(((user_id, address, label, address_kind(address)), fut))
+    if _portfolio_flush_task is None:
+        _portfolio_flush_task = asyncio.create_task(_flush_portfolio_adds())
+    await fut
+
+async def remove_portfolio_address(user_id: int, address: str) -> int:
+    db = await _get_conn()
+    async with _write_lock:
+        cur = await db.execute(_SQL_REMOVE_PORTFOLIO, (user_id, address))
+    return cur.rowcount
+
+async def list_portfolio_addresses(user_id: int) -> List[Tuple[str, str]]:
+    """(address, label) rows for a user's portfolio"""
+    async with _reader() as db:
+        cur = await db.execute(_SQL_LIST_PORTFOLIO, (user_id,))
+        return await cur.fetchall()
+
+async def set_target_stable_pct(user_id: int, stable_pct: float) -> None:
+    db = await _get_conn()
+    async with _write_lock:
+        await db.execute(_SQL_SET_TARGET, (user_id, stable_pct))
+
+async def get_rebal_inputs(user_id: int) -> Tuple[float | None, List[Tuple[str, str]]]:
+    """(target_stable_pct, [(address, label), ...]) for a user in one query"""
+    async with _reader() as db:
+        cur = await db.execute(_SQL_REBAL_INPUTS, (user_id,))
+        rows = await cur.fetchall()
+    target = rows[0][2] if rows else None
+    return target, [(address, label) for address, label, _ in rows]
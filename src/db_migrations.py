@@ -18,11 +18,42 @@ async def run_migrations() -> None:
                     user_id INTEGER NOT NULL,
                     address TEXT NOT NULL,
                     label TEXT,
+                    kind TEXT,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     PRIMARY KEY (user_id, address)
                 )
             """)
             
+            # Add address kind ('evm' / 'sei') to older databases and backfill it
+            cursor = await db.execute("PRAGMA table_info(portfolio_addresses)")
+            columns = {row[1] for row in await cursor.fetchall()}
+            if "kind" not in columns:
+                await db.execute("ALTER TABLE portfolio_addresses ADD COLUMN kind TEXT")
+            # Addresses are trimmed on insert; normalize any legacy rows once so
+            # readers never need to strip. An untrimmed row whose trimmed form is
+            # already stored (or duplicated by an older untrimmed row) is dropped
+            # first, so the trim itself can't collide on the primary key
+            await db.execute("""
+                DELETE FROM portfolio_addresses
+                WHERE address != trim(address)
+                  AND EXISTS (
+                      SELECT 1 FROM portfolio_addresses AS other
+                      WHERE other.user_id = portfolio_addresses.user_id
+                        AND trim(other.address) = trim(portfolio_addresses.address)
+                        AND (other.address = trim(other.address) OR other.rowid < portfolio_addresses.rowid)
+                  )
+            """)
+            await db.execute("""
+                UPDATE portfolio_addresses
+                SET address = trim(address), kind = NULL
+                WHERE address != trim(address)
+            """)
+            await db.execute("""
+                UPDATE portfolio_addresses
+                SET kind = CASE WHEN substr(address, 1, 2) = '0x' THEN 'evm' ELSE 'sei' END
+                WHERE kind IS NULL
+            """)
+            
             # Create user_prefs table
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS user_prefs (
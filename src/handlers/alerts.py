@@ -1,11 +1,13 @@
 from __future__ import annotations
-import aiosqlite
+import asyncio
+import itertools
 import logging
 import time
-from typing import Dict, Optional
+from operator import itemgetter
+from typing import Dict, List, Optional
 from telegram import Update
 from telegram.ext import ContextTypes, JobQueue
-from src.db import DB_PATH
+from src.db import enable_alerts, disable_alerts, get_alert_users, get_portfolio_addresses
 from src.services.sei_client import SeiClient
 from src.services.price_oracles import PriceOracle
 from src.services.eliza_prompts import alert_prompt
@@ -13,13 +15,54 @@ from src.config import settings
 
 log = logging.getLogger(__name__)
 
-# In-memory storage for user portfolio anchors
-# Structure: {user_id: {"anchor_usd": float, "last_check": float}}
-user_anchors: Dict[int, Dict[str, float]] = {}
+# Unit conversions (1 SEI = 10^18 wei on EVM, 10^6 usei natively)
+_WEI_TO_SEI = 1.0 / 10**18
+_USEI_TO_SEI = 1.0 / 10**6
 
-# Track sent alerts to prevent spam
-# Structure: {user_id: {"last_alert": float}}
-sent_alerts: Dict[int, Dict[str, float]] = {}
+# Alert-enabled users and their drop threshold, loaded once at startup and
+# kept in sync by alerts_on/alerts_off so the job never re-reads user_prefs
+_alert_subscribers: Dict[int, float] = {}
+
+# In-memory per-user alert state, one flat map per field keyed by user_id
+# Portfolio anchor value and when it was last reset
+_anchor_usd: Dict[int, float] = {}
+_last_check: Dict[int, float] = {}
+# SEI price seen at the user's last revaluation
+_last_seen_price: Dict[int, float] = {}
+# When the last alert was sent (prevents spam)
+_last_alert: Dict[int, float] = {}
+
+# Address balances fetched by alert ticks, reused for _BALANCE_TTL seconds
+# Structure: {address: (fetched_at_monotonic, balance)}
+_BALANCE_TTL = 20.0
+_evm_balance_cache: Dict[str, tuple[float, int]] = {}
+_sei_balance_cache: Dict[str, tuple[float, int]] = {}
+
+# A user's portfolio is revalued when their bucket has a token, or sooner
+# if the SEI price moved more than this fraction since their last check
+_PRICE_MOVE_THRESHOLD = 0.005
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def try_consume(self, n: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+# Per-user revaluation budget: one check every 2 minutes, bursts of 2
+# Structure: {user_id: TokenBucket}
+_buckets: Dict[int, TokenBucket] = {}
 
 async def alerts_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enable portfolio drop alerts"""
@@ -33,18 +76,12 @@ async def alerts_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             await update.message.reply_text("❌ Drop percentage must be between 0-100")
             return
         
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO user_prefs (user_id, alerts_enabled, alert_drop_pct)
-                VALUES (?, 1, ?)
-            """, (update.effective_user.id, drop_pct))
-            await db.commit()
+        await enable_alerts(update.effective_user.id, drop_pct)
+        _alert_subscribers[update.effective_user.id] = drop_pct
         
         # Initialize anchor for this user
-        user_anchors[update.effective_user.id] = {
-            "anchor_usd": 0.0,
-            "last_check": time.time()
-        }
+        _anchor_usd[update.effective_user.id] = 0.0
+        _last_check[update.effective_user.id] = time.monotonic()
         
         await update.message.reply_text(f"✅ Alerts enabled! Will warn if portfolio drops {drop_pct}%")
         
@@ -60,20 +97,11 @@ async def alerts_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def alerts_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disable portfolio drop alerts"""
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("""
-                UPDATE user_prefs 
-                SET alerts_enabled = 0 
-                WHERE user_id = ?
-            """, (update.effective_user.id,))
-            await db.commit()
+        await disable_alerts(update.effective_user.id)
+        _alert_subscribers.pop(update.effective_user.id, None)
         
         # Clean up in-memory data
-        user_id = update.effective_user.id
-        if user_id in user_anchors:
-            del user_anchors[user_id]
-        if user_id in sent_alerts:
-            del sent_alerts[user_id]
+        cleanup_user_data(update.effective_user.id)
         
         await update.message.reply_text("✅ Alerts disabled")
         
@@ -84,91 +112,124 @@ async def alerts_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         log.error(f"Error disabling alerts: {e}")
         await update.message.reply_text("❌ Failed to disable alerts")
 
-async def get_user_portfolio_value(user_id: int) -> float:
-    """Get total USD value of user's portfolio"""
+async def _no_balances() -> Dict[str, int]:
+    return {}
+
+def get_user_portfolio_value(evm_addrs: List[str], sei_addrs: List[str],
+                             evm_balances: Dict[str, int], sei_balances: Dict[str, int],
+                             sei_price: float) -> float:
+    """Get total USD value of a user's portfolio from prefetched balances"""
+    balance_wei = sum(evm_balances[a] for a in evm_addrs)
+    balance_usei = sum(sei_balances[a] for a in sei_addrs)
+    balance_sei = balance_wei * _WEI_TO_SEI + balance_usei * _USEI_TO_SEI
+    return balance_sei * sei_price
+
+async def check_alerts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job to check portfolio alerts for all users"""
     try:
-        # Get user's portfolio addresses
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                SELECT address FROM portfolio_addresses 
-                WHERE user_id = ?
-            """, (user_id,))
-            addresses = await cursor.fetchall()
+        if not _alert_subscribers:
+            return
         
-        if not addresses:
-            return 0.0
+        # Only deltas are compared, so use the clock that never jumps on NTP corrections
+        current_time = time.monotonic()
         
-        # Initialize services
-        sei = SeiClient(settings.SEI_EVM_RPC_URL, settings.SEI_CHAIN_ID, settings.SEI_EXPLORER_BASE)
-        oracle = PriceOracle()
+        # Fetch the SEI price once per tick; the oracle handles caching and refreshes
+        sei: SeiClient = context.bot_data["sei_client"]
+        oracle: PriceOracle = context.bot_data["price_oracle"]
+        sei_price = await oracle.get_price("SEI")
         
-        total_usd = 0.0
+        # Only revalue users whose bucket allows it or whose price moved
+        due_ids = []
+        for user_id in _alert_subscribers:
+            last_price = _last_seen_price.get(user_id)
+            price_moved = bool(last_price) and abs(sei_price - last_price) / last_price > _PRICE_MOVE_THRESHOLD
+            bucket = _buckets.get(user_id)
+            if bucket is None:
+                bucket = _buckets[user_id] = TokenBucket(rate=1 / 120, capacity=2)
+            if price_moved or bucket.try_consume(1):
+                due_ids.append(user_id)
         
-        for (address,) in addresses:
-            address = address.strip()
-            
-            # Get balance based on address type
-            if address.startswith('0x'):
-                # EVM address
-                balance_wei = await sei.get_evm_native_balance(address, settings.SEI_EVM_RPC_URL)
-                balance_sei = balance_wei / (10**18)
-                if balance_sei > 0:
-                    sei_price = await oracle.get_price("SEI")
-                    total_usd += balance_sei * sei_price
-            else:
-                # SEI address
-                balance_usei = await sei.get_native_sei_balance(address, settings.SEI_LCD_URL)
-                balance_sei = balance_usei / (10**6)
-                if balance_sei > 0:
-                    sei_price = await oracle.get_price("SEI")
-                    total_usd += balance_sei * sei_price
+        if not due_ids:
+            return
         
-        return total_usd
+        # Addresses for the due users only, in one query
+        addresses: Dict[int, tuple[List[str], List[str]]] = {}
+        for user_id, rows in itertools.groupby(await get_portfolio_addresses(due_ids), key=itemgetter(0)):
+            evm_addrs: List[str] = []
+            sei_addrs: List[str] = []
+            for _, address, kind in rows:
+                (evm_addrs if kind == "evm" else sei_addrs).append(address)
+            addresses[user_id] = (evm_addrs, sei_addrs)
         
-    except Exception as e:
-        log.error(f"Error getting portfolio value for user {user_id}: {e}")
-        return 0.0
-
-async def check_alerts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Job to check portfolio alerts for all users"""
-    try:
-        # Get all users with alerts enabled
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                SELECT user_id, alert_drop_pct FROM user_prefs 
-                WHERE alerts_enabled = 1
-            """)
-            users = await cursor.fetchall()
+        due = []
+        for user_id in due_ids:
+            # alerts_off may have run while we were awaiting
+            alert_drop_pct = _alert_subscribers.get(user_id)
+            if alert_drop_pct is None or user_id not in addresses:
+                continue
+            evm_addrs, sei_addrs = addresses[user_id]
+            due.append((user_id, alert_drop_pct, evm_addrs, sei_addrs))
         
-        if not users:
+        if not due:
             return
         
-        current_time = time.time()
+        # Fetch each distinct address once, even if several users hold it. Cache
+        # misses go out in bulk: one JSON-RPC batch for EVM, a bounded fan-out for LCD
+        evm_balances: Dict[str, int] = {}
+        sei_balances: Dict[str, int] = {}
+        evm_misses: List[str] = []
+        sei_misses: List[str] = []
+        for cache, balances, misses, addrs in (
+            (_evm_balance_cache, evm_balances, evm_misses, {a for _, _, evm_addrs, _ in due for a in evm_addrs}),
+            (_sei_balance_cache, sei_balances, sei_misses, {a for _, _, _, sei_addrs in due for a in sei_addrs}),
+        ):
+            for address in addrs:
+                entry = cache.get(address)
+                if entry and current_time - entry[0] < _BALANCE_TTL:
+                    balances[address] = entry[1]
+                else:
+                    misses.append(address)
+        
+        fetched_evm, fetched_sei = await asyncio.gather(
+            sei.get_evm_native_balances_batch(evm_misses, settings.SEI_EVM_RPC_URL) if evm_misses else _no_balances(),
+            sei.get_native_sei_balances(sei_misses, settings.SEI_LCD_URL) if sei_misses else _no_balances(),
+        )
+        fetched_at = time.monotonic()
+        for cache, balances, fetched in ((_evm_balance_cache, evm_balances, fetched_evm), (_sei_balance_cache, sei_balances, fetched_sei)):
+            if fetched:
+                # Drop expired entries so addresses nobody holds any more don't pile up
+                for address in [a for a, (ts, _) in cache.items() if fetched_at - ts >= _BALANCE_TTL]:
+                    del cache[address]
+            for address, value in fetched.items():
+                cache[address] = (fetched_at, value)
+                balances[address] = value
         
-        for user_id, alert_drop_pct in users:
+        for user_id, alert_drop_pct, evm_addrs, sei_addrs in due:
             try:
-                # Get current portfolio value
-                current_usd = await get_user_portfolio_value(user_id)
-                
+                # A failed lookup isn't a zero balance; skip the user this tick
+                # rather than read it as a drop
+                if any(a not in evm_balances for a in evm_addrs) or any(a not in sei_balances for a in sei_addrs):
+                    log.warning(f"Balance lookup failed for user {user_id}, skipping alert check")
+                    continue
+                current_usd = get_user_portfolio_value(
+                    evm_addrs, sei_addrs, evm_balances, sei_balances, sei_price
+                )
                 if current_usd <= 0:
                     continue
                 
                 # Initialize or update anchor
-                if user_id not in user_anchors:
-                    user_anchors[user_id] = {
-                        "anchor_usd": current_usd,
-                        "last_check": current_time
-                    }
+                _last_seen_price[user_id] = sei_price
+                anchor_usd = _anchor_usd.get(user_id)
+                if anchor_usd is None:
+                    _anchor_usd[user_id] = current_usd
+                    _last_check[user_id] = current_time
                     continue
                 
-                anchor_data = user_anchors[user_id]
-                anchor_usd = anchor_data["anchor_usd"]
-                last_check = anchor_data["last_check"]
-                
                 # Update anchor every 5 minutes (300 seconds)
+                last_check = _last_check.get(user_id, 0.0)
                 if current_time - last_check >= 300:
-                    anchor_data["anchor_usd"] = current_usd
-                    anchor_data["last_check"] = current_time
+                    _anchor_usd[user_id] = current_usd
+                    _last_check[user_id] = current_time
                     anchor_usd = current_usd
                 
                 # Check for drop
@@ -177,10 +238,9 @@ async def check_alerts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
                     
                     if drop_pct >= alert_drop_pct:
                         # Check if we already sent an alert recently (5-minute window)
-                        if user_id in sent_alerts:
-                            last_alert = sent_alerts[user_id]["last_alert"]
-                            if current_time - last_alert < 300:  # 5 minutes
-                                continue
+                        last_alert = _last_alert.get(user_id)
+                        if last_alert is not None and current_time - last_alert < 300:  # 5 minutes
+                            continue
                         
                         # Build alert context for ElizaOS
                         alert_context = {
@@ -217,7 +277,7 @@ async def check_alerts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
                         )
                         
                         # Record sent alert
-                        sent_alerts[user_id] = {"last_alert": current_time}
+                        _last_alert[user_id] = current_time
                         
                         log.info(f"Sent alert to user {user_id}: {drop_pct:.1f}% drop")
                 
@@ -228,9 +288,21 @@ async def check_alerts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     except Exception as e:
         log.error(f"Error in check_alerts_job: {e}")
 
+async def _load_alert_subscribers(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Populate the subscriber snapshot from user_prefs"""
+    try:
+        rows = await get_alert_users()
+        _alert_subscribers.update(rows)
+        log.info(f"Loaded {len(rows)} alert subscribers")
+    except Exception as e:
+        log.error(f"Error loading alert subscribers: {e}")
+
 def setup_alerts_job(job_queue: JobQueue) -> None:
     """Setup the alerts checking job"""
     try:
+        # One-shot load of the subscriber snapshot ahead of the first tick
+        job_queue.run_once(_load_alert_subscribers, when=0, name="load_alert_subscribers")
+        
         # Remove existing job if it exists
         job_queue.get_jobs_by_name("check_alerts_job")
         for job in job_queue.get_jobs_by_name("check_alerts_job"):
@@ -251,7 +323,8 @@ def setup_alerts_job(job_queue: JobQueue) -> None:
 
 def cleanup_user_data(user_id: int) -> None:
     """Clean up in-memory data for a user"""
-    if user_id in user_anchors:
-        del user_anchors[user_id]
-    if user_id in sent_alerts:
-        del sent_alerts[user_id]
+    _anchor_usd.pop(user_id, None)
+    _last_check.pop(user_id, None)
+    _last_seen_price.pop(user_id, None)
+    _last_alert.pop(user_id, None)
+    _buckets.pop(user_id, None)
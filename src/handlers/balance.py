@@ -1,19 +1,116 @@
 from __future__ import annotations
+import asyncio
+import time
+from typing import Dict, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
 import logging
 
 log = logging.getLogger(__name__)
 
+# Caps concurrent /balance lookups so bursts don't hammer the RPC into 429s
+_RPC_SEM = asyncio.Semaphore(20)
+
+# Recent lookups so repeated /balance for the same address skip the RPC
+# Structure: {address: (expires_at_monotonic, balance_items)}
+_BALANCE_TTL = 10.0
+_BALANCE_CACHE_SWEEP_AT = 1024  # purge expired entries once this many are held
+_balance_cache: Dict[str, Tuple[float, list]] = {}
+
+# Fixed reply texts, built once at import
+_USAGE_TEXT = (
+    "Usage: /balance <address>\n\n"
+    "Supports:\n"
+    "• EVM addresses (0x...)\n"
+    "• SEI addresses (sei1...)\n\n"
+    "Example: /balance 0x1234567890abcdef..."
+)
+_INVALID_ADDR_TEMPLATE = (
+    "❌ {error}\n\n"
+    "Please provide a valid:\n"
+    "• EVM address (0x followed by 40 hex characters)\n"
+    "• SEI address (sei1 followed by 38 alphanumeric characters)"
+)
+_LOADING_TEXT = "🔍 Fetching balance..."
+_NETWORK_DOWN_TEXT = (
+    "❌ Unable to connect to Sei network.\n\n"
+    "Please check:\n"
+    "• Your internet connection\n"
+    "• Network status\n"
+    "• Try again later"
+)
+_NO_BALANCE_TEMPLATE = (
+    "❌ No balance found for address: `{address}`\n\n"
+    "This could mean:\n"
+    "• The address has no tokens\n"
+    "• The address format is incorrect\n"
+    "• Network connection issue"
+)
+_HEADER_TEMPLATE = (
+    "💳 **Balance for:** `{}`\n"
+    "🌐 **Network:** Sei Testnet (Atlantic-2)\n\n"
+)
+_EXPLORER_TEMPLATE = "\n\n🔗 [View on Explorer](https://seitrace.com/address/{}?chain=atlantic-2)"
+_ERROR_TEMPLATE = (
+    "❌ Error fetching balance for `{address}`\n\n"
+    "Please try again later or check the address format."
+)
+
+async def _lookup_balance(sei, address: str) -> list:
+    """Balance items for an address, served from a short-lived cache when fresh"""
+    now = time.monotonic()
+    cached = _balance_cache.get(address)
+    if cached is not None:
+        expires_at, data = cached
+        if now < expires_at:
+            return data
+        del _balance_cache[address]
+    
+    async with _RPC_SEM:
+        # Try EVM balance first
+        data = await sei.get_balance(address)
+        
+        if not data:
+            # Try native SEI balance as fallback
+            data = await sei.get_native_balance(address)
+    
+    # Empty results may be transient RPC failures, so only cache hits
+    if data:
+        now = time.monotonic()
+        if len(_balance_cache) >= _BALANCE_CACHE_SWEEP_AT:
+            for key in [k for k, (exp, _) in _balance_cache.items() if exp <= now]:
+                del _balance_cache[key]
+        _balance_cache[address] = (now + _BALANCE_TTL, data)
+    return data
+
+def _fmt_usei(amount: float, denom: str) -> str:
+    # Convert usei to SEI (1 SEI = 1,000,000 usei)
+    sei_amount = amount / 1_000_000
+    spec = ".4f" if sei_amount >= 1 else ".8f"
+    return f"{sei_amount:{spec}} SEI ({amount:,.0f} usei)"
+
+def _fmt_generic(amount: float, denom: str) -> str:
+    if amount >= 1000000:
+        return f"{amount:,.2f} {denom}"
+    spec = ".4f" if amount >= 1 else ".8f"
+    return f"{amount:{spec}} {denom}"
+
+# Per-denom formatter, anything else falls back to the generic one
+_DENOM_FMT = {"usei": _fmt_usei}
+
+def _format_item(item: dict) -> str:
+    """One balance line for an {amount, denom} item from the client"""
+    amount = item.get('amount', '0')
+    denom = item.get('denom', 'unknown')
+    try:
+        formatted = _DENOM_FMT.get(denom, _fmt_generic)(float(amount), denom)
+    except ValueError:
+        formatted = f"{amount} {denom}"
+    return f"💰 **{formatted}**"
+
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
-        await update.message.reply_text(
-            "Usage: /balance <address>\n\n"
-            "Supports:\n"
-            "• EVM addresses (0x...)\n"
-            "• SEI addresses (sei1...)\n\n"
-            "Example: /balance 0x1234567890abcdef..."
-        )
+        await update.message.reply_text(_USAGE_TEXT)
         return
     
     sei = context.bot_data["sei_client"]
@@ -22,84 +119,36 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Validate address format using the new validation method
     is_valid, error_msg = sei.validate_address(address)
     if not is_valid:
-        await update.message.reply_text(
-            f"❌ {error_msg}\n\n"
-            "Please provide a valid:\n"
-            "• EVM address (0x followed by 40 hex characters)\n"
-            "• SEI address (sei1 followed by 38 alphanumeric characters)"
-        )
+        await update.message.reply_text(_INVALID_ADDR_TEMPLATE.format(error=error_msg))
         return
     
     # Show loading message
-    loading_msg = await update.message.reply_text("🔍 Fetching balance...")
+    loading_msg = await update.message.reply_text(_LOADING_TEXT)
     
     try:
-        # Test connection first
-        if not await sei.test_connection():
-            await loading_msg.edit_text(
-                "❌ Unable to connect to Sei network.\n\n"
-                "Please check:\n"
-                "• Your internet connection\n"
-                "• Network status\n"
-                "• Try again later"
-            )
-            return
-        
-        # Try EVM balance first
-        data = await sei.get_balance(address)
-        
-        if not data:
-            # Try native SEI balance as fallback
-            data = await sei.get_native_balance(address)
+        data = await _lookup_balance(sei, address)
         
         if not data:
+            # The balance calls swallow errors, so only an empty result costs a
+            # connection probe to pick between the network-down and no-balance messages
+            if not await sei.test_connection():
+                await loading_msg.edit_text(_NETWORK_DOWN_TEXT)
+                return
+            
             await loading_msg.edit_text(
-                f"❌ No balance found for address: `{address}`\n\n"
-                "This could mean:\n"
-                "• The address has no tokens\n"
-                "• The address format is incorrect\n"
-                "• Network connection issue",
+                _NO_BALANCE_TEMPLATE.format(address=address),
                 parse_mode='Markdown'
             )
             return
         
         # Format balance response
-        balance_lines = []
-        for balance_item in data:
-            amount = balance_item.get('amount', '0')
-            denom = balance_item.get('denom', 'unknown')
-            
-            # Format large numbers
-            try:
-                amount_float = float(amount)
-                
-                # Convert usei to SEI (1 SEI = 1,000,000 usei)
-                if denom == 'usei':
-                    sei_amount = amount_float / 1_000_000
-                    if sei_amount >= 1:
-                        formatted_amount = f"{sei_amount:.4f} SEI ({amount_float:,.0f} usei)"
-                    else:
-                        formatted_amount = f"{sei_amount:.8f} SEI ({amount_float:,.0f} usei)"
-                else:
-                    # For other tokens, format normally
-                    if amount_float >= 1000000:
-                        formatted_amount = f"{amount_float:,.2f}"
-                    elif amount_float >= 1:
-                        formatted_amount = f"{amount_float:.4f}"
-                    else:
-                        formatted_amount = f"{amount_float:.8f}"
-                    formatted_amount = f"{formatted_amount} {denom}"
-            except ValueError:
-                formatted_amount = f"{amount} {denom}"
-            
-            balance_lines.append(f"💰 **{formatted_amount}**")
+        balance_lines = [_format_item(item) for item in data]
         
-        response_text = (
-            f"💳 **Balance for:** `{address}`\n"
-            f"🌐 **Network:** Sei Testnet (Atlantic-2)\n\n" +
-            "\n".join(balance_lines) +
-            f"\n\n🔗 [View on Explorer](https://seitrace.com/address/{address}?chain=atlantic-2)"
-        )
+        response_text = "".join((
+            _HEADER_TEMPLATE.format(address),
+            "\n".join(balance_lines),
+            _EXPLORER_TEMPLATE.format(address),
+        ))
         
         await loading_msg.edit_text(
             response_text,
@@ -110,7 +159,6 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     except Exception as e:
         log.error(f"Error in balance handler: {str(e)}")
         await loading_msg.edit_text(
-            f"❌ Error fetching balance for `{address}`\n\n"
-            "Please try again later or check the address format.",
+            _ERROR_TEMPLATE.format(address=address),
             parse_mode='Markdown'
         )
@@ -4,8 +4,9 @@ from telegram.ext import ContextTypes
 import time
 
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Time a lightweight API round-trip so only one message is sent
     start = time.perf_counter()
-    sent_message = await update.message.reply_text("Pinging...")
+    await context.bot.get_me()
     end = time.perf_counter()
     latency_ms = (end - start) * 1000
-    await sent_message.edit_text(f"pong \u26a1 {latency_ms:.2f} ms")
+    await update.message.reply_text(f"pong ⚡ {latency_ms:.2f} ms")
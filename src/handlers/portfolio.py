@@ -1,15 +1,55 @@
 from __future__ import annotations
+import asyncio
+import time
 from telegram import Update
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
-import aiosqlite
 import logging
-from src.db import DB_PATH
-from src.services.portfolio_manager import portfolio_manager
+from typing import Dict, List
+from src.db import (
+    add_portfolio_address, remove_portfolio_address, list_portfolio_addresses,
+    set_target_stable_pct, get_rebal_inputs,
+)
+from src.services.portfolio_manager import portfolio_manager, PortfolioPosition, PortfolioSummary
+from src.services.sei_client import EVM_ADDRESS_RE, SEI_ADDRESS_RE
 from src.services.analytics import volatility_signal
 from datetime import datetime
 
 log = logging.getLogger(__name__)
 
+# Relative shape of the synthetic 60-point price series used for volatility,
+# computed once; handlers scale it by the current price
+_VOL_PATTERN = tuple(1 + (i % 3 - 1) * 0.01 for i in range(60))
+
+# Caps concurrent portfolio fetches so bursts don't hammer the RPC and oracle
+_RPC_SEM = asyncio.Semaphore(20)
+
+# Portfolios with more positions than this are formatted in a worker thread
+_RENDER_IN_THREAD_OVER = 20
+
+# Min seconds between message edits while advice streams in (Telegram rate-limits edits)
+_STREAM_EDIT_INTERVAL = 1.0
+
+async def _edit_quietly(message, text: str) -> None:
+    """Edit a message, ignoring 'not modified' and other transient edit failures"""
+    try:
+        await message.edit_text(text)
+    except TelegramError as e:
+        log.debug(f"Skipped message edit: {e}")
+
+def _render_portfolio(positions: Dict[str, PortfolioPosition], total_usd: float) -> str:
+    """Build the /portfolio summary text"""
+    parts: List[str] = ["💼 **Portfolio Summary**\n\n"]
+    for pos in positions.values():
+        if pos.balance_usd > 0:
+            label = f" ({pos.label})" if pos.label else ""
+            parts.append(
+                f"📍 {pos.address[:10]}...{label}\n"
+                f"   {pos.balance_sei:.4f} SEI (${pos.balance_usd:.2f})\n\n"
+            )
+    parts.append(f"💰 **Total**: ${total_usd:.2f}")
+    return "".join(parts)
+
 async def portfolio_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Add address to portfolio"""
     if not context.args:
@@ -20,7 +60,7 @@ async def portfolio_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     label = context.args[1].strip() if len(context.args) > 1 else ""
     
     # Validate address format
-    if not (address.startswith('0x') and len(address) == 42) and not (address.startswith('sei1') and len(address) == 44):
+    if not (EVM_ADDRESS_RE.match(address) or SEI_ADDRESS_RE.match(address)):
         await update.message.reply_text(
             "❌ Invalid address format\n\n"
             "Please provide a valid:\n"
@@ -30,12 +70,7 @@ async def portfolio_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
     
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO portfolio_addresses (user_id, address, label)
-                VALUES (?, ?, ?)
-            """, (update.effective_user.id, address, label))
-            await db.commit()
+        await add_portfolio_address(update.effective_user.id, address, label)
         
         await update.message.reply_text(
             f"✅ Added to portfolio: {address[:10]}...\n"
@@ -58,19 +93,14 @@ async def portfolio_rm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     address = context.args[0].strip()
     
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                DELETE FROM portfolio_addresses 
-                WHERE user_id = ? AND address = ?
-            """, (update.effective_user.id, address))
-            await db.commit()
-            
-            if cursor.rowcount > 0:
-                await update.message.reply_text(f"✅ Removed from portfolio: {address[:10]}...")
-                # Log the action
-                log.info(f"User {update.effective_user.id} removed portfolio address: {address[:10]}...")
-            else:
-                await update.message.reply_text(f"❌ Address not found in portfolio: {address[:10]}...")
+        removed = await remove_portfolio_address(update.effective_user.id, address)
+        
+        if removed > 0:
+            await update.message.reply_text(f"✅ Removed from portfolio: {address[:10]}...")
+            # Log the action
+            log.info(f"User {update.effective_user.id} removed portfolio address: {address[:10]}...")
+        else:
+            await update.message.reply_text(f"❌ Address not found in portfolio: {address[:10]}...")
         
     except Exception as e:
         log.error(f"Error removing portfolio address: {str(e)}")
@@ -80,19 +110,15 @@ async def portfolio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show portfolio summary with real-time data"""
     try:
         # Get user's portfolio addresses
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                SELECT address, label FROM portfolio_addresses 
-                WHERE user_id = ?
-            """, (update.effective_user.id,))
-            addresses = await cursor.fetchall()
+        addresses = await list_portfolio_addresses(update.effective_user.id)
         
         if not addresses:
             await update.message.reply_text("📭 Portfolio is empty. Use /portfolio_add to add addresses.")
             return
         
         # Get portfolio positions with async optimization
-        positions = await portfolio_manager.get_portfolio_positions(addresses)
+        async with _RPC_SEM:
+            positions = await portfolio_manager.get_portfolio_positions(addresses)
         
         if not positions:
             await update.message.reply_text("📭 No balances found in portfolio addresses")
@@ -101,15 +127,11 @@ async def portfolio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         # Calculate total
         total_usd = sum(pos.balance_usd for pos in positions.values())
         
-        # Generate summary
-        summary = f"💼 **Portfolio Summary**\n\n"
-        for address, pos in positions.items():
-            if pos.balance_usd > 0:
-                label = f" ({pos.label})" if pos.label else ""
-                summary += f"📍 {pos.address[:10]}...{label}\n"
-                summary += f"   {pos.balance_sei:.4f} SEI (${pos.balance_usd:.2f})\n\n"
-        
-        summary += f"💰 **Total**: ${total_usd:.2f}"
+        # Generate summary; large portfolios are rendered off the event loop
+        if len(positions) > _RENDER_IN_THREAD_OVER:
+            summary = await asyncio.to_thread(_render_portfolio, positions, total_usd)
+        else:
+            summary = _render_portfolio(positions, total_usd)
         
         await update.message.reply_text(summary)
         
@@ -121,19 +143,18 @@ async def insights(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show portfolio insights with real-time AI analysis"""
     try:
         # Get user's portfolio addresses
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("""
-                SELECT address, label FROM portfolio_addresses 
-                WHERE user_id = ?
-            """, (update.effective_user.id,))
-            addresses = await cursor.fetchall()
+        addresses = await list_portfolio_addresses(update.effective_user.id)
         
         if not addresses:
             await update.message.reply_text("📭 Portfolio is empty. Use /portfolio_add to add addresses.")
             return
         
-        # Get portfolio positions with async optimization
-        positions = await portfolio_manager.get_portfolio_positions(addresses)
+        # Positions and the SEI price are independent, fetch them together
+        async with _RPC_SEM:
+            positions, current_price = await asyncio.gather(
+                portfolio_manager.get_portfolio_positions(addresses),
+                portfolio_manager.get_real_time_price("SEI"),
+            )
         
         if not positions:
             await update.message.reply_text("📭 No balances found in portfolio addresses")
@@ -145,15 +166,13 @@ async def insights(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         # Get volatility data
         try:
-            current_price = await portfolio_manager.get_real_time_price("SEI")
-            price_series = [current_price * (1 + (i % 3 - 1) * 0.01) for i in range(60)]
+            price_series = [current_price * f for f in _VOL_PATTERN]
             volatility = volatility_signal(price_series, 60)
         except Exception as e:
             log.warning(f"Volatility calculation failed: {e}")
             volatility = {"signal": "unknown"}
         
         # Create portfolio summary
-        from src.services.portfolio_manager import PortfolioSummary
         portfolio_summary = PortfolioSummary(
             total_usd=total_usd,
             positions=positions,
@@ -162,20 +181,32 @@ async def insights(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             last_updated=datetime.now()
         )
         
-        # Get AI insights with real-time market data
-        eliza_client = context.bot_data.get("eliza_client")
-        ai_advice = await portfolio_manager.get_ai_insights(portfolio_summary, eliza_client)
-        
         # Generate insights summary
-        insights_text = f"🔍 **Portfolio Insights**\n\n"
-        insights_text += f"💰 Total Value: ${total_usd:.2f}\n"
-        insights_text += f"📊 Assets: {len(positions)}\n"
-        insights_text += f"🎯 Top Asset: {concentration['top_asset']} ({concentration['top_pct']}%)\n\n"
+        header = "".join((
+            "🔍 **Portfolio Insights**\n\n",
+            f"💰 Total Value: ${total_usd:.2f}\n",
+            f"📊 Assets: {len(positions)}\n",
+            f"🎯 Top Asset: {concentration['top_asset']} ({concentration['top_pct']}%)\n\n",
+            "🧠 **AI Advisory**\n",
+        ))
         
-        # Add AI advisory
-        insights_text += f"🧠 **AI Advisory**\n{ai_advice}"
+        # Get AI insights with real-time market data
+        eliza_client = context.bot_data.get("eliza_client")
+        if eliza_client and eliza_client.stream:
+            # Show the summary straight away and fill the advisory in as it streams
+            message = await update.message.reply_text(header + "…")
+            advice = ""
+            last_edit = time.monotonic()
+            async for chunk in portfolio_manager.get_ai_insights_stream(portfolio_summary, eliza_client):
+                advice += chunk
+                if time.monotonic() - last_edit >= _STREAM_EDIT_INTERVAL:
+                    await _edit_quietly(message, header + advice + " …")
+                    last_edit = time.monotonic()
+            await _edit_quietly(message, header + advice)
+            return
         
-        await update.message.reply_text(insights_text)
+        ai_advice = await portfolio_manager.get_ai_insights(portfolio_summary, eliza_client)
+        await update.message.reply_text(header + ai_advice)
         
     except Exception as e:
         log.error(f"Error computing insights: {e}")
@@ -193,12 +224,7 @@ async def targets(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             await update.message.reply_text("❌ Percentage must be between 0-100")
             return
         
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO user_prefs (user_id, target_stable_pct)
-                VALUES (?, ?)
-            """, (update.effective_user.id, stable_pct))
-            await db.commit()
+        await set_target_stable_pct(update.effective_user.id, stable_pct)
         
         await update.message.reply_text(f"✅ Target stable allocation set to {stable_pct}%")
         
@@ -215,28 +241,19 @@ async def rebal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show rebalancing advice with real-time AI analysis"""
     try:
         # Get user's target and portfolio data
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Get user's target
-            cursor = await db.execute("""
-                SELECT target_stable_pct FROM user_prefs 
-                WHERE user_id = ?
-            """, (update.effective_user.id,))
-            result = await cursor.fetchone()
-            target_stable_pct = result[0] if result else 40.0  # Default 40%
-            
-            # Get portfolio data
-            cursor = await db.execute("""
-                SELECT address, label FROM portfolio_addresses 
-                WHERE user_id = ?
-            """, (update.effective_user.id,))
-            addresses = await cursor.fetchall()
+        target, addresses = await get_rebal_inputs(update.effective_user.id)
+        target_stable_pct = target if target is not None else 40.0  # Default 40%
         
         if not addresses:
             await update.message.reply_text("📭 Portfolio is empty. Add addresses with /portfolio_add first.")
             return
         
-        # Get portfolio positions with async optimization
-        positions = await portfolio_manager.get_portfolio_positions(addresses)
+        # Positions and the SEI price are independent, fetch them together
+        async with _RPC_SEM:
+            positions, current_price = await asyncio.gather(
+                portfolio_manager.get_portfolio_positions(addresses),
+                portfolio_manager.get_real_time_price("SEI"),
+            )
         
         if not positions:
             await update.message.reply_text("📭 No balances found in portfolio addresses")
@@ -248,15 +265,13 @@ async def rebal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         # Get volatility data
         try:
-            current_price = await portfolio_manager.get_real_time_price("SEI")
-            price_series = [current_price * (1 + (i % 3 - 1) * 0.01) for i in range(60)]
+            price_series = [current_price * f for f in _VOL_PATTERN]
             volatility = volatility_signal(price_series, 60)
         except Exception as e:
             log.warning(f"Volatility calculation failed: {e}")
             volatility = {"signal": "unknown"}
         
         # Create portfolio summary
-        from src.services.portfolio_manager import PortfolioSummary
         portfolio_summary = PortfolioSummary(
             total_usd=total_usd,
             positions=positions,
@@ -270,16 +285,16 @@ async def rebal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         ai_advice = await portfolio_manager.get_rebalancing_advice(portfolio_summary, target_stable_pct, eliza_client)
         
         # Generate rebalancing report
-        advice_text = f"⚖️ **DeFi Portfolio Rebalancing**\n\n"
-        advice_text += f"💰 Total Portfolio: ${total_usd:.2f}\n"
-        advice_text += f"🎯 Target Stable: {target_stable_pct}%\n"
-        advice_text += f"📊 Current Stable: 0.0% (DeFi portfolio)\n\n"
-        advice_text += f"💡 **AI Advisory**\n{ai_advice}"
+        advice_text = "".join((
+            "⚖️ **DeFi Portfolio Rebalancing**\n\n",
+            f"💰 Total Portfolio: ${total_usd:.2f}\n",
+            f"🎯 Target Stable: {target_stable_pct}%\n",
+            "📊 Current Stable: 0.0% (DeFi portfolio)\n\n",
+            f"💡 **AI Advisory**\n{ai_advice}",
+        ))
         
         await update.message.reply_text(advice_text)
         
     except Exception as e:
-        log.error(f"Error computing rebalancing advice: {e}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        log.exception(f"Error computing rebalancing advice: {e}")
         await update.message.reply_text("❌ Failed to compute rebalancing advice. Please try again.")
@@ -1,46 +1,108 @@
 from __future__ import annotations
 from telegram import Update
 from telegram.ext import ContextTypes
-from src.db import add_watch, list_watches, remove_watch, get_all_watches, set_last_tx_hash
+from src.db import add_watch, list_watches, remove_watch, get_all_watches, set_last_tx_hashes
+from src.services.sei_client import validate_address
 from src.services.transaction_monitor import TransactionMonitor
+from src.config import settings
 import logging
 import asyncio
+import time
+from itertools import chain
 
 log = logging.getLogger(__name__)
 
 USAGE = "Usage: /watch <address> | /unwatch <address> | /watches\n\nSupports EVM (0x...) and SEI (sei1...) addresses"
 
+_INVALID_ADDR_TEMPLATE = (
+    "❌ {error}\n\n"
+    "Please provide a valid:\n"
+    "• EVM address (0x followed by 40 hex characters)\n"
+    "• SEI address (sei1 followed by 38 alphanumeric characters)"
+)
+
 # Global transaction monitor instance
 transaction_monitor = TransactionMonitor()
 
+class NotificationContext:
+    """Minimal stand-in for a callback context so the monitor can send notifications"""
+    def __init__(self, app):
+        self.app = app
+        self.bot = app.bot
+        self.bot_data = app.bot_data
+
 # Global monitoring task
 _monitoring_task = None
 _app_instance = None
+_notification_context: NotificationContext | None = None
 
 # Semaphore to limit concurrent requests (prevent rate limiting)
 _request_semaphore = asyncio.Semaphore(5)  # Max 5 concurrent requests
 
+# Set while there may be watches to check; the monitor parks on it when there are none
+_watches_exist = asyncio.Event()
+_watches_exist.set()
+
+# In-memory shadow of the watches table: address -> {user_id: last_tx_hash}.
+# Kept current by /watch, /unwatch and the monitor's hash updates, with a
+# periodic reload from the DB to pick up anything written elsewhere
+_watch_index: dict = {}
+_WATCH_INDEX_RECONCILE = 60.0
+_watch_index_loaded_at: float | None = None
+
+# newHeads subscription state (only used when SEI_EVM_WS_URL is set)
+_head_task = None
+_head_event = asyncio.Event()
+_latest_head: int | None = None
+# EVM address -> head it was last scanned up to; an address already at the
+# current head is skipped, otherwise the scan resumes after its last head
+_last_seen_head: dict = {}
+
+async def _reload_watch_index() -> None:
+    global _watch_index, _watch_index_loaded_at
+    index: dict = {}
+    for user_id, address, last_tx_hash in await get_all_watches():
+        index.setdefault(address, {})[user_id] = last_tx_hash
+    _watch_index = index
+    _watch_index_loaded_at = time.monotonic()
+
+def _index_add(user_id: int, address: str) -> None:
+    _watch_index.setdefault(address, {}).setdefault(user_id, None)
+
+def _index_remove(user_id: int, address: str) -> None:
+    users = _watch_index.get(address)
+    if users is not None:
+        users.pop(user_id, None)
+        if not users:
+            del _watch_index[address]
+
+def _index_update_hashes(rows) -> None:
+    """Mirror set_last_tx_hashes rows (tx_hash, user_id, address) into the index"""
+    for tx_hash, user_id, address in rows:
+        users = _watch_index.get(address)
+        if users is not None and user_id in users:
+            users[user_id] = tx_hash
+
 async def watch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
         await update.message.reply_text(USAGE)
         return
     
-    sei = context.bot_data["sei_client"]
     address = context.args[0].strip()
     
     # Validate address format
-    is_valid, error_msg = sei.validate_address(address)
+    is_valid, error_msg = validate_address(address)
     if not is_valid:
-        await update.message.reply_text(
-            f"❌ {error_msg}\n\n"
-            "Please provide a valid:\n"
-            "• EVM address (0x followed by 40 hex characters)\n"
-            "• SEI address (sei1 followed by 38 alphanumeric characters)"
-        )
+        await update.message.reply_text(_INVALID_ADDR_TEMPLATE.format(error=error_msg))
         return
     
     try:
         await add_watch(update.effective_user.id, address)
+        _index_add(update.effective_user.id, address)
+        transaction_monitor.mark_user_reachable(update.effective_user.id)
+        # Give the new watch a fresh full-range scan
+        _last_seen_head.pop(address, None)
+        _watches_exist.set()
         
         # Send initial confirmation
         await update.message.reply_text(
@@ -79,9 +141,19 @@ async def unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     address = context.args[0].strip()
     
+    # Malformed input can't be in the watch list, skip the DB round-trip
+    is_valid, error_msg = validate_address(address)
+    if not is_valid:
+        await update.message.reply_text(_INVALID_ADDR_TEMPLATE.format(error=error_msg))
+        return
+    
     try:
         removed = await remove_watch(update.effective_user.id, address)
         if removed:
+            _index_remove(update.effective_user.id, address)
+            transaction_monitor.forget_watch(update.effective_user.id, address)
+            if address not in _watch_index:
+                _last_seen_head.pop(address, None)
             await update.message.reply_text(
                 f"✅ Removed watch: {address}"
             )
@@ -151,9 +223,9 @@ async def test_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         log.error(f"Error in test monitor: {e}")
         await update.message.reply_text(f"❌ Error: {str(e)}")
 
-def setup_watch_job_with_app(app) -> None:
+async def setup_watch_job_with_app(app) -> None:
     """Setup the watch monitoring job with application instance"""
-    global _monitoring_task, _app_instance
+    global _monitoring_task, _app_instance, _notification_context
     
     try:
         log.info("Setting up watch monitoring with application instance")
@@ -165,100 +237,131 @@ def setup_watch_job_with_app(app) -> None:
         
         # Store the application instance
         _app_instance = app
+        _notification_context = NotificationContext(app)
         
-        # Start new monitoring task in background
-        loop = asyncio.get_event_loop()
-        _monitoring_task = loop.create_task(background_monitoring())
+        # Start the monitor through the application so it lives on the running loop
+        _monitoring_task = app.create_task(background_monitoring(), name="watch-monitor")
         _monitoring_task.add_done_callback(lambda t: log.info("Background monitoring task completed"))
+        _start_head_subscription(app)
         
         log.info("Watch monitoring task started (every 5 seconds)")
         
     except Exception as e:
-        log.error(f"Error setting up watch monitoring: {e}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        log.exception(f"Error setting up watch monitoring: {e}")
 
 def setup_watch_job(job_queue) -> None:
-    """Setup the watch monitoring job using asyncio task"""
-    global _monitoring_task, _app_instance
+    """Setup the watch monitoring job from sync code by scheduling it on the job queue"""
+    async def _start(context: ContextTypes.DEFAULT_TYPE) -> None:
+        await setup_watch_job_with_app(context.application)
     
+    log.info("Scheduling watch monitoring setup on the job queue")
+    job_queue.run_once(_start, 0, name="watch-monitor-setup")
+
+async def stop_watch_job() -> None:
+    """
+    Cancel the monitor and newHeads tasks. Application.stop() awaits tasks made
+    with app.create_task, so this has to run before it.
+    """
+    tasks = [t for t in (_monitoring_task, _head_task) if t and not t.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _on_new_head(block_number: int) -> None:
+    global _latest_head
+    _latest_head = block_number
+    _head_event.set()
+
+def _start_head_subscription(app) -> None:
+    """Start the newHeads subscription if a WebSocket URL is configured"""
+    global _head_task
+    if not settings.SEI_EVM_WS_URL:
+        return
+    if _head_task and not _head_task.done():
+        _head_task.cancel()
+    _head_task = app.create_task(
+        transaction_monitor.watch_new_heads(settings.SEI_EVM_WS_URL, _on_new_head),
+        name="watch-new-heads",
+    )
+    log.info("Watch monitoring will wake on new EVM blocks")
+
+async def _wait_for_next_check() -> int | None:
+    """
+    Sleep until the next monitoring pass. With a live newHeads subscription this
+    returns the new head as soon as one arrives; otherwise (or if no head shows up
+    within the polling interval) it falls back to the fixed 3 second wait.
+    """
+    if _head_task is None or _head_task.done():
+        await asyncio.sleep(3)
+        return None
+    # Coalesce bursts of heads (Sei produces several per second)
+    await asyncio.sleep(1)
     try:
-        log.info("Setting up watch monitoring using asyncio task")
-        
-        # Cancel existing task if running
-        if _monitoring_task and not _monitoring_task.done():
-            _monitoring_task.cancel()
-            log.info("Cancelled existing monitoring task")
-        
-        # Get the application instance from the job queue
-        if hasattr(job_queue, '_application'):
-            _app_instance = job_queue._application
-        elif hasattr(job_queue, 'application'):
-            _app_instance = job_queue.application
-        else:
-            # Try to get it from the global instance
-            from src.bot import get_application
-            _app_instance = get_application()
-            
-        if not _app_instance:
-            log.error("Could not get application instance for monitoring")
-            return
-        
-        # Start new monitoring task in background
-        loop = asyncio.get_event_loop()
-        _monitoring_task = loop.create_task(background_monitoring())
-        _monitoring_task.add_done_callback(lambda t: log.info("Background monitoring task completed"))
-        
-        log.info("Watch monitoring task started (every 5 seconds)")
-        
-    except Exception as e:
-        log.error(f"Error setting up watch monitoring: {e}")
-        import traceback
-        log.error(f"Traceback: {traceback.format_exc()}")
+        await asyncio.wait_for(_head_event.wait(), timeout=2)
+    except asyncio.TimeoutError:
+        return None
+    _head_event.clear()
+    return _latest_head
 
 async def background_monitoring():
     """Background task that monitors for transactions with parallel processing"""
-    global _app_instance
+    global _app_instance, _notification_context
     
+    head = None
     while True:
         try:
             if _app_instance and _app_instance.bot:
-                # Create a proper context for sending notifications
-                class NotificationContext:
-                    def __init__(self, app):
-                        self.bot = app.bot
-                        self.bot_data = app.bot_data
-                
-                context = NotificationContext(_app_instance)
+                if _notification_context is None or _notification_context.app is not _app_instance:
+                    _notification_context = NotificationContext(_app_instance)
+                context = _notification_context
                 
-                # Get all watched addresses
-                watches = await get_all_watches()
-                if not watches:
-                    await asyncio.sleep(5)
+                # Watched addresses come from the in-memory index; the DB is only
+                # read at startup and on the periodic reconcile
+                if _watch_index_loaded_at is None or time.monotonic() - _watch_index_loaded_at >= _WATCH_INDEX_RECONCILE:
+                    await _reload_watch_index()
+                if not _watch_index:
+                    head = None
+                    # Index changes are synchronous, so nothing can slip in between
+                    # this check and the wait; /watch sets the event again
+                    _watches_exist.clear()
+                    log.debug("No watched addresses, monitoring idle until the next /watch")
+                    await _watches_exist.wait()
                     continue
                 
-                log.debug(f"Checking {len(watches)} addresses in parallel")
+                # Fetch each distinct address once per chain, however many users watch it
+                # address -> [(user_id, last_tx_hash), ...]
+                # Partitioned by chain here, once, so nothing downstream re-dispatches
+                evm_by_addr: dict = {}
+                sei_by_addr: dict = {}
+                num_watches = 0
+                for address, users in _watch_index.items():
+                    by_addr = evm_by_addr if address.startswith('0x') else sei_by_addr
+                    by_addr[address] = list(users.items())
+                    num_watches += len(users)
+                log.debug(f"Checking {len(evm_by_addr) + len(sei_by_addr)} distinct addresses for {num_watches} watches")
                 
-                # Create tasks for parallel processing of each address
+                # Each task carries its own timeout and fans out as soon as its own
+                # fetch lands, so one slow address doesn't hold up the rest
                 tasks = []
-                for user_id, address, last_tx_hash in watches:
-                    task = asyncio.create_task(
-                        check_single_address(context, user_id, address, last_tx_hash)
-                    )
-                    tasks.append(task)
+                async with asyncio.TaskGroup() as tg:
+                    if evm_by_addr:
+                        tasks.append(tg.create_task(_check_evm_addresses(context, evm_by_addr, head)))
+                    for address, subscribers in sei_by_addr.items():
+                        tasks.append(tg.create_task(_check_sei_address(context, address, subscribers)))
                 
-                # Wait for all tasks to complete (with timeout)
-                try:
-                    await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=10.0)
-                except asyncio.TimeoutError:
-                    log.warning("Some address checks timed out, continuing...")
+                # Last-hash updates from every address land in one batched write
+                rows = list(chain.from_iterable(task.result() for task in tasks))
+                if rows:
+                    await set_last_tx_hashes(rows)
+                    _index_update_hashes(rows)
                 
                 log.debug("Parallel monitoring check completed")
             else:
                 log.warning("No application instance available for monitoring")
             
-            # Wait 3 seconds before next check (faster than 5 seconds)
-            await asyncio.sleep(3)
+            # Wait for the next block (or 3 seconds when polling)
+            head = await _wait_for_next_check()
             
         except asyncio.CancelledError:
             log.info("Background monitoring task cancelled")
@@ -270,113 +373,148 @@ async def background_monitoring():
             log.info("Background monitoring interrupted")
             break
 
-async def check_single_address(context, user_id: int, address: str, last_tx_hash: str):
-    """Check a single address for new transactions (optimized for speed)"""
+async def _check_evm_addresses(context, by_addr: dict, head) -> list:
+    """Scan recent blocks once for every EVM address, then fan out per address"""
+    if head is None:
+        head = await transaction_monitor.get_latest_block()
+        if head is None:
+            return []
+    # Idle tick: nothing new to find for addresses already scanned to this head
+    evm_addrs = [address for address in by_addr if _last_seen_head.get(address) != head]
+    if not evm_addrs:
+        return []
+    seen = [_last_seen_head.get(address) for address in evm_addrs]
+    try:
+        async with asyncio.timeout(8):
+            evm_txs, scanned_to = await transaction_monitor.scan_evm_transactions(
+                evm_addrs, block_range=20, latest_block=head,
+                # Resume after the oldest head among these; unseen addresses get the full range
+                start_block=None if None in seen else min(seen) + 1,
+            )
+    except TimeoutError:
+        log.warning(f"EVM scan for {len(evm_addrs)} addresses timed out, continuing...")
+        return []
+    # Only advance as far as blocks were actually scanned without a gap, so blocks
+    # from a failed or timed-out batch are picked up again on the next tick
+    if scanned_to is not None:
+        for address in evm_addrs:
+            if scanned_to > _last_seen_head.get(address, -1):
+                _last_seen_head[address] = scanned_to
+    
+    results = await asyncio.gather(*[
+        check_address_fanout(
+            context, address, by_addr[address],
+            [(tx.hash, tx) for tx in evm_txs[address] if tx.hash], _evm_record,
+        )
+        for address in evm_addrs if evm_txs.get(address)
+    ])
+    return list(chain.from_iterable(results))
+
+async def _check_sei_address(context, address: str, subscribers: list) -> list:
+    """SEI LCD has no batch endpoint, so fetch per address under the request semaphore"""
     async with _request_semaphore:  # Limit concurrent requests
         try:
+            async with asyncio.timeout(5):
+                transactions = await transaction_monitor.get_sei_transactions(address)
+        except TimeoutError:
+            log.warning(f"Timeout checking SEI address {address[:10]}...")
+            return []
+    if not transactions:
+        return []
+    # The LCD lists newest first; notify oldest first so the stored hash is the newest
+    pairs = [(tx["hash"], tx) for tx in reversed(transactions) if tx.get("hash")]
+    return await check_address_fanout(context, address, subscribers, pairs, _sei_record)
+
+def _evm_record(address: str, tx) -> dict:
+    """Notification record for a matched EVM transaction (an EvmTx)"""
+    # Determine transaction type with one lookup; "from" is inserted last so
+    # a self-transfer still reads as OUTGOING
+    tx_type = {
+        (tx.to or "").lower(): "INCOMING",
+        (tx.from_ or "").lower(): "OUTGOING",
+    }.get(address.lower(), "UNKNOWN")
+    
+    return {
+        "hash": tx.hash,
+        "type": "EVM",
+        "direction": tx_type,
+        "block": tx.block_number,
+        "from": tx.from_,
+        "to": tx.to,
+        "value": tx.value,
+        "data": tx._asdict()
+    }
+
+def _sei_record(address: str, tx: dict) -> dict:
+    """Notification record for a fetched SEI transaction"""
+    # Try to determine direction from transaction data; LCD txs nearly always
+    # have the full path, so index straight in and only fall back on a miss
+    try:
+        messages = tx["data"]["tx"]["body"]["messages"]
+    except (KeyError, TypeError):
+        messages = ()
+    
+    direction = "UNKNOWN"
+    for msg in messages:
+        if msg.get("@type") == "/cosmos.bank.v1beta1.MsgSend":
+            direction = {
+                msg.get("to_address"): "INCOMING",
+                msg.get("from_address"): "OUTGOING",
+            }.get(address, "UNKNOWN")
+            break
+    
+    return {
+        "hash": tx["hash"],
+        "type": "SEI",
+        "direction": direction,
+        "block": tx.get("height", ""),
+        "data": tx
+    }
+
+async def check_address_fanout(context, address: str, subscribers: list, transactions: list, to_record) -> list:
+    """
+    Notify each (user_id, last_tx_hash) subscriber of an address's fetched
+    (tx_hash, tx) pairs it hasn't been notified of yet (per the monitor's seen-hash
+    store). to_record(address, tx) builds the notification record, only for txs that
+    are new to someone. Returns (tx_hash, user_id, address) rows for the caller to persist.
+    """
+    rows = []
+    # tx hash -> record, shared by every subscriber it is new to
+    records: dict = {}
+    try:
+        for user_id, last_tx_hash in subscribers:
+            seen = transaction_monitor.seen_txs(user_id, address, last_tx_hash)
             new_transactions = []
-            
-            if address.startswith('0x'):
-                # EVM address - use optimized block range
-                block_range = 20  # Increased for better detection
-                log.debug(f"Checking EVM address {address[:10]}... (blocks: {block_range})")
-                
-                # Get transactions with timeout
-                try:
-                    transactions = await asyncio.wait_for(
-                        transaction_monitor.get_evm_transactions(address, block_range),
-                        timeout=5.0
-                    )
-                    
-                    for tx in transactions:
-                        tx_hash = tx.get("hash", "")
-                        if tx_hash and tx_hash != last_tx_hash:
-                            # Determine transaction type
-                            from_addr = tx.get("from", "")
-                            to_addr = tx.get("to", "")
-                            
-                            if from_addr and from_addr.lower() == address.lower():
-                                tx_type = "OUTGOING"
-                            elif to_addr and to_addr.lower() == address.lower():
-                                tx_type = "INCOMING"
-                            else:
-                                tx_type = "UNKNOWN"
-                            
-                            new_transactions.append({
-                                "hash": tx_hash,
-                                "type": "EVM",
-                                "direction": tx_type,
-                                "block": tx.get("blockNumber", ""),
-                                "from": from_addr,
-                                "to": to_addr,
-                                "value": tx.get("value", "0"),
-                                "data": tx
-                            })
-                            log.info(f"New EVM transaction found: {tx_hash[:10]}... ({tx_type}) for {address[:10]}...")
-                    
-                except asyncio.TimeoutError:
-                    log.warning(f"Timeout checking EVM address {address[:10]}...")
-                except Exception as e:
-                    log.error(f"Error checking EVM address {address[:10]}...: {e}")
-                    
-            else:
-                # SEI native address
-                log.debug(f"Checking SEI address {address[:10]}...")
-                
-                try:
-                    transactions = await asyncio.wait_for(
-                        transaction_monitor.get_sei_transactions(address),
-                        timeout=5.0
-                    )
-                    
-                    for tx in transactions:
-                        tx_hash = tx.get("hash", "")
-                        if tx_hash and tx_hash != last_tx_hash:
-                            # Try to determine direction from transaction data
-                            tx_data = tx.get("data", {})
-                            tx_body = tx_data.get("tx", {})
-                            messages = tx_body.get("body", {}).get("messages", [])
-                            
-                            direction = "UNKNOWN"
-                            for msg in messages:
-                                if msg.get("@type") == "/cosmos.bank.v1beta1.MsgSend":
-                                    if msg.get("from_address") == address:
-                                        direction = "OUTGOING"
-                                    elif msg.get("to_address") == address:
-                                        direction = "INCOMING"
-                                    break
-                            
-                            new_transactions.append({
-                                "hash": tx_hash,
-                                "type": "SEI",
-                                "direction": direction,
-                                "block": tx.get("height", ""),
-                                "data": tx
-                            })
-                            log.info(f"New SEI transaction found: {tx_hash[:10]}... ({direction}) for {address[:10]}...")
-                    
-                except asyncio.TimeoutError:
-                    log.warning(f"Timeout checking SEI address {address[:10]}...")
-                except Exception as e:
-                    log.error(f"Error checking SEI address {address[:10]}...: {e}")
+            for tx_hash, tx in transactions:
+                if tx_hash not in seen:
+                    record = records.get(tx_hash)
+                    if record is None:
+                        record = records[tx_hash] = to_record(address, tx)
+                    new_transactions.append(record)
             
             # Send notifications for new transactions
+            latest_hash = None
             for tx in new_transactions:
                 try:
+                    log.info(f"New {tx['type']} transaction found: {tx['hash'][:10]}... ({tx['direction']}) for {address[:10]}...")
                     await transaction_monitor._send_transaction_notification(context, user_id, address, tx)
-                    
-                    # Update the last transaction hash in database
-                    await set_last_tx_hash(user_id, address, tx["hash"])
-                    log.info(f"Updated last transaction hash for {address[:10]}... to {tx['hash'][:10]}...")
+                    transaction_monitor.mark_seen(user_id, address, tx["hash"])
+                    latest_hash = tx["hash"]
                     
                 except Exception as e:
                     log.error(f"Error sending notification for {address[:10]}...: {e}")
             
-            if new_transactions:
-                log.info(f"Found {len(new_transactions)} new transactions for {address[:10]}...")
+            # Only the final hash matters, so one row per subscriber
+            if latest_hash is not None:
+                rows.append((latest_hash, user_id, address))
             
-        except Exception as e:
-            log.error(f"Error in check_single_address for {address[:10]}...: {e}")
+            if new_transactions:
+                log.info(f"Found {len(new_transactions)} new transactions for {address[:10]}... (user {user_id})")
+        
+    except Exception as e:
+        log.error(f"Error processing transactions for {address[:10]}...: {e}")
+    
+    return rows
 
 def get_application():
     """Get the application instance for background monitoring"""
@@ -0,0 +1,35 @@
+"""
+Optional speedups shared by the HTTP service clients: orjson for JSON encoding and
+parsing in C, and h2 so httpx can multiplex concurrent requests over HTTP/2.
+Both fall back to the standard library / HTTP/1.1 when not installed.
+"""
+from __future__ import annotations
+import json
+from typing import Any, Callable
+
+# HTTP/2 lets concurrent requests share one connection; it needs the optional h2 package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+
+    json_loads: Callable[[str | bytes], Any] = orjson.loads
+    json_dumps: Callable[[Any], bytes] = orjson.dumps
+
+    def json_dumps_canonical(obj: Any) -> bytes:
+        """Sorted-key encoding, byte-identical for equal inputs (request bodies and cache keys)"""
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> bytes:
+        """Compact encoding, as bytes like orjson.dumps"""
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def json_dumps_canonical(obj: Any) -> bytes:
+        """Sorted-key encoding, byte-identical for equal inputs (request bodies and cache keys)"""
+        return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
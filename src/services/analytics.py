@@ -1,6 +1,5 @@
 from __future__ import annotations
 import math
-import statistics
 from typing import Dict, List, Optional
 
 def compute_concentration(positions: Dict[str, float]) -> Dict:
@@ -18,6 +17,10 @@ def compute_concentration(positions: Dict[str, float]) -> Dict:
             "warnings": List[str]
         }
     """
+    return _concentration(positions, sum(positions.values()))
+
+def _concentration(positions: Dict[str, float], total_value: float) -> Dict:
+    """compute_concentration with the positions total already summed"""
     if not positions:
         return {
             "top_asset": "",
@@ -25,7 +28,6 @@ def compute_concentration(positions: Dict[str, float]) -> Dict:
             "warnings": ["No positions found"]
         }
     
-    total_value = sum(positions.values())
     if total_value <= 0:
         return {
             "top_asset": "",
@@ -33,17 +35,30 @@ def compute_concentration(positions: Dict[str, float]) -> Dict:
             "warnings": ["Total portfolio value is zero or negative"]
         }
     
-    # Find top asset
-    top_asset = max(positions.items(), key=lambda x: x[1])
-    top_pct = (top_asset[1] / total_value) * 100
+    if len(positions) == 1:
+        # Singleton: it is the whole portfolio and can't be a small position
+        top_name, top_value = next(iter(positions.items()))
+        small_positions = []
+    else:
+        # One pass finds the top asset and collects positions under 1%, compared
+        # against a precomputed cutoff rather than dividing every value
+        small_cutoff = total_value / 100
+        top_name, top_value = "", float("-inf")
+        small_positions = []
+        for asset, value in positions.items():
+            if value > top_value:
+                top_name, top_value = asset, value
+            if value < small_cutoff:
+                small_positions.append(asset)
+    top_pct = (top_value / total_value) * 100
     
     warnings = []
     
     # Concentration warnings
     if top_pct > 50:
-        warnings.append(f"High concentration: {top_asset[0]} is {top_pct:.1f}% of portfolio")
+        warnings.append(f"High concentration: {top_name} is {top_pct:.1f}% of portfolio")
     elif top_pct > 30:
-        warnings.append(f"Moderate concentration: {top_asset[0]} is {top_pct:.1f}% of portfolio")
+        warnings.append(f"Moderate concentration: {top_name} is {top_pct:.1f}% of portfolio")
     
     # Diversification check
     if len(positions) < 3:
@@ -51,14 +66,12 @@ def compute_concentration(positions: Dict[str, float]) -> Dict:
     elif len(positions) < 5:
         warnings.append("Moderate diversification: Portfolio could benefit from more assets")
     
-    # Check for very small positions (less than 1% each)
-    small_positions = [asset for asset, value in positions.items() 
-                      if (value / total_value) * 100 < 1.0]
+    # Very small positions (less than 1% each)
     if small_positions:
         warnings.append(f"Small positions detected: {', '.join(small_positions)} (< 1% each)")
     
     return {
-        "top_asset": top_asset[0],
+        "top_asset": top_name,
         "top_pct": round(top_pct, 2),
         "warnings": warnings
     }
@@ -152,20 +165,29 @@ def volatility_signal(series: List[float], lookback: int = 60) -> Dict:
             "error": "Insufficient data for analysis"
         }
     
-    # Calculate standard deviation
-    stdev = statistics.stdev(recent_series)
-    mean_price = statistics.mean(recent_series)
-    volatility_pct = (stdev / mean_price) * 100 if mean_price > 0 else 0
-    
-    # Calculate maximum drawdown
+    # One fused pass: running mean/variance (Welford, numerically stable)
+    # alongside the peak tracking for maximum drawdown
+    n = 0
+    mean_price = 0.0
+    m2 = 0.0
     peak = recent_series[0]
     max_drawdown = 0.0
     
     for price in recent_series:
+        n += 1
+        delta = price - mean_price
+        mean_price += delta / n
+        m2 += delta * (price - mean_price)
+        
         if price > peak:
             peak = price
-        drawdown = (peak - price) / peak * 100 if peak > 0 else 0
-        max_drawdown = max(max_drawdown, drawdown)
+        if peak > 0:
+            drawdown = (peak - price) / peak * 100
+            if drawdown > max_drawdown:
+                max_drawdown = drawdown
+    
+    stdev = math.sqrt(m2 / (n - 1))
+    volatility_pct = (stdev / mean_price) * 100 if mean_price > 0 else 0
     
     # Determine signal based on thresholds
     signal = "ok"
@@ -207,17 +229,21 @@ def compute_portfolio_metrics(positions: Dict[str, float],
     Returns:
         Dictionary with comprehensive portfolio analysis
     """
-    total_usd = sum(positions.values()) + stable_usd
+    # One pass over the values feeds the total, concentration and HHI
+    values = list(positions.values())
+    positions_total = sum(values)
+    total_usd = positions_total + stable_usd
     
-    concentration = compute_concentration(positions)
+    concentration = _concentration(positions, positions_total)
     rebalance = compute_rebalance_advice(total_usd, stable_usd, target_stable_pct)
     
     # Calculate additional metrics
     num_assets = len(positions)
     avg_position = total_usd / num_assets if num_assets > 0 else 0
     
-    # Herfindahl-Hirschman Index (HHI) for concentration
-    hhi = sum(((value / total_usd) * 100) ** 2 for value in positions.values()) if total_usd > 0 else 0
+    # Herfindahl-Hirschman Index (HHI) for concentration: sum of squared
+    # percentage shares, i.e. sum(v^2) scaled once by (100 / total)^2
+    hhi = sum(v * v for v in values) * (1e4 / (total_usd * total_usd)) if total_usd > 0 else 0
     
     # Concentration interpretation
     if hhi > 2500:
@@ -254,22 +280,25 @@ def format_portfolio_report(metrics: Dict) -> str:
     Returns:
         Formatted string report
     """
-    report = f"📊 **Portfolio Analysis**\n\n"
-    report += f"💰 **Total Value**: ${metrics['total_usd']:,.2f}\n"
-    report += f"📈 **Assets**: {metrics['num_assets']} positions\n"
-    report += f"📊 **Concentration**: {metrics['concentration_level']} (HHI: {metrics['hhi']})\n"
-    report += f"🎯 **Top Asset**: {metrics['concentration']['top_asset']} ({metrics['concentration']['top_pct']}%)\n\n"
+    concentration = metrics['concentration']
+    parts = [
+        "📊 **Portfolio Analysis**\n\n",
+        f"💰 **Total Value**: ${metrics['total_usd']:,.2f}\n",
+        f"📈 **Assets**: {metrics['num_assets']} positions\n",
+        f"📊 **Concentration**: {metrics['concentration_level']} (HHI: {metrics['hhi']})\n",
+        f"🎯 **Top Asset**: {concentration['top_asset']} ({concentration['top_pct']}%)\n\n",
+    ]
     
     # Rebalancing advice
     rebalance = metrics['rebalance']
     if abs(rebalance['delta_usd']) > 0:
-        report += f"⚖️ **Rebalancing**: {rebalance['suggestion']}\n"
-        report += f"📊 **Stable Allocation**: {rebalance['current_pct']}% → {rebalance['target_pct']}%\n\n"
+        parts.append(f"⚖️ **Rebalancing**: {rebalance['suggestion']}\n")
+        parts.append(f"📊 **Stable Allocation**: {rebalance['current_pct']}% → {rebalance['target_pct']}%\n\n")
     
     # Warnings
-    if metrics['concentration']['warnings']:
-        report += "⚠️ **Warnings**:\n"
-        for warning in metrics['concentration']['warnings']:
-            report += f"• {warning}\n"
+    if concentration['warnings']:
+        parts.append("⚠️ **Warnings**:\n")
+        parts.extend(f"• {warning}\n" for warning in concentration['warnings'])
     
-    return report
+    # Joined once, so the cost doesn't grow with the number of warnings
+    return "".join(parts)
@@ -1,12 +1,50 @@
 from __future__ import annotations
 import asyncio
+import hashlib
 import logging
+import random
 import time
-from typing import Dict, Any, Optional
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
 import httpx
+from src.services._json import HTTP2_AVAILABLE, json_dumps_canonical, json_loads
 
 log = logging.getLogger(__name__)
 
+# Fallback advice pieces, highest concentration tier first
+_CONCENTRATION_TIERS = (
+    (50, "⚠️ High concentration in {asset} ({pct:.1f}%). Consider diversifying."),
+    (30, "Moderate concentration in {asset} ({pct:.1f}%). Monitor for over-exposure."),
+)
+_VOLATILITY_MESSAGES = {
+    "alert": "🚨 High volatility detected. Consider reducing risk exposure.",
+    "warn": "⚠️ Moderate volatility. Stay alert to market changes.",
+}
+_FALLBACK_GENERIC = (
+    "Live advisory is temporarily unavailable. Here's a basic summary: "
+    "Monitor your portfolio regularly and consider diversification for risk management."
+)
+
+@lru_cache(maxsize=16)
+def _prompt_digest(prompt: str) -> bytes:
+    """Prompts are a few fixed strings, so hash each once rather than per request"""
+    return hashlib.sha256(prompt.encode()).digest()
+
+@lru_cache(maxsize=16)
+def _payload_prefix(prompt: str) -> bytes:
+    """Request body up to the context, encoded once per prompt"""
+    return b'{"prompt":' + json_dumps_canonical(prompt) + b',"context":'
+
+def _close_clients_on_gc(clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient]) -> None:
+    """Schedule aclose() for clients still open when an ElizaClient is collected"""
+    for loop, client in list(clients.items()):
+        # A closed loop can't run aclose(); its sockets went with it
+        if not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    clients.clear()
+
 class ElizaClient:
     """
     ElizaOS client for AI advisory services.
@@ -15,7 +53,7 @@ class ElizaClient:
     Reference: https://docs.elizaos.ai/ and https://github.com/elizaos-plugins/plugin-sei
     """
     
-    def __init__(self, base_url: str, api_key: str, timeout_s: int = 6):
+    def __init__(self, base_url: str, api_key: str, timeout_s: int = 6, stream: bool = False):
         """
         Initialize ElizaOS client.
         
@@ -23,29 +61,182 @@ class ElizaClient:
             base_url: ElizaOS API endpoint URL
             api_key: ElizaOS API key for authentication
             timeout_s: Request timeout in seconds
+            stream: Whether advise_stream() reads the response incrementally
         """
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
         self.timeout_s = timeout_s
-        self._http_client: Optional[httpx.AsyncClient] = None
+        self.stream = stream
+        # One HTTP client per event loop: a pooled connection can't be reused
+        # from a different loop than the one that opened it
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        # Safety net if close() is never awaited; holds the dict, not self
+        self._finalizer = weakref.finalize(self, _close_clients_on_gc, self._clients)
         
         # Retry configuration
         self.max_retries = 2
         self.base_delay = 0.5  # Start with 0.5s delay
+        self.max_delay = 5.0
+        
+        # Response cache: key -> (monotonic ts, advice), oldest first for LRU eviction
+        self._cache: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self.cache_max_entries = 256
+        self.cache_ttl = 300.0
+        # Near-match layer keyed on a coarse summary of the context, so contexts
+        # that differ only by small numeric drift share one answer
+        self._near_cache: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self.near_cache_max_entries = 128
+        # cache key -> in-flight request task
+        self._inflight: Dict[str, asyncio.Future[str]] = {}
+        
+    @staticmethod
+    def cache_key(prompt: str, context: Dict[str, Any]) -> str:
+        """Stable key for a prompt + context pair (context is canonicalized)"""
+        return ElizaClient._key_from_bytes(prompt, json_dumps_canonical(context))
+    
+    @staticmethod
+    def _key_from_bytes(prompt: str, context_bytes: bytes) -> str:
+        return hashlib.sha256(_prompt_digest(prompt) + context_bytes).hexdigest()
+    
+    @staticmethod
+    def near_cache_key(prompt: str, context: Dict[str, Any]) -> str:
+        """
+        Coarse key: total rounded to $10, top asset, top % to the nearest point
+        and the volatility signal, plus a coarse market bucket and every other
+        context field (targets, network, ...) exactly. Empty when the context has
+        no portfolio summary to key on (e.g. alerts), so those only use the exact cache.
+        """
+        portfolio = context.get("portfolio") or context
+        concentration = portfolio.get("concentration") or {}
+        volatility = portfolio.get("volatility") or {}
+        total = portfolio.get("total_value", portfolio.get("total_usd"))
+        top_asset = concentration.get("top_asset")
+        if total is None or not top_asset:
+            return ""
+        try:
+            total = round(float(total), -1)
+            top_pct = round(float(concentration.get("top_pct", 0) or 0))
+        except (TypeError, ValueError):
+            return ""
+        # Market figures drift on every refresh; price to the cent, 24h change to
+        # the point and the sentiment label are enough to tell market states apart
+        market = context.get("market") or {}
+        try:
+            market_bucket = (
+                round(float(market.get("current_price", 0) or 0), 2),
+                round(float(market.get("price_change_24h", 0) or 0)),
+                market.get("market_sentiment"),
+            )
+        except (TypeError, ValueError):
+            return ""
+        rest = {k: v for k, v in context.items() if k not in ("portfolio", "market")} if "portfolio" in context else {}
+        summary = f"{total}|{top_asset}|{top_pct}|{volatility.get('signal', '')}|{market_bucket}|".encode()
+        return hashlib.sha256(_prompt_digest(prompt) + summary + json_dumps_canonical(rest)).hexdigest()
+    
+    def _cache_get(self, key: str, cache: Optional[OrderedDict] = None) -> Optional[str]:
+        cache = self._cache if cache is None else cache
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        ts, advice = entry
+        if time.monotonic() - ts > self.cache_ttl:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return advice
+    
+    def _cache_set(self, key: str, advice: str, cache: Optional[OrderedDict] = None,
+                   max_entries: Optional[int] = None) -> None:
+        cache = self._cache if cache is None else cache
+        max_entries = self.cache_max_entries if max_entries is None else max_entries
+        cache[key] = (time.monotonic(), advice)
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
         
     async def _get_http_client(self) -> httpx.AsyncClient:
-        """Get or create HTTP client with proper configuration"""
-        if self._http_client is None:
-            self._http_client = httpx.AsyncClient(
+        """Get or create the running loop's HTTP client with proper configuration"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
                 timeout=httpx.Timeout(
                     connect=2.0,  # 2s connect timeout
                     read=2.0,     # 2s read timeout
                     write=2.0,    # 2s write timeout
                     pool=10.0     # 10s pool timeout
                 ),
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
+                # Pool, keepalive and HTTP/2 live on the transport; retries stay at 0
+                # because advise() runs its own retry loop
+                transport=httpx.AsyncHTTPTransport(
+                    retries=0,
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=256,
+                        max_keepalive_connections=64,
+                        keepalive_expiry=30.0,  # outlive the gap between polls, skip re-handshakes
+                    ),
+                ),
             )
-        return self._http_client
+            self._clients[loop] = client
+        return client
+    
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    @staticmethod
+    def _payload(prompt: str, context_bytes: bytes) -> bytes:
+        """
+        Deterministic bytes with the static prompt first and the (already
+        canonical) context last, so provider-side prompt caching sees a stable prefix
+        """
+        return _payload_prefix(prompt) + context_bytes + b"}"
+    
+    async def advise_stream(self, prompt: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Yield advisory text as ElizaOS sends it. When streaming is off, the answer
+        is cached, or the stream fails before any text arrives, this yields the
+        full advise() result once instead.
+        """
+        if not self.stream or not self.base_url or not self.api_key:
+            yield await self.advise(prompt, context)
+            return
+        
+        # Serialized once: the same bytes give the cache key and the request body
+        context_bytes = json_dumps_canonical(context)
+        key = self._key_from_bytes(prompt, context_bytes)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        try:
+            client = await self._get_http_client()
+            log.info("Streaming ElizaOS AI advisory")
+            async with client.stream(
+                "POST", f"{self.base_url}/advise", headers=self._headers(), content=self._payload(prompt, context_bytes)
+            ) as response:
+                if response.status_code == 200:
+                    async for chunk in response.aiter_text():
+                        if chunk:
+                            parts.append(chunk)
+                            yield chunk
+                else:
+                    log.warning(f"ElizaOS stream returned status {response.status_code}")
+        except Exception as e:
+            log.warning(f"ElizaOS stream failed after {len(parts)} chunks: {e}")
+            if parts:
+                # The user already has a partial answer; don't append a second one
+                return
+        
+        if parts:
+            self._cache_set(key, "".join(parts))
+            return
+        yield await self.advise(prompt, context)
     
     async def advise(self, prompt: str, context: Dict[str, Any]) -> str:
         """
@@ -62,47 +253,72 @@ class ElizaClient:
             log.warning("ElizaOS not configured, using fallback advisory")
             return self._get_fallback_advice(context)
         
+        # Serialized once: the same bytes give the cache key and the request body
+        context_bytes = json_dumps_canonical(context)
+        key = self._key_from_bytes(prompt, context_bytes)
+        cached = self._cache_get(key)
+        if cached is not None:
+            log.info("ElizaOS advisory served from cache")
+            return cached
+        near_key = self.near_cache_key(prompt, context)
+        if near_key:
+            cached = self._cache_get(near_key, self._near_cache)
+            if cached is not None:
+                log.info("ElizaOS advisory served from near-match cache")
+                self._cache_set(key, cached)
+                return cached
+        
+        # Single-flight: identical concurrent requests share one upstream call.
+        # Shielded so one caller giving up doesn't cancel it for the others
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request_advice(context, self._payload(prompt, context_bytes), key, near_key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _request_advice(self, context: Dict[str, Any], body: bytes, key: str, near_key: str) -> str:
+        """The actual ElizaOS round-trip (with retries) behind advise()"""
         log.info("Requesting ElizaOS AI advisory")
         
         for attempt in range(self.max_retries + 1):
             try:
                 client = await self._get_http_client()
                 
-                url = f"{self.base_url}/advise"
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                payload = {
-                    "prompt": prompt,
-                    "context": context
-                }
-                
-                response = await client.post(url, headers=headers, json=payload)
+                response = await client.post(
+                    f"{self.base_url}/advise", headers=self._headers(), content=body
+                )
                 
                 if response.status_code == 200:
-                    data = response.json()
+                    data = json_loads(response.content)
                     advice = data.get("advice", "")
                     if advice:
                         log.info("ElizaOS advisory received successfully")
+                        # Only real advice is cached; fallbacks should retry next time
+                        self._cache_set(key, advice)
+                        if near_key:
+                            self._cache_set(near_key, advice, self._near_cache, self.near_cache_max_entries)
                         return advice
                     else:
                         log.warning("ElizaOS returned empty advice")
                         return self._get_fallback_advice(context)
                 
                 log.warning(f"ElizaOS returned status {response.status_code}: {response.text}")
+                # Client errors won't fix themselves on retry (429 aside)
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    return self._get_fallback_advice(context)
                 
             except httpx.TimeoutException:
                 log.warning(f"ElizaOS timeout on attempt {attempt + 1}")
-            except httpx.HTTPStatusError as e:
-                log.warning(f"ElizaOS HTTP error on attempt {attempt + 1}: {e.response.status_code}")
+            except httpx.TransportError as e:
+                log.warning(f"ElizaOS connection error on attempt {attempt + 1}: {e}")
             except Exception as e:
                 log.error(f"ElizaOS unexpected error on attempt {attempt + 1}: {str(e)}")
+                return self._get_fallback_advice(context)
             
-            # Exponential backoff before retry
+            # Jittered exponential backoff so clients don't retry in lockstep
             if attempt < self.max_retries:
-                delay = self.base_delay * (2 ** attempt)
+                delay = min(self.max_delay, random.uniform(self.base_delay, self.base_delay * 3 * (2 ** attempt)))
                 log.info(f"Retrying ElizaOS in {delay:.1f}s...")
                 await asyncio.sleep(delay)
         
@@ -119,9 +335,11 @@ class ElizaClient:
         Returns:
             Basic fallback advisory text
         """
-        total_usd = context.get("total_usd", 0)
-        concentration = context.get("concentration", {})
-        volatility = context.get("volatility", {})
+        # Manager contexts nest the summary under "portfolio"
+        portfolio = context.get("portfolio") or context
+        total_usd = portfolio.get("total_value", portfolio.get("total_usd", 0)) or 0
+        concentration = portfolio.get("concentration") or {}
+        volatility = portfolio.get("volatility") or {}
         
         advice_parts = []
         
@@ -129,37 +347,33 @@ class ElizaClient:
         if total_usd > 0:
             advice_parts.append(f"Your portfolio is valued at ${total_usd:.2f}.")
         
-        # Concentration warning
-        top_asset = concentration.get("top_asset", "")
-        top_pct = concentration.get("top_pct", 0)
-        if top_pct > 50:
-            advice_parts.append(f"⚠️ High concentration in {top_asset} ({top_pct:.1f}%). Consider diversifying.")
-        elif top_pct > 30:
-            advice_parts.append(f"Moderate concentration in {top_asset} ({top_pct:.1f}%). Monitor for over-exposure.")
+        # Concentration warning: first tier whose threshold is exceeded
+        top_pct = concentration.get("top_pct", 0) or 0
+        for threshold, template in _CONCENTRATION_TIERS:
+            if top_pct > threshold:
+                advice_parts.append(template.format(asset=concentration.get("top_asset", ""), pct=top_pct))
+                break
         
         # Volatility insight
-        signal = volatility.get("signal", "ok")
-        if signal == "alert":
-            advice_parts.append("🚨 High volatility detected. Consider reducing risk exposure.")
-        elif signal == "warn":
-            advice_parts.append("⚠️ Moderate volatility. Stay alert to market changes.")
+        volatility_msg = _VOLATILITY_MESSAGES.get(volatility.get("signal", "ok"))
+        if volatility_msg:
+            advice_parts.append(volatility_msg)
         
         if not advice_parts:
-            advice_parts.append("Live advisory is temporarily unavailable. Here's a basic summary: Monitor your portfolio regularly and consider diversification for risk management.")
+            advice_parts.append(_FALLBACK_GENERIC)
         
         return " ".join(advice_parts)
     
     async def close(self) -> None:
-        """Close HTTP client and cleanup resources"""
-        if self._http_client:
-            await self._http_client.aclose()
-            self._http_client = None
+        """
+        Close the running loop's HTTP client. Must be awaited on shutdown; clients
+        left on loops that are already closed can only be dropped.
+        """
+        loop = asyncio.get_running_loop()
+        for client_loop, client in list(self._clients.items()):
+            if client_loop is loop:
+                await client.aclose()
+                del self._clients[client_loop]
+            elif client_loop.is_closed():
+                del self._clients[client_loop]
         log.info("ElizaOS client closed")
-    
-    def __del__(self):
-        """Cleanup on deletion"""
-        if self._http_client:
-            try:
-                asyncio.create_task(self.close())
-            except RuntimeError:
-                pass  # Event loop not running
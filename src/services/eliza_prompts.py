@@ -1,11 +1,6 @@
-def insights_prompt() -> str:
-    """
-    Get the portfolio insights prompt for ElizaOS AI advisory.
-    
-    Returns:
-        The exact prompt string for portfolio analysis
-    """
-    return """You are an **Expert DeFi Portfolio Analyst** embedded in a Telegram bot.
+# Prompts are built once at import; the functions hand back the same str object
+# every call, so the payload prefix and cache keys never change between requests
+_INSIGHTS_PROMPT = """You are an **Expert DeFi Portfolio Analyst** embedded in a Telegram bot.
 
 The bot has provided you with detailed portfolio data including balances, prices, volatility, and concentration metrics.
 
@@ -41,14 +36,7 @@ Your task is to provide comprehensive, insightful analysis:
 
 Remember: Each portfolio is unique, so provide personalized analysis based on the specific data provided. Avoid repetitive or generic responses."""
 
-def alert_prompt() -> str:
-    """
-    Get the alert advisory prompt for ElizaOS AI advisory.
-    
-    Returns:
-        The exact prompt string for alert analysis
-    """
-    return """You are an **Expert DeFi Portfolio Alert Analyst** embedded in a Telegram bot.
+_ALERT_PROMPT = """You are an **Expert DeFi Portfolio Alert Analyst** embedded in a Telegram bot.
 
 A portfolio alert has been triggered due to significant value changes. Your role is to provide calm, informed analysis.
 
@@ -76,14 +64,7 @@ A portfolio alert has been triggered due to significant value changes. Your role
 
 Focus on helping the user understand what's happening and what they should consider doing next."""
 
-def rebalancing_prompt() -> str:
-    """
-    Get the rebalancing advisory prompt for ElizaOS AI advisory.
-    
-    Returns:
-        The exact prompt string for rebalancing analysis
-    """
-    return """You are an **Expert DeFi Portfolio Rebalancing Advisor** embedded in a Telegram bot.
+_REBALANCING_PROMPT = """You are an **Expert DeFi Portfolio Rebalancing Advisor** embedded in a Telegram bot.
 
 The bot has calculated rebalancing recommendations based on target allocations and current portfolio composition.
 
@@ -115,3 +96,30 @@ The bot has calculated rebalancing recommendations based on target allocations a
 - Avoid generic advice about stablecoins when they're not available
 
 Remember: This is a DeFi portfolio, so focus on DeFi-specific rebalancing strategies and risk management approaches."""
+
+def insights_prompt() -> str:
+    """
+    Get the portfolio insights prompt for ElizaOS AI advisory.
+    
+    Returns:
+        The exact prompt string for portfolio analysis
+    """
+    return _INSIGHTS_PROMPT
+
+def alert_prompt() -> str:
+    """
+    Get the alert advisory prompt for ElizaOS AI advisory.
+    
+    Returns:
+        The exact prompt string for alert analysis
+    """
+    return _ALERT_PROMPT
+
+def rebalancing_prompt() -> str:
+    """
+    Get the rebalancing advisory prompt for ElizaOS AI advisory.
+    
+    Returns:
+        The exact prompt string for rebalancing analysis
+    """
+    return _REBALANCING_PROMPT
@@ -3,9 +3,11 @@ Async-optimized Portfolio Manager with real-time data integration
 """
 import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from src.services.sei_client import SeiClient
 from src.services.price_oracles import PriceOracle
@@ -32,6 +34,17 @@ class PortfolioSummary:
     concentration: Dict
     volatility: Dict
     last_updated: datetime
+    
+    def cache_key(self) -> Tuple:
+        """Content key for the fields that go into an AI context (timestamps excluded)"""
+        return (
+            round(self.total_usd, 2),
+            tuple(sorted((address, round(pos.balance_usd, 2)) for address, pos in self.positions.items())),
+            self.concentration.get("top_asset"),
+            self.concentration.get("top_pct"),
+            # Every volatility figure goes into the insights context, not just the signal
+            tuple(sorted(self.volatility.items())),
+        )
 
 class PortfolioManager:
     """Async-optimized portfolio manager with real-time data"""
@@ -43,39 +56,40 @@ class PortfolioManager:
             settings.SEI_EXPLORER_BASE
         )
         self.price_oracle = PriceOracle()
-        self._price_cache = {}
-        self._cache_ttl = 30  # 30 seconds cache
+        # Short-lived in-process caches so back-to-back /insights and /rebal
+        # don't redo the same RPC and oracle work
+        # Structure: {symbol: (price, expires_at_monotonic)}
+        self._price_cache: Dict[str, Tuple[float, float]] = {}
+        self._cache_ttl = 5  # 5 seconds cache
+        # symbol -> in-flight price fetch
+        self._price_inflight: Dict[str, asyncio.Future[float]] = {}
+        # Structure: {((address, label), ...): (positions, fetched_at_monotonic)}
+        self._positions_cache: Dict[Tuple[Tuple[str, str], ...], Tuple[Dict[str, PortfolioPosition], float]] = {}
+        self._positions_ttl = 15  # 15 seconds cache
+        # Max balance lookups in flight per portfolio refresh
+        self._balance_concurrency = 5
+        # Built "portfolio" sections of AI contexts, keyed by (kind, summary key); LRU
+        self._ctx_cache: OrderedDict[Tuple, Dict] = OrderedDict()
+        self._ctx_cache_size = 32
         
     async def get_real_time_price(self, symbol: str = "SEI") -> float:
         """Get real-time price with caching"""
-        cache_key = f"{symbol}_{datetime.now().strftime('%Y%m%d_%H%M')}"
-        
-        if cache_key in self._price_cache:
-            return self._price_cache[cache_key]
+        cached = self._price_cache.get(symbol)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
         
+        # Concurrent misses for the same symbol share one oracle call
+        task = self._price_inflight.get(symbol)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_price(symbol))
+            self._price_inflight[symbol] = task
+            task.add_done_callback(lambda _: self._price_inflight.pop(symbol, None))
+        return await asyncio.shield(task)
+    
+    async def _fetch_price(self, symbol: str) -> float:
         try:
             price = await self.price_oracle.get_price(symbol)
-            self._price_cache[cache_key] = price
-            
-            # Clean old cache entries
-            current_time = datetime.now()
-            expired_keys = []
-            for k in self._price_cache.keys():
-                try:
-                    # Parse the timestamp from cache key
-                    key_parts = k.split('_')
-                    if len(key_parts) >= 3:
-                        date_str = key_parts[1] + '_' + key_parts[2]
-                        key_time = datetime.strptime(date_str, '%Y%m%d_%H%M')
-                        if current_time - key_time > timedelta(minutes=1):
-                            expired_keys.append(k)
-                except (ValueError, IndexError):
-                    # If we can't parse the key, remove it
-                    expired_keys.append(k)
-            
-            for key in expired_keys:
-                del self._price_cache[key]
-                
+            self._price_cache[symbol] = (price, time.monotonic() + self._cache_ttl)
             return price
         except Exception as e:
             log.error(f"Error fetching real-time price for {symbol}: {e}")
@@ -111,25 +125,56 @@ class PortfolioManager:
             return 0.0, 0.0
     
     async def get_portfolio_positions(self, addresses: List[Tuple[str, str]]) -> Dict[str, PortfolioPosition]:
+        """Get portfolio positions, reusing a result fetched in the last few seconds"""
+        key = tuple((address, label) for address, label in addresses)
+        now = time.monotonic()
+        cached = self._positions_cache.get(key)
+        if cached is not None and now - cached[1] < self._positions_ttl:
+            return cached[0]
+        
+        positions = await self._fetch_portfolio_positions(addresses)
+        
+        # Drop expired entries so the cache stays bounded by active users
+        for k in [k for k, (_, ts) in self._positions_cache.items() if now - ts >= self._positions_ttl]:
+            del self._positions_cache[k]
+        self._positions_cache[key] = (positions, time.monotonic())
+        return positions
+    
+    async def _fetch_portfolio_positions(self, addresses: List[Tuple[str, str]]) -> Dict[str, PortfolioPosition]:
         """Get portfolio positions with parallel processing"""
         positions = {}
         
-        # Create tasks for parallel balance fetching with rate limiting
-        tasks = []
-        for i, (address, label) in enumerate(addresses):
-            # Add delay between requests to prevent rate limiting
-            if i > 0:
-                await asyncio.sleep(0.2)  # 200ms delay between requests
-            
-            task = asyncio.create_task(self.get_address_balance(address))
-            tasks.append((address, label, task))
+        # EVM balances come back from one JSON-RPC batch shared by every EVM task;
+        # the LCD has no batch endpoint, so SEI addresses still go one by one
+        evm_addresses = [address for address, _ in addresses if address.startswith('0x')]
+        evm_batch = asyncio.create_task(
+            self.sei_client.get_evm_native_balances_batch(evm_addresses, settings.SEI_EVM_RPC_URL)
+        ) if evm_addresses else None
+        
+        # Launch every fetch at once; the semaphore caps how many hit the RPC together
+        sem = asyncio.Semaphore(self._balance_concurrency)
+        
+        async def fetch_balance(address: str) -> Tuple[float, float]:
+            if evm_batch is not None and address.startswith('0x'):
+                balance_sei = (await evm_batch).get(address, 0) / (10**18)
+                if balance_sei > 0:
+                    return balance_sei, balance_sei * await self.get_real_time_price("SEI")
+                return 0.0, 0.0
+            async with sem:
+                return await self.get_address_balance(address)
+        
+        tasks = [
+            (address, label, asyncio.create_task(fetch_balance(address)))
+            for address, label in addresses
+        ]
         
-        # Wait for all tasks with timeout
+        # Wait for all tasks with timeout; on expiry the gather (and every fetch
+        # still in flight) is cancelled in place rather than left running
         try:
-            results = await asyncio.wait_for(
-                asyncio.gather(*[task for _, _, task in tasks], return_exceptions=True),
-                timeout=15.0  # Increased timeout
-            )
+            async with asyncio.timeout(15.0):
+                results = await asyncio.gather(*[task for _, _, task in tasks], return_exceptions=True)
+            # One timestamp for the whole batch
+            fetched_at = datetime.now()
             
             for i, (address, label, _) in enumerate(tasks):
                 try:
@@ -141,7 +186,7 @@ class PortfolioManager:
                             label=label,
                             balance_sei=0.0,
                             balance_usd=0.0,
-                            last_updated=datetime.now()
+                            last_updated=fetched_at
                         )
                         continue
                         
@@ -152,7 +197,7 @@ class PortfolioManager:
                         label=label,
                         balance_sei=balance_sei,
                         balance_usd=balance_usd,
-                        last_updated=datetime.now()
+                        last_updated=fetched_at
                     )
                     
                 except Exception as e:
@@ -163,12 +208,13 @@ class PortfolioManager:
                         label=label,
                         balance_sei=0.0,
                         balance_usd=0.0,
-                        last_updated=datetime.now()
+                        last_updated=fetched_at
                     )
                     continue
                     
-        except asyncio.TimeoutError:
+        except TimeoutError:
             log.warning("Portfolio balance fetch timed out")
+            fetched_at = datetime.now()
             # Add remaining addresses with zero balance
             for address, label, _ in tasks:
                 if address not in positions:
@@ -177,10 +223,11 @@ class PortfolioManager:
                         label=label,
                         balance_sei=0.0,
                         balance_usd=0.0,
-                        last_updated=datetime.now()
+                        last_updated=fetched_at
                     )
         except Exception as e:
             log.error(f"Error in parallel balance fetching: {e}")
+            fetched_at = datetime.now()
             # Add all addresses with zero balance
             for address, label, _ in tasks:
                 if address not in positions:
@@ -189,8 +236,11 @@ class PortfolioManager:
                         label=label,
                         balance_sei=0.0,
                         balance_usd=0.0,
-                        last_updated=datetime.now()
+                        last_updated=fetched_at
                     )
+        finally:
+            if evm_batch is not None and not evm_batch.done():
+                evm_batch.cancel()
         
         return positions
     
@@ -211,22 +261,16 @@ class PortfolioManager:
                 "warnings": []
             }
         
-        # Calculate percentages
-        position_pcts = {}
-        for address, pos in positions.items():
-            if pos.balance_usd > 0:
-                pct = (pos.balance_usd / total_usd) * 100
-                position_pcts[address] = pct
-        
-        if not position_pcts:
+        # The largest balance is the largest share, so find it directly and
+        # compute just that one percentage (no per-position pct dict)
+        top_address, top_pos = max(positions.items(), key=lambda item: item[1].balance_usd)
+        if top_pos.balance_usd <= 0:
             return {
                 "top_asset": "None",
                 "top_pct": 0.0,
                 "warnings": []
             }
-        
-        # Find top asset
-        top_asset = max(position_pcts.items(), key=lambda x: x[1])
+        top_asset = (top_address, (top_pos.balance_usd / total_usd) * 100)
         
         # Generate warnings
         warnings = []
@@ -254,7 +298,6 @@ class PortfolioManager:
                 "market_cap": 0.0,  # Would fetch from API
                 "volume_24h": 0.0,  # Would fetch from API
                 "market_sentiment": "neutral",  # Would analyze from multiple sources
-                "timestamp": datetime.now().isoformat()
             }
             
             return market_data
@@ -267,34 +310,58 @@ class PortfolioManager:
                 "market_cap": 0.0,
                 "volume_24h": 0.0,
                 "market_sentiment": "unknown",
-                "timestamp": datetime.now().isoformat()
             }
     
+    @staticmethod
+    def _context_positions(portfolio_summary: PortfolioSummary) -> Dict[str, float]:
+        """
+        Positions for an AI context: sorted by address and rounded to cents, so the
+        same portfolio always serializes to the same bytes
+        """
+        positions = sorted(portfolio_summary.positions.values(), key=lambda pos: pos.address)
+        return {pos.address[:10] + "...": round(pos.balance_usd, 2) for pos in positions}
+    
+    def _portfolio_context(self, kind: str, portfolio_summary: PortfolioSummary) -> Dict:
+        """
+        The "portfolio" section of an AI context. Rebuilt only when the summary's
+        content changes; repeat refreshes of the same portfolio reuse it.
+        """
+        key = (kind, portfolio_summary.cache_key())
+        section = self._ctx_cache.get(key)
+        if section is not None:
+            self._ctx_cache.move_to_end(key)
+            return section
+        
+        section = {
+            "total_value": round(portfolio_summary.total_usd, 2),
+            "positions": self._context_positions(portfolio_summary),
+            "concentration": portfolio_summary.concentration,
+        }
+        if kind == "insights":
+            section["num_positions"] = len(portfolio_summary.positions)
+            section["volatility"] = portfolio_summary.volatility
+        
+        self._ctx_cache[key] = section
+        if len(self._ctx_cache) > self._ctx_cache_size:
+            self._ctx_cache.popitem(last=False)
+        return section
+    
+    async def _insights_context(self, portfolio_summary: PortfolioSummary) -> Dict:
+        """Build comprehensive context for AI insights, with real-time market data"""
+        market_data = await self.get_market_data()
+        return {
+            "portfolio": self._portfolio_context("insights", portfolio_summary),
+            "market": market_data,
+            "network": settings.NETWORK,
+        }
+    
     async def get_ai_insights(self, portfolio_summary: PortfolioSummary, eliza_client: Optional[ElizaClient]) -> str:
         """Get AI insights with real-time market data"""
         try:
             if not eliza_client:
                 return "AI advisory temporarily unavailable. Consider diversifying your portfolio to reduce concentration risk."
             
-            # Get real-time market data
-            market_data = await self.get_market_data()
-            
-            # Build comprehensive context for AI
-            ai_context = {
-                "portfolio": {
-                    "total_value": portfolio_summary.total_usd,
-                    "num_positions": len(portfolio_summary.positions),
-                    "positions": {
-                        pos.address[:10] + "...": pos.balance_usd 
-                        for pos in portfolio_summary.positions.values()
-                    },
-                    "concentration": portfolio_summary.concentration,
-                    "volatility": portfolio_summary.volatility
-                },
-                "market": market_data,
-                "network": settings.NETWORK,
-                "analysis_timestamp": datetime.now().isoformat()
-            }
+            ai_context = await self._insights_context(portfolio_summary)
             
             # Get AI advisory
             advice = await eliza_client.advise(insights_prompt(), ai_context)
@@ -304,6 +371,17 @@ class PortfolioManager:
             log.error(f"Error getting AI insights: {e}")
             return "AI advisory temporarily unavailable. Consider diversifying your portfolio to reduce concentration risk."
     
+    async def get_ai_insights_stream(self, portfolio_summary: PortfolioSummary, eliza_client: ElizaClient) -> AsyncIterator[str]:
+        """Streaming form of get_ai_insights: yields advice text as it arrives"""
+        try:
+            ai_context = await self._insights_context(portfolio_summary)
+        except Exception as e:
+            log.error(f"Error getting AI insights: {e}")
+            yield "AI advisory temporarily unavailable. Consider diversifying your portfolio to reduce concentration risk."
+            return
+        async for chunk in eliza_client.advise_stream(insights_prompt(), ai_context):
+            yield chunk
+    
     async def get_rebalancing_advice(self, portfolio_summary: PortfolioSummary, target_stable_pct: float, eliza_client: Optional[ElizaClient]) -> str:
         """Get rebalancing advice with real-time market data"""
         try:
@@ -315,14 +393,7 @@ class PortfolioManager:
             
             # Build rebalancing context
             rebalancing_context = {
-                "portfolio": {
-                    "total_value": portfolio_summary.total_usd,
-                    "positions": {
-                        pos.address[:10] + "...": pos.balance_usd 
-                        for pos in portfolio_summary.positions.values()
-                    },
-                    "concentration": portfolio_summary.concentration
-                },
+                "portfolio": self._portfolio_context("rebalancing", portfolio_summary),
                 "targets": {
                     "stable_pct": target_stable_pct,
                     "current_stable_pct": 0.0  # No stablecoins in SEI DeFi
@@ -330,7 +401,6 @@ class PortfolioManager:
                 "market": market_data,
                 "network": settings.NETWORK,
                 "portfolio_type": "defi_sei",
-                "analysis_timestamp": datetime.now().isoformat()
             }
             
             # Get AI rebalancing advice
@@ -341,5 +411,10 @@ class PortfolioManager:
             log.error(f"Error getting rebalancing advice: {e}")
             return "Consider diversifying your SEI holdings or exploring DeFi yield opportunities for better risk management."
 
+    async def close(self) -> None:
+        """Close the manager's own Sei and oracle HTTP clients"""
+        await self.sei_client.aclose()
+        await self.price_oracle.close()
+
 # Global portfolio manager instance
 portfolio_manager = PortfolioManager()
@@ -1,9 +1,19 @@
 from __future__ import annotations
 import asyncio
+import math
 import time
 import logging
+from abc import ABC, abstractmethod
+from enum import Enum
 from typing import Dict, Optional
 import httpx
+from src.services._json import HTTP2_AVAILABLE, json_dumps, json_loads
+
+# redis is optional; only needed when CACHE_BACKEND=redis
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
 
 log = logging.getLogger(__name__)
 
@@ -14,6 +24,75 @@ RIVALZ_ADCS_BASE_URL = settings.RIVALZ_ADCS_BASE_URL
 RIVALZ_ADCS_API_KEY = settings.RIVALZ_ADCS_API_KEY
 RIVALZ_ADCS_TEST_MODE = settings.RIVALZ_ADCS_TEST_MODE
 
+_PRICE_CACHE_MAX = 256  # entries held before expired ones are swept, then oldest evicted
+
+class CacheState(Enum):
+    FRESH = "fresh"   # within the symbol's TTL
+    STALE = "stale"   # expired but inside the grace window; serve it and refresh
+    MISS = "miss"     # nothing usable, caller has to wait for a fetch
+
+class CacheBackend(ABC):
+    """
+    Shared (L2) price store behind PriceOracle's in-process cache, so several bot
+    processes and restarts reuse each other's lookups. Entries are (price, wall-clock timestamp);
+    failures must be swallowed, a cache outage only costs upstream calls.
+    """
+    
+    @abstractmethod
+    async def get(self, symbol: str) -> Optional[tuple[float, float]]:
+        ...
+    
+    async def get_many(self, symbols: list[str]) -> Dict[str, tuple[float, float]]:
+        entries = await asyncio.gather(*[self.get(s) for s in symbols])
+        return {s: e for s, e in zip(symbols, entries) if e is not None}
+    
+    @abstractmethod
+    async def set(self, symbol: str, price: float, timestamp: float, ttl: float) -> None:
+        ...
+    
+    async def close(self) -> None:
+        pass
+
+class RedisBackend(CacheBackend):
+    """Prices as SETEX'd JSON [price, timestamp] under one key per symbol"""
+    
+    def __init__(self, url: str, prefix: str = "seiagent:price:"):
+        self._redis = aioredis.from_url(url)
+        self._prefix = prefix
+    
+    async def get(self, symbol: str) -> Optional[tuple[float, float]]:
+        return (await self.get_many([symbol])).get(symbol)
+    
+    async def get_many(self, symbols: list[str]) -> Dict[str, tuple[float, float]]:
+        entries = {}
+        try:
+            raw = await self._redis.mget([self._prefix + s for s in symbols])
+            for symbol, value in zip(symbols, raw):
+                if value is not None:
+                    price, timestamp = json_loads(value)
+                    entries[symbol] = (float(price), float(timestamp))
+        except Exception as e:
+            log.warning("Redis price cache read failed: %s", e)
+        return entries
+    
+    async def set(self, symbol: str, price: float, timestamp: float, ttl: float) -> None:
+        try:
+            await self._redis.setex(self._prefix + symbol, max(1, math.ceil(ttl)), json_dumps([price, timestamp]))
+        except Exception as e:
+            log.warning("Redis price cache write failed for %s: %s", symbol, e)
+    
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+def _make_cache_backend() -> Optional[CacheBackend]:
+    """The configured L2 backend, or None for in-process caching only"""
+    if settings.CACHE_BACKEND != "redis":
+        return None
+    if aioredis is None:
+        log.warning("CACHE_BACKEND=redis but the redis package is not installed, caching in-process only")
+        return None
+    return RedisBackend(settings.REDIS_URL)
+
 class PriceOracle:
     """
     Price oracle service using Rivalz ADCS as primary source with fallback mechanisms.
@@ -23,9 +102,32 @@ class PriceOracle:
     """
     
     def __init__(self):
-        self._cache: Dict[str, tuple[float, float]] = {}  # symbol -> (price, timestamp)
-        self._cache_ttl = 5.0  # 5 seconds TTL
+        self._cache: Dict[str, tuple[float, float]] = {}  # symbol -> (price, monotonic timestamp)
+        # Optional shared cache; self._cache stays in front of it as L1
+        self._backend = _make_cache_backend()
+        self._cache_ttl: Dict[str, float] = dict(settings.PRICE_CACHE_TTLS)
+        self._default_ttl = settings.PRICE_CACHE_DEFAULT_TTL
+        self._stale_grace = settings.PRICE_STALE_GRACE_S
+        # Background stale-while-revalidate refreshes, one per symbol at most
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        # Upstream lookups in progress; concurrent misses for a symbol await the same one
+        self._inflight: Dict[str, asyncio.Future] = {}
         self._http_client: Optional[httpx.AsyncClient] = None
+        # Caps concurrent upstream lookups so one large get_prices can't flood Rivalz
+        self._fetch_sem = asyncio.Semaphore(10)
+        # Whether Rivalz answers /price?symbols=...; None until the first bulk call
+        self._bulk_endpoint_supported: Optional[bool] = None
+        # Live Rivalz lookups need a key and test mode off; fixed for the process lifetime
+        self._rivalz_enabled = bool(RIVALZ_ADCS_API_KEY) and not RIVALZ_ADCS_TEST_MODE
+        if not RIVALZ_ADCS_API_KEY and not RIVALZ_ADCS_TEST_MODE:
+            log.info("Rivalz ADCS API key not configured, using fallback prices")
+        # Request pieces that never change, built once instead of per call
+        self._rivalz_url = f"{RIVALZ_ADCS_BASE_URL}/price"
+        self._rivalz_url_prefix = self._rivalz_url + "/"
+        self._rivalz_headers = {
+            "Authorization": f"Bearer {RIVALZ_ADCS_API_KEY}",
+            "Content-Type": "application/json"
+        }
         
         # Fallback static prices for testnet (placeholder values)
         self._fallback_prices = {
@@ -36,15 +138,25 @@ class PriceOracle:
             "SOL": 100.0,    # Placeholder
         }
         
-        # Supported symbols
-        self._supported_symbols = set(self._fallback_prices.keys())
+        # Supported symbols, and the tail of the error for anything else (built once)
+        self._supported_symbols = frozenset(self._fallback_prices)
+        self._supported_msg = ", ".join(sorted(self._supported_symbols))
     
     async def _get_http_client(self) -> httpx.AsyncClient:
         """Get or create HTTP client with proper configuration"""
         if self._http_client is None:
             self._http_client = httpx.AsyncClient(
-                timeout=httpx.Timeout(10.0),  # 10 second timeout for API calls
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
+                timeout=httpx.Timeout(10.0, connect=3.0),  # 10 second timeout for API calls
+                # Limits go on the transport so the pool caps actually apply
+                transport=httpx.AsyncHTTPTransport(
+                    retries=1,
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=100,
+                        max_keepalive_connections=20,
+                        keepalive_expiry=30.0,
+                    ),
+                ),
             )
         return self._http_client
     
@@ -62,59 +174,100 @@ class PriceOracle:
         try:
             client = await self._get_http_client()
             
-            # Rivalz ADCS API endpoint for price data
+            # Rivalz ADCS API endpoint for price data; symbol arrives uppercased
             # Based on Rivalz documentation: https://console.rivalz.ai/
-            url = f"{RIVALZ_ADCS_BASE_URL}/price/{symbol.upper()}"
-            headers = {
-                "Authorization": f"Bearer {RIVALZ_ADCS_API_KEY}",
-                "Content-Type": "application/json"
-            }
+            url = self._rivalz_url_prefix + symbol
             
-
-            
-            log.info(f"Making Rivalz ADCS request to: {url}")
+            log.debug("Making Rivalz ADCS request to: %s", url)
             
             # Simple GET request to price endpoint
-            response = await client.get(url, headers=headers)
+            response = await client.get(url, headers=self._rivalz_headers)
             
-            log.info(f"Rivalz ADCS response status: {response.status_code}")
-            log.info(f"Rivalz ADCS response headers: {response.headers}")
-            log.info(f"Rivalz ADCS response text: {response.text[:500]}...")  # First 500 chars
+            # Response dumps are debug-only; skip building them otherwise
+            debug = log.isEnabledFor(logging.DEBUG)
+            if debug:
+                log.debug("Rivalz ADCS response status: %s", response.status_code)
+                log.debug("Rivalz ADCS response headers: %s", response.headers)
+                log.debug("Rivalz ADCS response text: %s...", response.text[:500])
             
             if response.status_code == 200:
                 try:
-                    data = response.json()
-                    log.info(f"Rivalz ADCS response data: {data}")
+                    data = json_loads(response.content)
+                    if debug:
+                        log.debug("Rivalz ADCS response data: %s", data)
                     # Extract price from Rivalz ADCS response
                     price = data.get("price")
                     if price and isinstance(price, (int, float)):
-                        log.info(f"Successfully fetched {symbol} price from Rivalz ADCS: ${price}")
+                        log.debug("Fetched %s price from Rivalz ADCS: $%s", symbol, price)
                         return float(price)
                     else:
-                        log.warning(f"Invalid price data in Rivalz ADCS response for {symbol}: {data}")
+                        log.warning("Invalid price data in Rivalz ADCS response for %s: %s", symbol, data)
                 except Exception as e:
-                    log.error(f"Error parsing Rivalz ADCS JSON response: {e}")
-                    log.error(f"Response text: {response.text}")
+                    log.error("Error parsing Rivalz ADCS JSON response: %s", e)
+                    log.error("Response text: %s", response.text)
             
-            log.warning(f"Rivalz ADCS returned status {response.status_code} for {symbol}: {response.text}")
+            log.warning("Rivalz ADCS returned status %s for %s: %s", response.status_code, symbol, response.text)
             return None
             
         except httpx.TimeoutException:
-            log.warning(f"Rivalz ADCS timeout for {symbol}")
+            log.warning("Rivalz ADCS timeout for %s", symbol)
             return None
         except httpx.HTTPStatusError as e:
-            log.warning(f"Rivalz ADCS HTTP error for {symbol}: {e.response.status_code} - {e.response.text}")
+            log.warning("Rivalz ADCS HTTP error for %s: %s - %s", symbol, e.response.status_code, e.response.text)
             return None
         except Exception as e:
-            log.error(f"Unexpected error fetching {symbol} from Rivalz ADCS: {str(e)}")
+            log.error("Unexpected error fetching %s from Rivalz ADCS: %s", symbol, e)
             return None
     
+    async def _try_rivalz_adcs_bulk(self, symbols: list[str]) -> Dict[str, float]:
+        """
+        Fetch several symbols from Rivalz ADCS in one round trip via /price?symbols=A,B,C.
+        
+        Expects {"prices": {"SEI": 0.85, ...}}. A 404 marks the bulk endpoint as
+        unsupported so later calls go straight to per-symbol GETs. Every price that
+        comes back is cached; symbols missing from the response are left to the caller.
+        """
+        if not RIVALZ_ADCS_API_KEY or self._bulk_endpoint_supported is False:
+            return {}
+        
+        try:
+            client = await self._get_http_client()
+            response = await client.get(
+                self._rivalz_url, headers=self._rivalz_headers, params={"symbols": ",".join(symbols)}
+            )
+            
+            if response.status_code == 404:
+                log.info("Rivalz ADCS bulk price endpoint not available, using per-symbol requests")
+                self._bulk_endpoint_supported = False
+                return {}
+            if response.status_code != 200:
+                log.warning("Rivalz ADCS bulk request returned status %s", response.status_code)
+                return {}
+            
+            data = json_loads(response.content).get("prices") or {}
+            self._bulk_endpoint_supported = True
+        except httpx.TimeoutException:
+            log.warning("Rivalz ADCS bulk timeout for %s", ', '.join(symbols))
+            return {}
+        except Exception as e:
+            log.error("Unexpected error in Rivalz ADCS bulk request: %s", e)
+            return {}
+        
+        prices = {}
+        for symbol in symbols:
+            price = data.get(symbol)
+            if price and isinstance(price, (int, float)):
+                prices[symbol] = float(price)
+        await asyncio.gather(*[self._update_cache(symbol, price) for symbol, price in prices.items()])
+        log.info("Fetched %s/%s prices from Rivalz ADCS bulk endpoint", len(prices), len(symbols))
+        return prices
+    
     async def _try_rivalz_adcs_test_mode(self, symbol: str) -> Optional[float]:
         """
         Test mode for Rivalz ADCS - simulates real API responses
         Use this for development and testing when real API is not available
         """
-        log.info(f"TEST MODE: Attempting to get price for {symbol}")
+        log.info("TEST MODE: Attempting to get price for %s", symbol)
         
         # Simulate realistic Rivalz ADCS responses
         test_prices = {
@@ -129,34 +282,88 @@ class PriceOracle:
         await asyncio.sleep(0.1)
         
         price = test_prices.get(symbol.upper())
-        log.info(f"TEST MODE: Found price for {symbol}: {price}")
+        log.info("TEST MODE: Found price for %s: %s", symbol, price)
         
         if price is not None:
-            log.info(f"TEST MODE: Simulated {symbol} price from Rivalz ADCS: {price}")
+            log.info("TEST MODE: Simulated %s price from Rivalz ADCS: %s", symbol, price)
             return price
         
-        log.warning(f"TEST MODE: No price found for {symbol}")
+        log.warning("TEST MODE: No price found for %s", symbol)
         return None
     
     def _get_fallback_price(self, symbol: str) -> Optional[float]:
         """Get fallback price from static mapping"""
         price = self._fallback_prices.get(symbol.upper())
         if price is not None:
-            log.info(f"Using fallback price for {symbol}: {price}")
+            log.info("Using fallback price for %s: %s", symbol, price)
         return price
     
+    def _cache_state(self, symbol: str) -> CacheState:
+        """FRESH, STALE (servable while refreshing) or MISS for a cached price"""
+        entry = self._cache.get(symbol)
+        if entry is None:
+            return CacheState.MISS
+        return self._state_for_age(symbol, time.monotonic() - entry[1])
+    
+    def _state_for_age(self, symbol: str, age: float) -> CacheState:
+        ttl = self._cache_ttl.get(symbol, self._default_ttl)
+        if age < ttl:
+            return CacheState.FRESH
+        if age < ttl + self._stale_grace:
+            return CacheState.STALE
+        return CacheState.MISS
+    
     def _is_cache_valid(self, symbol: str) -> bool:
-        """Check if cached price is still valid"""
-        if symbol not in self._cache:
-            return False
-        
-        price, timestamp = self._cache[symbol]
-        return (time.time() - timestamp) < self._cache_ttl
+        """Check if cached price is still fresh"""
+        return self._cache_state(symbol) is CacheState.FRESH
+    
+    def _schedule_refresh(self, symbol: str) -> None:
+        """Refresh a stale price in the background unless that's already underway"""
+        if symbol in self._refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh(symbol))
+        self._refresh_tasks[symbol] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(symbol, None))
+    
+    async def _refresh(self, symbol: str) -> None:
+        try:
+            async with self._fetch_sem:
+                await self._fetch_one(symbol)
+        except ValueError as e:
+            log.warning("Background refresh failed for %s: %s", symbol, e)
+    
+    def _store_local(self, symbol: str, entry: tuple[float, float]) -> None:
+        """Write to the in-process cache, keeping it at most _PRICE_CACHE_MAX entries"""
+        # Re-inserting moves the symbol to the end, so dict order is oldest write first
+        self._cache.pop(symbol, None)
+        if len(self._cache) >= _PRICE_CACHE_MAX:
+            for key in [k for k in self._cache if self._cache_state(k) is CacheState.MISS]:
+                del self._cache[key]
+            if len(self._cache) >= _PRICE_CACHE_MAX:
+                del self._cache[next(iter(self._cache))]
+        self._cache[symbol] = entry
     
-    def _update_cache(self, symbol: str, price: float) -> None:
-        """Update price cache with current timestamp"""
-        self._cache[symbol] = (price, time.time())
-        log.debug(f"Updated cache for {symbol}: {price}")
+    async def _update_cache(self, symbol: str, price: float) -> None:
+        """Update price cache (and the shared backend, if any) with current timestamp"""
+        self._store_local(symbol, (price, time.monotonic()))
+        log.debug("Updated cache for %s: %s", symbol, price)
+        if self._backend is not None:
+            # Kept through the stale window so other processes can serve it stale too.
+            # Monotonic clocks aren't comparable across processes, so L2 gets wall-clock time
+            ttl = self._cache_ttl.get(symbol, self._default_ttl) + self._stale_grace
+            await self._backend.set(symbol, price, time.time(), ttl)
+    
+    async def _load_shared(self, symbols: list[str]) -> Dict[str, float]:
+        """Fresh prices another process already fetched; copied into the local cache"""
+        if self._backend is None or not symbols:
+            return {}
+        prices = {}
+        for symbol, (price, written_at) in (await self._backend.get_many(symbols)).items():
+            age = time.time() - written_at
+            if self._state_for_age(symbol, age) is CacheState.FRESH:
+                self._store_local(symbol, (price, time.monotonic() - age))
+                prices[symbol] = price
+        return prices
     
     async def get_price(self, symbol: str) -> float:
         """
@@ -175,19 +382,53 @@ class PriceOracle:
         
         # Validate symbol
         if symbol not in self._supported_symbols:
-            raise ValueError(f"Unsupported symbol: {symbol}. Supported: {', '.join(self._supported_symbols)}")
+            raise ValueError(f"Unsupported symbol: {symbol}. Supported: {self._supported_msg}")
         
-        # Check cache first
-        if self._is_cache_valid(symbol):
+        # Check cache first; a stale price is returned right away and refreshed behind it
+        state = self._cache_state(symbol)
+        if state is not CacheState.MISS:
             price, _ = self._cache[symbol]
-            log.debug(f"Returning cached price for {symbol}: {price}")
+            if state is CacheState.STALE:
+                self._schedule_refresh(symbol)
+            log.debug("Returning %s cached price for %s: %s", state.value, symbol, price)
             return price
         
+        return await self._fetch_one(symbol)
+    
+    async def _fetch_one(self, symbol: str) -> float:
+        """Uncached lookup for an already-validated symbol; updates the cache.
+        Callers that arrive while a lookup for the symbol is running share its result"""
+        fut = self._inflight.get(symbol)
+        if fut is not None:
+            # Shielded so a cancelled waiter can't cancel the lookup for everyone else
+            return await asyncio.shield(fut)
+        
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[symbol] = fut
+        try:
+            price = (await self._load_shared([symbol])).get(symbol)
+            if price is None:
+                price = await self._fetch_uncached(symbol)
+            fut.set_result(price)
+            return price
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # the leader re-raises it, so don't warn if nobody else waited
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()
+            del self._inflight[symbol]
+    
+    async def _fetch_uncached(self, symbol: str) -> float:
+        """One lookup against Rivalz ADCS, falling back to static prices"""
         # Try Rivalz ADCS first
-        if RIVALZ_ADCS_TEST_MODE:
+        if self._rivalz_enabled:
+            price = await self._try_rivalz_adcs(symbol)
+        elif RIVALZ_ADCS_TEST_MODE:
             price = await self._try_rivalz_adcs_test_mode(symbol)
         else:
-            price = await self._try_rivalz_adcs(symbol)
+            price = None
         
         # Fallback to static prices if Rivalz unavailable
         if price is None:
@@ -197,7 +438,7 @@ class PriceOracle:
             raise ValueError(f"Unable to fetch price for {symbol} from any source")
         
         # Update cache
-        self._update_cache(symbol, price)
+        await self._update_cache(symbol, price)
         return price
     
     async def get_prices(self, symbols: list[str]) -> Dict[str, float]:
@@ -211,26 +452,72 @@ class PriceOracle:
             Dictionary mapping symbols to prices
         """
         results = {}
+        misses = []
+        # Sort out cache hits and unsupported symbols first, no awaits needed
         for symbol in symbols:
-            try:
-                results[symbol] = await self.get_price(symbol)
-            except ValueError as e:
-                log.warning(f"Skipping {symbol}: {str(e)}")
+            upper = symbol.upper()
+            if upper not in self._supported_symbols:
+                log.warning("Skipping %s: Unsupported symbol: %s", symbol, upper)
+                continue
+            state = self._cache_state(upper)
+            if state is CacheState.MISS:
+                misses.append((symbol, upper))
                 continue
+            if state is CacheState.STALE:
+                self._schedule_refresh(upper)
+            results[symbol] = self._cache[upper][0]
+        
+        def take(found: Dict[str, float]) -> list[tuple[str, str]]:
+            """Record prices found for some misses, return the ones still missing"""
+            remaining = []
+            for symbol, upper in misses:
+                price = found.get(upper)
+                if price is None:
+                    remaining.append((symbol, upper))
+                else:
+                    results[symbol] = price
+            return remaining
+        
+        # The shared cache, then one bulk round trip; whatever they don't cover falls through below
+        if misses and self._backend is not None:
+            misses = take(await self._load_shared(sorted({upper for _, upper in misses})))
+        if len(misses) > 1 and self._rivalz_enabled:
+            bulk = await self._try_rivalz_adcs_bulk(sorted({upper for _, upper in misses}))
+            if bulk:
+                misses = take(bulk)
+        
+        async def fetch(upper: str) -> float:
+            async with self._fetch_sem:
+                return await self._fetch_one(upper)
+        
+        # The rest are network-bound, so look them up concurrently
+        prices = await asyncio.gather(*[fetch(upper) for _, upper in misses], return_exceptions=True)
+        for (symbol, _), price in zip(misses, prices):
+            if isinstance(price, ValueError):
+                log.warning("Skipping %s: %s", symbol, price)
+            elif isinstance(price, BaseException):
+                raise price
+            else:
+                results[symbol] = price
         return results
     
+    async def __aenter__(self) -> PriceOracle:
+        return self
+    
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+    
     async def close(self) -> None:
-        """Close HTTP client and cleanup resources"""
+        """Close HTTP client and cleanup resources. Owners must await this (or use
+        `async with`); nothing closes the client on garbage collection"""
+        for task in list(self._refresh_tasks.values()):
+            task.cancel()
+        if self._refresh_tasks:
+            await asyncio.gather(*self._refresh_tasks.values(), return_exceptions=True)
         if self._http_client:
             await self._http_client.aclose()
             self._http_client = None
+        if self._backend is not None:
+            await self._backend.close()
+            self._backend = None
         log.info("PriceOracle HTTP client closed")
-    
-    def __del__(self):
-        """Cleanup on deletion"""
-        if self._http_client:
-            # Note: This is not ideal but prevents resource leaks
-            try:
-                asyncio.create_task(self.close())
-            except RuntimeError:
-                pass  # Event loop not running
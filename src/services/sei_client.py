@@ -1,12 +1,46 @@
 from __future__ import annotations
+import asyncio
 from dataclasses import dataclass
 import httpx
-import json
 import logging
 import re
+from src.services._json import HTTP2_AVAILABLE, json_dumps, json_loads
 
 log = logging.getLogger(__name__)
 
+# Address formats, compiled once and shared with the handlers
+EVM_ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+SEI_ADDRESS_RE = re.compile(r'^sei1[0-9a-z]{38}$')
+
+# Both formats in one pattern, so validate_address's success path is a single C-level scan
+_ADDRESS_RE = re.compile(r'0x[0-9a-fA-F]{40}|sei1[0-9a-z]{38}')
+
+_WEI_PER_SEI = 10 ** 18
+
+def _hex_to_wei(balance_hex: str) -> int:
+    """Parse an RPC quantity ("0x...") to wei; int() takes the 0x prefix as-is"""
+    return int(balance_hex, 16)
+
+def _format_sei(wei: int) -> str:
+    """Exact wei -> SEI decimal string, no float rounding"""
+    return f"{wei // _WEI_PER_SEI}.{wei % _WEI_PER_SEI:018d}"
+
+def validate_address(address: str) -> tuple[bool, str]:
+    """
+    Validate address format and return (is_valid, error_message).
+    Pure string check, so handlers can reject bad input without a client.
+    """
+    address = address.strip()
+    if _ADDRESS_RE.fullmatch(address):
+        return True, ""
+    
+    # Invalid; the prefix only picks the error message
+    if address.startswith('0x'):
+        return False, "Invalid EVM address format. Must be 42 characters starting with 0x followed by 40 hex characters."
+    if address.startswith('sei'):
+        return False, "Invalid SEI address format. Must start with 'sei1' followed by 38 lowercase alphanumeric characters."
+    return False, "Address must start with '0x' (EVM) or 'sei' (SEI native)."
+
 @dataclass(slots=True)
 class SeiTxResult:
     tx_hash: str
@@ -21,30 +55,59 @@ class SeiClient:
         self.rpc_url = rpc_url
         self.chain_id = chain_id
         self.explorer_base = explorer_base
+        self._client: httpx.AsyncClient | None = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, created on first use; timeouts are set per call"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0),
+                # Limits go on the transport so the pool caps actually apply
+                transport=httpx.AsyncHTTPTransport(
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=20,
+                        max_connections=100,
+                        keepalive_expiry=30.0,
+                    ),
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def validate_address(self, address: str) -> tuple[bool, str]:
         """
         Validate address format and return (is_valid, error_message)
         """
-        address = address.strip()
-        
-        # EVM address validation
-        if address.startswith('0x'):
-            if not re.match(r'^0x[a-fA-F0-9]{40}$', address):
-                return False, "Invalid EVM address format. Must be 42 characters starting with 0x followed by 40 hex characters."
-            return True, ""
-        
-        # SEI address validation
-        elif address.startswith('sei'):
-            if not re.match(r'^sei[a-zA-Z0-9]{38}$', address):
-                return False, "Invalid SEI address format. Must start with 'sei' followed by 38 alphanumeric characters."
-            return True, ""
-        
-        else:
-            return False, "Address must start with '0x' (EVM) or 'sei' (SEI native)."
+        return validate_address(address)
 
     async def get_chain_info(self) -> dict:
-        """Get basic chain information"""
+        """
+        Get basic chain information, probing the RPC with eth_chainId.
+        Raises if the endpoint is unreachable or returns no result.
+        """
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "eth_chainId",
+            "params": [],
+            "id": 1
+        }
+        client = await self._get_client()
+        response = await client.post(
+            self.rpc_url,
+            content=json_dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=10.0
+        )
+        response.raise_for_status()
+        result = json_loads(response.content)
+        if "result" not in result:
+            raise RuntimeError(f"eth_chainId returned no result: {result.get('error')}")
         return {"chain_id": self.chain_id, "rpc": self.rpc_url}
 
     async def send_dummy_tx(self) -> SeiTxResult:
@@ -53,6 +116,36 @@ class SeiClient:
         url = f"{self.explorer_base}/tx/{fake_hash}" if self.explorer_base else None
         return SeiTxResult(tx_hash=fake_hash, explorer_url=url)
 
+    async def _eth_get_balance(self, address: str, rpc_url: str) -> int | None:
+        """
+        One eth_getBalance call for an already-validated EVM address.
+        Returns wei, or None (logged) on a non-200 or malformed response; transport
+        errors propagate to the caller.
+        """
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "eth_getBalance",
+            "params": [address, "latest"],
+            "id": 1
+        }
+        
+        client = await self._get_client()
+        response = await client.post(
+            rpc_url,
+            content=json_dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=30.0
+        )
+        
+        if response.status_code != 200:
+            log.error("EVM RPC request failed with status %s: %s", response.status_code, response.text)
+            return None
+        result = json_loads(response.content)
+        if "result" not in result or not result["result"]:
+            log.error("Invalid EVM RPC response format: %s", result)
+            return None
+        return _hex_to_wei(result["result"])
+
     async def get_balance(self, address: str) -> list:
         """
         Get balance for an address using EVM RPC eth_getBalance
@@ -62,7 +155,7 @@ class SeiClient:
             # Validate address format
             is_valid, error_msg = self.validate_address(address)
             if not is_valid:
-                log.warning(f"Invalid address format: {address} - {error_msg}")
+                log.warning("Invalid address format: %s - %s", address, error_msg)
                 return []
             
             # Convert sei address to EVM address if needed
@@ -70,45 +163,20 @@ class SeiClient:
             if address.startswith('sei'):
                 # TODO: Implement sei to EVM address conversion
                 # For now, return empty if it's a sei address
-                log.warning(f"SEI address conversion not implemented yet: {address}")
+                log.warning("SEI address conversion not implemented yet: %s", address)
                 return []
             
-            # Use EVM RPC method to get balance
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_getBalance",
-                "params": [evm_address, "latest"],
-                "id": 1
-            }
+            balance_wei = await self._eth_get_balance(evm_address, self.rpc_url)
+            if balance_wei is None:
+                return []
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.rpc_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "result" in result and result["result"]:
-                        # Convert hex balance to decimal
-                        balance_hex = result["result"]
-                        balance_wei = int(balance_hex, 16)
-                        balance_sei = balance_wei / (10 ** 18)  # Convert from wei to SEI
-                        
-                        return [{
-                            "amount": str(balance_sei),
-                            "denom": "usei"
-                        }]
-                    else:
-                        log.error(f"Invalid response format: {result}")
-                        return []
-                else:
-                    log.error(f"RPC request failed with status {response.status_code}: {response.text}")
-                    return []
+            return [{
+                "amount": _format_sei(balance_wei),
+                "denom": "usei"
+            }]
                     
         except Exception as e:
-            log.error(f"Error getting balance for {address}: {str(e)}")
+            log.error("Error getting balance for %s: %s", address, e)
             return []
 
     async def get_native_balance(self, address: str) -> list:
@@ -121,16 +189,16 @@ class SeiClient:
             rest_url = "https://rest-testnet.sei-apis.com"
             url = f"{rest_url}/cosmos/bank/v1beta1/balances/{address}"
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url)
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("balances", [])
-                else:
-                    log.warning(f"Cosmos REST API failed: {response.status_code} - {response.text}")
-                    return []
+            client = await self._get_client()
+            response = await client.get(url, timeout=30.0)
+            if response.status_code == 200:
+                data = json_loads(response.content)
+                return data.get("balances", [])
+            else:
+                log.warning("Cosmos REST API failed: %s - %s", response.status_code, response.text)
+                return []
         except Exception as e:
-            log.error(f"Error getting native balance: {str(e)}")
+            log.error("Error getting native balance: %s", e)
             return []
 
     async def test_connection(self) -> bool:
@@ -138,27 +206,10 @@ class SeiClient:
         Test if the RPC endpoint is accessible
         """
         try:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_chainId",
-                "params": [],
-                "id": 1
-            }
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    self.rpc_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return "result" in result
-                return False
-                
+            await self.get_chain_info()
+            return True
         except Exception as e:
-            log.error(f"Connection test failed: {str(e)}")
+            log.error("Connection test failed: %s", e)
             return False
 
     async def get_evm_native_balance(self, address: str, rpc_url: str) -> int:
@@ -174,42 +225,104 @@ class SeiClient:
         """
         try:
             # Validate EVM address format
-            if not address.startswith('0x') or len(address) != 42:
-                log.error(f"Invalid EVM address format: {address}")
+            if not EVM_ADDRESS_RE.match(address):
+                log.error("Invalid EVM address format: %s", address)
+                return 0
+            
+            balance_wei = await self._eth_get_balance(address, rpc_url)
+            if balance_wei is None:
                 return 0
+            log.info("EVM balance for %s: %s wei", address, balance_wei)
+            return balance_wei
+                    
+        except Exception as e:
+            log.error("Error getting EVM balance for %s: %s", address, e)
+            return 0
+
+    async def get_evm_native_balances_batch(self, addresses: list[str], rpc_url: str) -> dict[str, int]:
+        """
+        Get EVM native balances for many addresses in one JSON-RPC batch request.
+        
+        Args:
+            addresses: EVM addresses (0x...)
+            rpc_url: EVM RPC endpoint URL
             
-            payload = {
+        Returns:
+            {address: balance in wei}; 0 for invalid addresses. Addresses whose
+            lookup failed are left out, so callers can tell them from a real 0
+        """
+        balances = {address: 0 for address in addresses if not EVM_ADDRESS_RE.match(address)}
+        valid = [address for address in addresses if address not in balances]
+        if len(valid) != len(addresses):
+            log.error("Skipping %s invalid EVM addresses in balance batch", len(addresses) - len(valid))
+        if not valid:
+            return balances
+        
+        payload = [
+            {
                 "jsonrpc": "2.0",
                 "method": "eth_getBalance",
                 "params": [address, "latest"],
-                "id": 1
+                "id": i
             }
+            for i, address in enumerate(valid)
+        ]
+        
+        try:
+            client = await self._get_client()
+            response = await client.post(
+                rpc_url,
+                content=json_dumps(payload),
+                headers={"Content-Type": "application/json"},
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                log.error("EVM RPC batch request failed with status %s: %s", response.status_code, response.text)
+                return balances
+            
+            results = json_loads(response.content)
+            if not isinstance(results, list):
+                # Provider doesn't accept batches; fall back to one call per address
+                log.warning("EVM RPC rejected batch request, fetching balances individually")
+                for address in valid:
+                    try:
+                        balance_wei = await self._eth_get_balance(address, rpc_url)
+                    except Exception as e:
+                        log.error("Error getting EVM balance for %s: %s", address, e)
+                        continue
+                    if balance_wei is not None:
+                        balances[address] = balance_wei
+                return balances
+            
+            for item in results:
+                i = item.get("id") if isinstance(item, dict) else None
+                if isinstance(i, int) and 0 <= i < len(valid) and item.get("result"):
+                    balances[valid[i]] = _hex_to_wei(item["result"])
+            log.info("EVM balances fetched for %s addresses in one batch", len(valid))
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    rpc_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "result" in result and result["result"]:
-                        # Convert hex balance to decimal wei
-                        balance_hex = result["result"]
-                        balance_wei = int(balance_hex, 16)
-                        log.info(f"EVM balance for {address}: {balance_wei} wei")
-                        return balance_wei
-                    else:
-                        log.error(f"Invalid EVM RPC response format: {result}")
-                        return 0
-                else:
-                    log.error(f"EVM RPC request failed with status {response.status_code}: {response.text}")
-                    return 0
-                    
         except Exception as e:
-            log.error(f"Error getting EVM balance for {address}: {str(e)}")
-            return 0
+            log.error("Error getting EVM balances for %s addresses: %s", len(valid), e)
+        
+        return balances
+
+    async def get_native_sei_balances(self, addresses: list[str], lcd_base_url: str,
+                                      concurrency: int = 5) -> dict[str, int]:
+        """
+        Bulk form of get_native_sei_balance. The LCD has no batch endpoint, so this
+        fans out per address with at most `concurrency` requests in flight.
+        
+        Returns:
+            {address: balance in usei}; addresses whose lookup failed are left out
+        """
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def one(address: str) -> int | None:
+            async with sem:
+                return await self._lcd_get_balance(address, lcd_base_url)
+        
+        balances = await asyncio.gather(*[one(address) for address in addresses])
+        return {address: balance for address, balance in zip(addresses, balances) if balance is not None}
 
     async def get_native_sei_balance(self, address: str, lcd_base_url: str) -> int:
         """
@@ -222,37 +335,42 @@ class SeiClient:
         Returns:
             Balance in usei (int)
         """
+        balance_usei = await self._lcd_get_balance(address, lcd_base_url)
+        return 0 if balance_usei is None else balance_usei
+
+    async def _lcd_get_balance(self, address: str, lcd_base_url: str) -> int | None:
+        """
+        get_native_sei_balance without the failure fallback: 0 for an invalid
+        address, None (logged) when the lookup itself failed
+        """
         try:
             # Validate SEI address format
-            if not address.startswith('sei') or len(address) != 41:
-                log.error(f"Invalid SEI address format: {address}")
+            if not SEI_ADDRESS_RE.match(address):
+                log.error("Invalid SEI address format: %s", address)
                 return 0
             
             url = f"{lcd_base_url}/cosmos/bank/v1beta1/balances/{address}"
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url)
+            client = await self._get_client()
+            response = await client.get(url, timeout=30.0)
+            
+            if response.status_code == 200:
+                data = json_loads(response.content)
+                balances = data.get("balances", [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    balances = data.get("balances", [])
-                    
-                    # Sum all "usei" denom balances
-                    total_usei = 0
-                    for balance in balances:
-                        if balance.get("denom") == "usei":
-                            try:
-                                amount = int(balance.get("amount", "0"))
-                                total_usei += amount
-                            except ValueError:
-                                log.warning(f"Invalid usei amount format: {balance.get('amount')}")
-                    
-                    log.info(f"Native SEI balance for {address}: {total_usei} usei")
-                    return total_usei
-                else:
-                    log.error(f"LCD REST API failed: {response.status_code} - {response.text}")
-                    return 0
+                # Sum all "usei" denom balances; isdecimal() guarantees int() succeeds
+                amounts = [b.get("amount", "0") for b in balances if b.get("denom") == "usei"]
+                valid = [int(a) for a in amounts if a.isdecimal()]
+                total_usei = sum(valid)
+                if len(valid) != len(amounts):
+                    log.warning("Skipped %s invalid usei amounts for %s", len(amounts) - len(valid), address)
+                
+                log.info("Native SEI balance for %s: %s usei", address, total_usei)
+                return total_usei
+            else:
+                log.error("LCD REST API failed: %s - %s", response.status_code, response.text)
+                return None
                     
         except Exception as e:
-            log.error(f"Error getting native SEI balance for {address}: {str(e)}")
-            return 0
+            log.error("Error getting native SEI balance for %s: %s", address, e)
+            return None
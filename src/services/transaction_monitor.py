@@ -1,152 +1,526 @@
 from __future__ import annotations
 import asyncio
+import json
 import logging
 import time
-from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Callable, List, Dict, NamedTuple, Optional, Tuple, TypedDict, Union
 import httpx
-from src.db import get_all_watches, set_last_tx_hash
+from aiolimiter import AsyncLimiter
+from src.db import get_all_watches, remove_watches_for_user, set_last_tx_hashes
 from src.config import settings
+from src.services._json import HTTP2_AVAILABLE, json_dumps, json_loads as _default_json_loads
 
 log = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# msgspec is optional; given the few block fields the scan reads, it skips everything
+# else in each block (input data, signatures, access lists, ...) without building it
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+_SlimTx = TypedDict("_SlimTx", {"hash": Any, "from": Any, "to": Any, "value": Any}, total=False)
+
+class _SlimBlock(TypedDict, total=False):
+    number: Any
+    timestamp: Any
+    transactions: List[_SlimTx]
+
+class _BlockResponse(TypedDict, total=False):
+    id: Any
+    result: Optional[_SlimBlock]
+
+# Decodes an eth_getBlockByNumber response, or a batch of them, into plain dicts
+_decode_block_responses: Optional[Callable[[bytes], Any]] = (
+    msgspec.json.Decoder(Union[List[_BlockResponse], _BlockResponse]).decode if msgspec else None
+)
+
+# Blocks per _get_blocks call when JSON-RPC batching is off (EVM_RPC_BATCH_SIZE=0)
+_UNBATCHED_CHUNK_SIZE = 50
+
+# Fetched blocks are shared by every scan: blocks this far behind the head are kept
+# until evicted, newer ones are re-fetched after _RECENT_BLOCK_TTL in case of a reorg
+_BLOCK_CACHE_MAX = 4096
+_FINALIZED_DEPTH = 64
+_RECENT_BLOCK_TTL = 60.0
+
+_WEI_PER_SEI = 10 ** 18
+
+# Tx hashes remembered per watch so rescans of overlapping ranges don't re-notify
+_SEEN_TXS_PER_WATCH = 1024
+
+# Scans longer than this use EVM_INDEXER_URL (when set) instead of walking blocks
+_INDEXER_MIN_RANGE = 256
+
+# Formatted details of mined txs, kept until evicted; unmined lookups are retried after the TTL
+_TX_DETAIL_CACHE_MAX = 2048
+_PENDING_TX_TTL = 5.0
+
+# Telegram send errors meaning the chat will never accept messages again -> log text
+_TG_DEAD_CHAT_ERRORS = {
+    "Chat not found": "Chat not found for user {user_id}. User may need to start the bot first.",
+    "Forbidden": "Bot blocked by user {user_id}",
+    "user is deactivated": "User {user_id} is deactivated",
+    "bot was blocked": "Bot blocked by user {user_id}",
+}
+
+# Per-chat send limiters kept, least recently used evicted; an evicted chat has
+# been idle long enough that its bucket would be full again anyway
+_CHAT_LIMITERS_MAX = 1024
+
+# LCD tx-search results per (address, query), reused for SEI_TX_CACHE_TTL seconds
+_SEI_TX_CACHE_MAX = 512
+
+class EvmTx(NamedTuple):
+    """A matched EVM transaction, as returned by the block scan and the indexer.
+    Hex-encoded like eth_getBlockByNumber; only new ones become notification dicts"""
+    hash: str
+    from_: str
+    to: str
+    value: str
+    block_number: str
+    timestamp: str
+
+def _block_number(block: Dict) -> int:
+    """A fetched block's number, or -1 if it came back without a usable one"""
+    try:
+        return int(block["number"], 16)
+    except (KeyError, TypeError, ValueError):
+        return -1
+
 class TransactionMonitor:
     """Monitor watched addresses for new transactions"""
     
-    def __init__(self):
+    def __init__(self, json_loads: Optional[Callable[[str | bytes], Any]] = None):
         self._http_client: Optional[httpx.AsyncClient] = None
+        self._json_loads = json_loads or _default_json_loads
+        # Block responses only carry what the scan reads, unless a custom loader was given
+        self._decode_blocks = (json_loads is None and _decode_block_responses) or self._json_loads
+        # Calls per JSON-RPC batch request; 0 sends every block as its own request
+        self._batch_size = settings.EVM_RPC_BATCH_SIZE
+        # Explicit cap on in-flight RPC requests, rather than queueing on the pool
+        self._rpc_sem = asyncio.Semaphore(settings.EVM_RPC_MAX_CONCURRENCY)
         self.last_check_time = time.time()
+        # (monotonic ts, block number) of the last eth_blockNumber answer
+        self._head_cache: Optional[Tuple[float, int]] = None
+        self._head_lock = asyncio.Lock()
+        # block number -> (monotonic ts fetched, full block), least recently used first
+        self._block_cache: OrderedDict[int, Tuple[float, Dict]] = OrderedDict()
+        # (user_id, address) -> notified tx hashes, oldest first (dict as an ordered set)
+        self._seen_txs: Dict[Tuple[int, str], Dict[str, None]] = {}
+        # tx hash -> (monotonic expiry or None for never, details), least recently used first
+        self._tx_detail_cache: OrderedDict[str, Tuple[Optional[float], Dict]] = OrderedDict()
+        # tx hash -> lookup in progress, shared by everyone notified about the same tx
+        self._tx_detail_inflight: Dict[str, asyncio.Future] = {}
+        # (address, query) -> (monotonic ts fetched, transactions), least recently used first
+        self._sei_tx_cache: OrderedDict[Tuple[str, str], Tuple[float, List[Dict]]] = OrderedDict()
+        # Users whose chat is gone; their watches are deleted and notifications skipped
+        self._dead_users: set[int] = set()
+        # Telegram allows about one message per second per chat; the bot-wide ~30/s
+        # cap is already enforced by the application's AIORateLimiter
+        self._chat_limiters: OrderedDict[int, AsyncLimiter] = OrderedDict()
         
     async def _get_http_client(self) -> httpx.AsyncClient:
         """Get or create HTTP client"""
         if self._http_client is None:
             self._http_client = httpx.AsyncClient(
                 timeout=httpx.Timeout(15.0),
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
+                # Limits go on the transport so the pool caps actually apply; sized
+                # above EVM_RPC_MAX_CONCURRENCY so the semaphore is what throttles
+                transport=httpx.AsyncHTTPTransport(
+                    retries=1,
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=128,
+                        max_keepalive_connections=64,
+                        keepalive_expiry=30.0,
+                    ),
+                ),
             )
         return self._http_client
     
-    async def get_evm_transactions(self, address: str, block_range: int = 10) -> List[Dict]:
+    async def _rpc_post(self, client: httpx.AsyncClient, payload: Any) -> httpx.Response:
+        """POST a JSON-RPC request (or batch) to the EVM RPC, encoding it ourselves"""
+        async with self._rpc_sem:
+            return await client.post(settings.SEI_EVM_RPC_URL, content=json_dumps(payload), headers=_JSON_HEADERS)
+    
+    async def _get_latest_block(self, client: httpx.AsyncClient) -> Optional[int]:
+        """Latest EVM block number, or None if the RPC didn't answer"""
+        try:
+            response = await asyncio.wait_for(
+                self._rpc_post(client, {
+                    "jsonrpc": "2.0",
+                    "method": "eth_blockNumber",
+                    "params": [],
+                    "id": 1
+                }),
+                timeout=3.0
+            )
+            
+            if response.status_code == 200:
+                data = self._json_loads(response.content)
+                if "result" in data:
+                    latest_block = int(data["result"], 16)
+                    log.debug(f"Latest block: {latest_block}")
+                    return latest_block
+                log.error(f"Error getting latest block: {data}")
+            else:
+                log.error(f"Failed to get latest block: {response.status_code}")
+                
+        except asyncio.TimeoutError:
+            log.warning("Timeout getting latest block")
+        except Exception as e:
+            log.error(f"Error getting latest block: {e}")
+        return None
+    
+    async def _cached_head(self, client: httpx.AsyncClient, ttl: float = 1.0) -> Optional[int]:
+        """
+        Latest block, reusing the last answer for ttl seconds. Concurrent callers
+        share one in-flight eth_blockNumber instead of each issuing their own.
+        """
+        cached = self._head_cache
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        async with self._head_lock:
+            cached = self._head_cache
+            if cached and time.monotonic() - cached[0] < ttl:
+                return cached[1]
+            latest_block = await self._get_latest_block(client)
+            if latest_block is not None:
+                self._head_cache = (time.monotonic(), latest_block)
+            return latest_block
+    
+    async def get_latest_block(self) -> Optional[int]:
+        """Latest EVM block number from the short-lived head cache"""
+        return await self._cached_head(await self._get_http_client())
+    
+    async def get_evm_transactions(self, address: str, block_range: int = 10) -> List[EvmTx]:
         """Get EVM transactions for an address with optimized performance"""
+        results = await self.get_evm_transactions_batch([address], block_range)
+        return results.get(address, [])
+    
+    async def get_evm_transactions_batch(self, addresses: List[str], block_range: int = 10,
+                                         latest_block: Optional[int] = None,
+                                         start_block: Optional[int] = None) -> Dict[str, List[EvmTx]]:
+        """
+        Get EVM transactions for many addresses at once. Each recent block is
+        fetched a single time (in JSON-RPC batches) and matched against every address.
+        Callers that already know the chain head (e.g. from newHeads) pass latest_block,
+        and start_block to scan only blocks they haven't seen yet.
+        """
+        results, _ = await self.scan_evm_transactions(addresses, block_range, latest_block, start_block)
+        return results
+    
+    async def scan_evm_transactions(self, addresses: List[str], block_range: int = 10,
+                                    latest_block: Optional[int] = None,
+                                    start_block: Optional[int] = None) -> Tuple[Dict[str, List[EvmTx]], Optional[int]]:
+        """
+        get_evm_transactions_batch, plus the highest block up to which every block
+        from the start of the range was actually scanned (start - 1 if none were).
+        Blocks past a failed or timed-out batch don't count, so a caller resuming from
+        it rescans them. None if the scan couldn't run at all.
+        """
+        results: Dict[str, List[EvmTx]] = {address: [] for address in addresses}
+        if not addresses:
+            return results, latest_block
+        
         try:
             client = await self._get_http_client()
+            if latest_block is None:
+                latest_block = await self._cached_head(client)
+                if latest_block is None:
+                    return results, None
             
-            # Get latest block number
-            try:
-                response = await asyncio.wait_for(
-                    client.post(
-                        settings.SEI_EVM_RPC_URL,
-                        json={
-                            "jsonrpc": "2.0",
-                            "method": "eth_blockNumber",
-                            "params": [],
-                            "id": 1
-                        }
-                    ),
-                    timeout=3.0
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if "result" in data:
-                        latest_block = int(data["result"], 16)
-                        log.debug(f"Latest block: {latest_block}")
-                    else:
-                        log.error(f"Error getting latest block: {data}")
-                        return []
-                else:
-                    log.error(f"Failed to get latest block: {response.status_code}")
-                    return []
-                    
-            except asyncio.TimeoutError:
-                log.warning("Timeout getting latest block")
-                return []
-            except Exception as e:
-                log.error(f"Error getting latest block: {e}")
-                return []
+            if start_block is None:
+                start_block = latest_block - block_range
+            start_block = max(0, start_block, latest_block - block_range)
             
-            # Get transactions from recent blocks
-            transactions = []
-            start_block = max(0, latest_block - block_range)
+            # Long ranges go to the address-indexed explorer API when one is configured;
+            # only addresses it couldn't answer for fall through to the block scan
+            if settings.EVM_INDEXER_URL and latest_block - start_block > _INDEXER_MIN_RANGE:
+                indexed = await asyncio.gather(*[
+                    self._indexer_transactions(client, address, start_block, latest_block)
+                    for address in addresses
+                ])
+                for address, transactions in zip(addresses, indexed):
+                    if transactions is not None:
+                        results[address] = transactions
+                addresses = [address for address, transactions in zip(addresses, indexed) if transactions is None]
+                if not addresses:
+                    return results, latest_block
             
-            # Process blocks in parallel for better performance
-            block_tasks = []
-            for block_num in range(start_block, latest_block + 1):
-                task = asyncio.create_task(self._get_block_transactions(client, block_num, address))
-                block_tasks.append(task)
+            # Lowercased address -> address as the caller stored it
+            wanted = {address.lower(): address for address in addresses}
+            block_nums = list(range(start_block, latest_block + 1))
+            cached, missing = self._cached_blocks(block_nums, latest_block)
+            size = self._batch_size or _UNBATCHED_CHUNK_SIZE
+            chunks = [missing[i:i + size] for i in range(0, len(missing), size)]
             
-            # Wait for all block tasks with timeout
+            # Collect block batches as they finish; on timeout keep what already arrived
+            # (it is cached, so the next scan only fetches the rest). In-flight requests
+            # are bounded by _rpc_sem
+            fetched_blocks: List[Dict] = []
+            tasks = [asyncio.ensure_future(self._get_blocks(client, chunk)) for chunk in chunks]
             try:
-                block_results = await asyncio.wait_for(
-                    asyncio.gather(*block_tasks, return_exceptions=True),
-                    timeout=8.0
-                )
-                
-                for result in block_results:
-                    if isinstance(result, list):
-                        transactions.extend(result)
-                    elif isinstance(result, Exception):
-                        log.debug(f"Block check failed: {result}")
-                        
+                for next_done in asyncio.as_completed(tasks, timeout=8.0):
+                    try:
+                        fetched_blocks.extend(await next_done)
+                    except asyncio.TimeoutError:
+                        raise
+                    except Exception as e:
+                        log.debug(f"Block batch failed: {e}")
             except asyncio.TimeoutError:
-                log.warning("Timeout processing blocks, returning partial results")
+                log.warning(f"Timeout processing blocks, returning partial results "
+                            f"({len(fetched_blocks)}/{len(missing)} fetched)")
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self._cache_blocks(fetched_blocks)
+            blocks = sorted(cached + fetched_blocks, key=_block_number)
             
-            log.info(f"Found {len(transactions)} EVM transactions for {address}")
-            return transactions
+            scanned_to = start_block - 1
+            have = {_block_number(block) for block in blocks}
+            while scanned_to < latest_block and scanned_to + 1 in have:
+                scanned_to += 1
+            
+            found = 0
+            # Oldest block first, wherever each one came from
+            for block_data in blocks:
+                block_hex = block_data.get("number", "")
+                timestamp = block_data.get("timestamp", "0")
+                for tx in block_data.get("transactions", []):
+                    from_addr = tx.get("from") or ""
+                    to_addr = tx.get("to") or ""
+                    # Two dict lookups per tx; most match nothing, so skip building anything
+                    from_hit = wanted.get(from_addr.lower())
+                    to_hit = wanted.get(to_addr.lower())
+                    if from_hit is None and to_hit is None:
+                        continue
+                    # A self-transfer matches once
+                    for address in (from_hit, None if to_hit == from_hit else to_hit):
+                        if address is None:
+                            continue
+                        results[address].append(EvmTx(
+                            tx.get("hash", ""), from_addr, to_addr, tx.get("value", "0"), block_hex, timestamp
+                        ))
+                        found += 1
             
+            log.info(f"Found {found} EVM transactions across {len(addresses)} addresses in {len(block_nums)} blocks "
+                     f"({len(cached)} cached)")
+            return results, scanned_to
+            
+        except Exception as e:
+            log.error(f"Error getting EVM transactions for {len(addresses)} addresses: {e}")
+            return results, None
+    
+    async def _indexer_transactions(self, client: httpx.AsyncClient, address: str,
+                                    start_block: int, end_block: int) -> Optional[List[EvmTx]]:
+        """
+        An address's transactions in [start_block, end_block] from an Etherscan-compatible
+        txlist API (Blockscout, Seitrace, ...), shaped like the block-scan results.
+        None if the indexer couldn't answer, so the caller can scan blocks instead.
+        """
+        params = {
+            "module": "account",
+            "action": "txlist",
+            "address": address,
+            "startblock": start_block,
+            "endblock": end_block,
+            "sort": "asc",
+        }
+        if settings.EVM_INDEXER_API_KEY:
+            params["apikey"] = settings.EVM_INDEXER_API_KEY
+        try:
+            response = await client.get(settings.EVM_INDEXER_URL, params=params, timeout=10.0)
+            if response.status_code != 200:
+                log.debug(f"Indexer txlist for {address[:10]}... failed: {response.status_code}")
+                return None
+            data = self._json_loads(response.content)
+            rows = data.get("result")
+            if not isinstance(rows, list):
+                log.debug(f"Indexer txlist for {address[:10]}... returned {data.get('message')}")
+                return None
+            # Same hex encoding as eth_getBlockByNumber, so consumers can't tell the sources apart
+            return [
+                EvmTx(
+                    row.get("hash", ""),
+                    row.get("from") or "",
+                    row.get("to") or "",
+                    hex(int(row.get("value") or 0)),
+                    hex(int(row.get("blockNumber") or 0)),
+                    hex(int(row.get("timeStamp") or 0)),
+                )
+                for row in rows
+            ]
         except Exception as e:
-            log.error(f"Error getting EVM transactions for {address}: {e}")
+            log.debug(f"Indexer txlist for {address[:10]}... failed: {e}")
+            return None
+    
+    def _cached_blocks(self, block_nums: List[int], latest_block: int) -> Tuple[List[Dict], List[int]]:
+        """Split block_nums into usable cached blocks and the numbers still to fetch"""
+        now = time.monotonic()
+        finalized = latest_block - _FINALIZED_DEPTH
+        hits: List[Dict] = []
+        missing: List[int] = []
+        for block_num in block_nums:
+            entry = self._block_cache.get(block_num)
+            if entry is not None and (block_num <= finalized or now - entry[0] < _RECENT_BLOCK_TTL):
+                self._block_cache.move_to_end(block_num)
+                hits.append(entry[1])
+            else:
+                missing.append(block_num)
+        return hits, missing
+    
+    def _cache_blocks(self, blocks: List[Dict]) -> None:
+        now = time.monotonic()
+        for block in blocks:
+            block_num = _block_number(block)
+            if block_num < 0:
+                continue
+            self._block_cache[block_num] = (now, block)
+            self._block_cache.move_to_end(block_num)
+        while len(self._block_cache) > _BLOCK_CACHE_MAX:
+            self._block_cache.popitem(last=False)
+    
+    async def _get_blocks(self, client: httpx.AsyncClient, block_nums: List[int]) -> List[Dict]:
+        """Fetch full blocks in one JSON-RPC batch request (or one call each with batching off)"""
+        if not self._batch_size:
+            return await self._get_blocks_individually(client, block_nums)
+        
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "method": "eth_getBlockByNumber",
+                "params": [hex(block_num), True],
+                "id": block_num
+            }
+            for block_num in block_nums
+        ]
+        response = await self._rpc_post(client, payload)
+        if response.status_code != 200:
+            log.debug(f"Block batch {block_nums[0]}-{block_nums[-1]} failed: {response.status_code}")
             return []
+        
+        data = self._decode_blocks(response.content)
+        if not isinstance(data, list):
+            # Provider doesn't accept batches; fall back to one call per block
+            log.debug(f"Batch request rejected, fetching {len(block_nums)} blocks individually")
+            return await self._get_blocks_individually(client, block_nums)
+        
+        return [item["result"] for item in data if isinstance(item, dict) and item.get("result")]
     
-    async def _get_block_transactions(self, client, block_num: int, address: str) -> List[Dict]:
-        """Get transactions from a specific block for an address"""
+    async def _get_blocks_individually(self, client: httpx.AsyncClient, block_nums: List[int]) -> List[Dict]:
+        # _get_block catches its own errors, so no return_exceptions bookkeeping
+        blocks = await asyncio.gather(
+            *[self._get_block(client, block_num) for block_num in block_nums]
+        )
+        return list(filter(None, blocks))
+    
+    async def _get_block(self, client: httpx.AsyncClient, block_num: int) -> Optional[Dict]:
+        """Fetch a single full block"""
         try:
-            # Add small delay to prevent rate limiting
-            await asyncio.sleep(0.05)
-            
             response = await asyncio.wait_for(
-                client.post(
-                    settings.SEI_EVM_RPC_URL,
-                    json={
-                        "jsonrpc": "2.0",
-                        "method": "eth_getBlockByNumber",
-                        "params": [hex(block_num), True],
-                        "id": 1
-                    }
-                ),
+                self._rpc_post(client, {
+                    "jsonrpc": "2.0",
+                    "method": "eth_getBlockByNumber",
+                    "params": [hex(block_num), True],
+                    "id": 1
+                }),
                 timeout=2.0
             )
-            
             if response.status_code == 200:
-                data = response.json()
-                if "result" in data and data["result"]:
-                    block_data = data["result"]
-                    block_transactions = []
-                    
-                    for tx in block_data.get("transactions", []):
-                        from_addr = tx.get("from", "").lower()
-                        to_addr = tx.get("to", "").lower()
-                        address_lower = address.lower()
-                        
-                        if from_addr == address_lower or to_addr == address_lower:
-                            block_transactions.append({
-                                "hash": tx.get("hash", ""),
-                                "from": tx.get("from", ""),
-                                "to": tx.get("to", ""),
-                                "value": tx.get("value", "0"),
-                                "blockNumber": hex(block_num),
-                                "timestamp": block_data.get("timestamp", "0")
-                            })
-                    
-                    return block_transactions
-            
-            return []
+                return self._decode_blocks(response.content).get("result")
+            return None
             
         except asyncio.TimeoutError:
             log.debug(f"Timeout getting block {block_num}")
-            return []
+            return None
         except Exception as e:
             log.debug(f"Error getting block {block_num}: {e}")
-            return []
+            return None
+    
+    async def watch_new_heads(self, ws_url: str, on_head: Callable[[int], None]) -> None:
+        """
+        Subscribe to newHeads over the EVM WebSocket and call on_head(block_number)
+        for each block, reconnecting with backoff. Returns straight away if the
+        optional websockets package isn't installed.
+        """
+        try:
+            import websockets
+        except ImportError:
+            log.warning("websockets is not installed, watch monitoring will keep polling")
+            return
+        
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(ws_url, ping_interval=20) as ws:
+                    await ws.send(json.dumps({
+                        "jsonrpc": "2.0",
+                        "method": "eth_subscribe",
+                        "params": ["newHeads"],
+                        "id": 1
+                    }))
+                    ack = self._json_loads(await ws.recv())
+                    if "result" not in ack:
+                        raise RuntimeError(f"eth_subscribe rejected: {ack.get('error')}")
+                    log.info(f"Subscribed to newHeads on {ws_url}")
+                    backoff = 1.0
+                    
+                    async for raw in ws:
+                        head = self._json_loads(raw).get("params", {}).get("result") or {}
+                        number = head.get("number")
+                        if number:
+                            on_head(int(number, 16))
+                            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"newHeads subscription dropped ({e}), reconnecting in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+    
+    async def _search_sei_txs(self, client: httpx.AsyncClient, address: str, method: str, events: str) -> Optional[List[Dict]]:
+        """
+        One LCD tx search for an address, served from _sei_tx_cache while fresh.
+        Returns None if the query failed, so failures are retried and never cached.
+        """
+        key = (address, method)
+        now = time.monotonic()
+        cached = self._sei_tx_cache.get(key)
+        if cached is not None and now - cached[0] < settings.SEI_TX_CACHE_TTL:
+            self._sei_tx_cache.move_to_end(key)
+            return cached[1]
+        
+        response = await client.get(
+            f"{settings.SEI_LCD_URL}/cosmos/tx/v1beta1/txs",
+            params={
+                "events": events,
+                "pagination.limit": "20",
+                "order_by": "ORDER_BY_DESC"
+            }
+        )
+        if response.status_code != 200:
+            return None
+        
+        data = self._json_loads(response.content)
+        transactions = [
+            {
+                "hash": tx.get("txhash", ""),
+                "height": tx.get("height", ""),
+                "timestamp": tx.get("timestamp", ""),
+                "data": tx
+            }
+            for tx in data.get("txs") or []
+        ]
+        self._sei_tx_cache[key] = (now, transactions)
+        self._sei_tx_cache.move_to_end(key)
+        while len(self._sei_tx_cache) > _SEI_TX_CACHE_MAX:
+            self._sei_tx_cache.popitem(last=False)
+        return transactions
     
     async def get_sei_transactions(self, address: str) -> List[Dict]:
         """Get SEI native transactions for an address"""
@@ -158,52 +532,23 @@ class TransactionMonitor:
             
             # Method 1: Get transactions by address
             try:
-                response = await client.get(
-                    f"{settings.SEI_LCD_URL}/cosmos/tx/v1beta1/txs",
-                    params={
-                        "events": f"transfer.recipient='{address}' OR transfer.sender='{address}'",
-                        "pagination.limit": "20",
-                        "order_by": "ORDER_BY_DESC"
-                    }
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if "txs" in data:
-                        for tx in data["txs"]:
-                            transactions.append({
-                                "hash": tx.get("txhash", ""),
-                                "height": tx.get("height", ""),
-                                "timestamp": tx.get("timestamp", ""),
-                                "data": tx
-                            })
-                        log.info(f"Found {len(transactions)} SEI transactions via LCD for {address}")
+                transactions = await self._search_sei_txs(
+                    client, address, "transfer",
+                    f"transfer.recipient='{address}' OR transfer.sender='{address}'"
+                ) or []
+                if transactions:
+                    log.info(f"Found {len(transactions)} SEI transactions via LCD for {address}")
             except Exception as e:
                 log.error(f"Error getting SEI transactions via LCD: {e}")
             
             # Method 2: Try alternative endpoint if first one fails
             if not transactions:
                 try:
-                    response = await client.get(
-                        f"{settings.SEI_LCD_URL}/cosmos/tx/v1beta1/txs",
-                        params={
-                            "events": f"message.sender='{address}'",
-                            "pagination.limit": "20",
-                            "order_by": "ORDER_BY_DESC"
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        if "txs" in data:
-                            for tx in data["txs"]:
-                                transactions.append({
-                                    "hash": tx.get("txhash", ""),
-                                    "height": tx.get("height", ""),
-                                    "timestamp": tx.get("timestamp", ""),
-                                    "data": tx
-                                })
-                            log.info(f"Found {len(transactions)} SEI transactions via alternative method for {address}")
+                    transactions = await self._search_sei_txs(
+                        client, address, "sender", f"message.sender='{address}'"
+                    ) or []
+                    if transactions:
+                        log.info(f"Found {len(transactions)} SEI transactions via alternative method for {address}")
                 except Exception as e:
                     log.error(f"Error getting SEI transactions via alternative method: {e}")
             
@@ -213,6 +558,36 @@ class TransactionMonitor:
             log.error(f"Error getting SEI transactions for {address}: {e}")
             return []
     
+    @staticmethod
+    def _scan_block_range(last_tx_hash: Optional[str], extended_scan: bool, quick_scan: bool) -> int:
+        """How many blocks back to scan an EVM watch, based on scan type"""
+        if quick_scan:
+            return 5  # Very quick scan for recent transactions only
+        if extended_scan or last_tx_hash is None:
+            return 10000  # Extended scan for very old transactions
+        return 10  # Regular monitoring
+    
+    def seen_txs(self, user_id: int, address: str, last_tx_hash: Optional[str] = None) -> Dict[str, None]:
+        """
+        Hashes already notified for a watch (a dict used as an ordered set, for
+        membership tests only), seeded with the last hash stored for it
+        """
+        seen = self._seen_txs.setdefault((user_id, address), {})
+        if last_tx_hash:
+            seen.setdefault(last_tx_hash, None)
+        return seen
+    
+    def mark_seen(self, user_id: int, address: str, tx_hash: str) -> None:
+        """Record a notified hash for a watch, forgetting the oldest past _SEEN_TXS_PER_WATCH"""
+        seen = self._seen_txs.setdefault((user_id, address), {})
+        seen[tx_hash] = None
+        if len(seen) > _SEEN_TXS_PER_WATCH:
+            del seen[next(iter(seen))]
+    
+    def forget_watch(self, user_id: int, address: str) -> None:
+        """Drop the seen hashes of a removed watch"""
+        self._seen_txs.pop((user_id, address), None)
+    
     async def check_new_transactions(self, context=None, extended_scan: bool = False, quick_scan: bool = False) -> None:
         """Check for new transactions for all watched addresses"""
         try:
@@ -222,33 +597,75 @@ class TransactionMonitor:
             
             log.debug(f"Checking {len(watches)} watched addresses for new transactions")
             
+            # Addresses watched by several users are fetched once per scan
+            fetched: Dict[Tuple[str, int], List] = {}
+            
+            # All EVM watches sharing a block range are matched in one pass over its
+            # blocks, so each block is fetched once per scan however many watches there are
+            evm_by_range: Dict[int, List[str]] = {}
+            for _, address, last_tx_hash in watches:
+                if address.startswith('0x'):
+                    block_range = self._scan_block_range(last_tx_hash, extended_scan, quick_scan)
+                    evm_by_range.setdefault(block_range, []).append(address)
+            sei_addresses = list(dict.fromkeys(address for _, address, _ in watches if not address.startswith('0x')))
+            # One head for the whole scan, so every range group ends at the same block
+            latest_block = await self.get_latest_block() if evm_by_range else None
+            
+            # Phase 1: every fetch runs concurrently (bounded); nothing below awaits the network
+            # except notifications, which Telegram paces anyway
+            fetch_sem = asyncio.Semaphore(settings.WATCH_FETCH_CONCURRENCY)
+            
+            async def fetch_evm(block_range: int, addresses: List[str]) -> None:
+                async with fetch_sem:
+                    log.debug(f"Getting EVM transactions for {len(addresses)} addresses (block range: {block_range})")
+                    batch = await self.get_evm_transactions_batch(addresses, block_range, latest_block=latest_block)
+                for address, transactions in batch.items():
+                    fetched[(address, block_range)] = transactions
+            
+            async def fetch_sei(address: str) -> None:
+                async with fetch_sem:
+                    log.debug(f"Getting SEI transactions for {address[:10]}...")
+                    fetched[(address, 0)] = await self.get_sei_transactions(address)
+            
+            fetches = [fetch_sei(address) for address in sei_addresses]
+            if latest_block is not None:
+                fetches += [
+                    fetch_evm(block_range, list(dict.fromkeys(addresses)))
+                    for block_range, addresses in evm_by_range.items()
+                ]
+            for result in await asyncio.gather(*fetches, return_exceptions=True):
+                if isinstance(result, Exception):
+                    log.error(f"Error fetching watched transactions: {result}")
+            
+            # Phase 2: match and notify, one watch at a time
+            # Last-hash updates for every watch land in one batched write
+            rows: List[Tuple[str, int, str]] = []
+            
             for user_id, address, last_tx_hash in watches:
                 try:
                     new_transactions = []
+                    seen = self.seen_txs(user_id, address, last_tx_hash)
                     
                     if address.startswith('0x'):
-                        # EVM address - determine block range based on scan type
-                        if quick_scan:
-                            block_range = 5  # Very quick scan for recent transactions only
-                        elif extended_scan or last_tx_hash is None:
-                            block_range = 10000  # Extended scan for very old transactions
-                        else:
-                            block_range = 10   # Regular monitoring
-                        log.debug(f"Getting EVM transactions for {address[:10]}... (block range: {block_range})")
-                        transactions = await self.get_evm_transactions(address, block_range)
+                        # EVM address, prefetched above
+                        block_range = self._scan_block_range(last_tx_hash, extended_scan, quick_scan)
+                        transactions = fetched.get((address, block_range), [])
+                        new_hashes = {tx.hash for tx in transactions} - seen.keys() - {"", None}
+                        address_lower = address.lower()
                         log.debug(f"Found {len(transactions)} EVM transactions for {address[:10]}...")
                         
                         for tx in transactions:
-                            tx_hash = tx.get("hash", "")
-                            if tx_hash and tx_hash != last_tx_hash:
+                            tx_hash = tx.hash
+                            if tx_hash in new_hashes:
+                                new_hashes.discard(tx_hash)
                                 # Determine transaction type
-                                from_addr = tx.get("from", "")
-                                to_addr = tx.get("to", "")
+                                from_addr = tx.from_
+                                to_addr = tx.to
                                 
                                 # Add null checks for address comparison
-                                if from_addr and from_addr.lower() == address.lower():
+                                if from_addr and from_addr.lower() == address_lower:
                                     tx_type = "OUTGOING"
-                                elif to_addr and to_addr.lower() == address.lower():
+                                elif to_addr and to_addr.lower() == address_lower:
                                     tx_type = "INCOMING"
                                 else:
                                     tx_type = "UNKNOWN"
@@ -257,22 +674,24 @@ class TransactionMonitor:
                                     "hash": tx_hash,
                                     "type": "EVM",
                                     "direction": tx_type,
-                                    "block": tx.get("blockNumber", ""),
+                                    "block": tx.block_number,
                                     "from": from_addr,
                                     "to": to_addr,
-                                    "value": tx.get("value", "0"),
-                                    "data": tx
+                                    "value": tx.value,
+                                    "data": tx._asdict()
                                 })
                                 log.info(f"New EVM transaction found: {tx_hash[:10]}... ({tx_type})")
                     else:
-                        # SEI native address
-                        log.debug(f"Getting SEI transactions for {address[:10]}...")
-                        transactions = await self.get_sei_transactions(address)
+                        # SEI native address, prefetched above
+                        transactions = fetched.get((address, 0), [])
+                        new_hashes = {tx.get("hash") for tx in transactions} - seen.keys() - {"", None}
                         log.debug(f"Found {len(transactions)} SEI transactions for {address[:10]}...")
                         
-                        for tx in transactions:
+                        # The LCD lists newest first; notify oldest first so the stored hash is the newest
+                        for tx in reversed(transactions):
                             tx_hash = tx.get("hash", "")
-                            if tx_hash and tx_hash != last_tx_hash:
+                            if tx_hash in new_hashes:
+                                new_hashes.discard(tx_hash)
                                 # Try to determine direction from transaction data
                                 tx_data = tx.get("data", {})
                                 tx_body = tx_data.get("tx", {})
@@ -296,7 +715,9 @@ class TransactionMonitor:
                                 })
                                 log.info(f"New SEI transaction found: {tx_hash[:10]}... ({direction})")
                     
-                    # Send notifications for new transactions
+                    # Send notifications for new transactions; sends are paced by the
+                    # per-chat limiter and the application's rate limiter, so no sleep here
+                    last_processed = None
                     for tx in new_transactions:
                         try:
                             if context and hasattr(context, 'bot') and context.bot:
@@ -304,30 +725,30 @@ class TransactionMonitor:
                             else:
                                 log.info(f"Would send notification for transaction {tx['hash'][:10]}... to user {user_id} (no context)")
                             
-                            # Update last transaction hash
-                            await set_last_tx_hash(user_id, address, tx["hash"])
-                            
+                            self.mark_seen(user_id, address, tx["hash"])
+                            last_processed = tx["hash"]
                             log.info(f"Processed transaction {tx['hash'][:10]}... for user {user_id}")
                         except Exception as e:
                             log.error(f"Error processing transaction {tx.get('hash', 'unknown')}: {e}")
-                        
-                        # Small delay to avoid rate limiting
-                        await asyncio.sleep(0.2)
+                    
+                    if last_processed is not None:
+                        rows.append((last_processed, user_id, address))
                 
                 except Exception as e:
                     log.error(f"Error checking transactions for {address}: {e}")
                     continue
             
+            await set_last_tx_hashes(rows)
             self.last_check_time = time.time()
             log.debug("Transaction monitoring check completed")
             
         except Exception as e:
-            log.error(f"Error in transaction monitoring: {e}")
-            import traceback
-            log.error(f"Traceback: {traceback.format_exc()}")
+            log.exception(f"Error in transaction monitoring: {e}")
     
     async def _send_transaction_notification(self, context, user_id: int, address: str, transaction: Dict) -> None:
         """Send notification about new transaction"""
+        if user_id in self._dead_users:
+            return
         try:
             tx_type = transaction["type"]
             tx_hash = transaction["hash"]
@@ -343,6 +764,13 @@ class TransactionMonitor:
             # Get transaction details
             tx_details = await self._get_transaction_details(tx_hash, tx_type)
             
+            # Transaction details section, if available
+            details = (
+                f"💰 Value: {tx_details.get('value', 'N/A')}\n"
+                f"⛽ Gas Used: {tx_details.get('gas_used', 'N/A')}\n"
+                f"💸 Fee: {tx_details.get('fee', 'N/A')}\n\n"
+            ) if tx_details else ""
+            
             message = (
                 f"🔔 New Transaction Detected!\n\n"
                 f"📍 Address: {address[:10]}...\n"
@@ -350,97 +778,134 @@ class TransactionMonitor:
                 f"{direction_emoji} Direction: {direction}\n"
                 f"📦 Block: {block}\n"
                 f"🔍 Hash: {tx_hash[:10]}...\n\n"
+                f"{details}"
+                f"🌐 View on Explorer: {explorer_url}"
             )
             
-            # Add transaction details if available
-            if tx_details:
-                message += f"💰 Value: {tx_details.get('value', 'N/A')}\n"
-                message += f"⛽ Gas Used: {tx_details.get('gas_used', 'N/A')}\n"
-                message += f"💸 Fee: {tx_details.get('fee', 'N/A')}\n\n"
-            
-            message += f"🌐 View on Explorer: {explorer_url}"
-            
             # Try to send the message with better error handling
             try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    disable_web_page_preview=True
-                )
+                async with self._chat_limiter(user_id):
+                    await context.bot.send_message(
+                        chat_id=user_id,
+                        text=message,
+                        disable_web_page_preview=True
+                    )
                 log.info(f"✅ Sent transaction notification to user {user_id} for {address} - {direction} {tx_type} transaction")
             except Exception as send_error:
-                if "Chat not found" in str(send_error):
-                    log.warning(f"⚠️ Chat not found for user {user_id}. User may need to start the bot first.")
-                elif "Forbidden" in str(send_error):
-                    log.warning(f"⚠️ Bot blocked by user {user_id}")
+                error = str(send_error)
+                reason = next((text for marker, text in _TG_DEAD_CHAT_ERRORS.items() if marker in error), None)
+                if reason is None:
+                    log.error(f"❌ Error sending notification to user {user_id}: {error}")
                 else:
-                    log.error(f"❌ Error sending notification to user {user_id}: {send_error}")
+                    # Unreachable for good: stop spending scans and sends on this user
+                    log.warning(f"⚠️ {reason.format(user_id=user_id)}, removing their watches")
+                    self._dead_users.add(user_id)
+                    await remove_watches_for_user(user_id)
             
         except Exception as e:
-            log.error(f"Error in transaction notification: {e}")
-            import traceback
-            log.error(f"Traceback: {traceback.format_exc()}")
+            log.exception(f"Error in transaction notification: {e}")
+    
+    def _chat_limiter(self, user_id: int) -> AsyncLimiter:
+        """The chat's one-message-per-second limiter, created on first use"""
+        limiter = self._chat_limiters.get(user_id)
+        if limiter is None:
+            limiter = self._chat_limiters[user_id] = AsyncLimiter(1, 1.0)
+            if len(self._chat_limiters) > _CHAT_LIMITERS_MAX:
+                self._chat_limiters.popitem(last=False)
+        else:
+            self._chat_limiters.move_to_end(user_id)
+        return limiter
+    
+    def mark_user_reachable(self, user_id: int) -> None:
+        """Resume notifications for a user, e.g. after they add a watch again"""
+        self._dead_users.discard(user_id)
     
     async def _get_transaction_details(self, tx_hash: str, tx_type: str) -> Dict:
-        """Get detailed transaction information"""
+        """Get detailed transaction information; concurrent callers for the same tx share one lookup"""
+        if tx_type != "EVM":
+            return {}
+        
+        cached = self._tx_detail_cache.get(tx_hash)
+        if cached is not None:
+            expires_at, details = cached
+            if expires_at is None or time.monotonic() < expires_at:
+                self._tx_detail_cache.move_to_end(tx_hash)
+                return details
+        
+        fut = self._tx_detail_inflight.get(tx_hash)
+        if fut is not None:
+            # Shielded so a cancelled waiter can't cancel the lookup for everyone else
+            return await asyncio.shield(fut)
+        
+        fut = asyncio.get_running_loop().create_future()
+        self._tx_detail_inflight[tx_hash] = fut
+        try:
+            details = await self._fetch_transaction_details(tx_hash)
+            fut.set_result(details)
+            return details
+        finally:
+            if not fut.done():
+                fut.cancel()
+            del self._tx_detail_inflight[tx_hash]
+    
+    async def _fetch_transaction_details(self, tx_hash: str) -> Dict:
+        """Uncached details lookup for an EVM tx; updates the cache, never raises"""
         try:
             client = await self._get_http_client()
             
-            if tx_type == "EVM":
-                # Get EVM transaction receipt
-                response = await client.post(
-                    settings.SEI_EVM_RPC_URL,
-                    json={
-                        "jsonrpc": "2.0",
-                        "method": "eth_getTransactionReceipt",
-                        "params": [tx_hash],
-                        "id": 1
-                    }
-                )
+            # Receipt and transaction in one batch request
+            calls = [
+                {"jsonrpc": "2.0", "method": "eth_getTransactionReceipt", "params": [tx_hash], "id": 1},
+                {"jsonrpc": "2.0", "method": "eth_getTransactionByHash", "params": [tx_hash], "id": 2},
+            ]
+            response = await self._rpc_post(client, calls)
+            if response.status_code != 200:
+                return {}
+            data = self._json_loads(response.content)
+            if isinstance(data, list):
+                by_id = {item.get("id"): item.get("result") for item in data if isinstance(item, dict)}
+                receipt, tx = by_id.get(1), by_id.get(2)
+            else:
+                # Provider doesn't accept batches; ask for each one separately
+                receipt = await self._rpc_result(client, calls[0])
+                tx = await self._rpc_result(client, calls[1]) if receipt else None
+            
+            details: Dict = {}
+            if receipt and tx:
+                # Calculate values
+                gas_used = int(receipt.get("gasUsed", "0"), 16)
+                gas_price = int(tx.get("gasPrice", "0"), 16)
+                value = int(tx.get("value", "0"), 16)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    if "result" in data and data["result"]:
-                        receipt = data["result"]
-                        
-                        # Get transaction details
-                        tx_response = await client.post(
-                            settings.SEI_EVM_RPC_URL,
-                            json={
-                                "jsonrpc": "2.0",
-                                "method": "eth_getTransactionByHash",
-                                "params": [tx_hash],
-                                "id": 1
-                            }
-                        )
-                        
-                        if tx_response.status_code == 200:
-                            tx_data = tx_response.json()
-                            if "result" in tx_data and tx_data["result"]:
-                                tx = tx_data["result"]
-                                
-                                # Calculate values
-                                gas_used = int(receipt.get("gasUsed", "0"), 16)
-                                gas_price = int(tx.get("gasPrice", "0"), 16)
-                                value = int(tx.get("value", "0"), 16)
-                                
-                                # Convert to SEI (assuming 18 decimals)
-                                gas_fee_wei = gas_used * gas_price
-                                gas_fee_sei = gas_fee_wei / (10 ** 18)
-                                value_sei = value / (10 ** 18)
-                                
-                                return {
-                                    "value": f"{value_sei:.6f} SEI" if value_sei > 0 else "0 SEI",
-                                    "gas_used": f"{gas_used:,}",
-                                    "fee": f"{gas_fee_sei:.8f} SEI"
-                                }
+                # Convert to SEI (18 decimals)
+                gas_fee_sei = gas_used * gas_price / _WEI_PER_SEI
+                value_sei = value / _WEI_PER_SEI
+                
+                details = {
+                    "value": f"{value_sei:.6f} SEI" if value_sei > 0 else "0 SEI",
+                    "gas_used": f"{gas_used:,}",
+                    "fee": f"{gas_fee_sei:.8f} SEI"
+                }
             
-            return {}
+            # Mined transactions never change; a pending one is re-asked after a short while
+            expires_at = None if details else time.monotonic() + _PENDING_TX_TTL
+            self._tx_detail_cache[tx_hash] = (expires_at, details)
+            self._tx_detail_cache.move_to_end(tx_hash)
+            while len(self._tx_detail_cache) > _TX_DETAIL_CACHE_MAX:
+                self._tx_detail_cache.popitem(last=False)
+            return details
             
         except Exception as e:
             log.error(f"Error getting transaction details: {e}")
             return {}
     
+    async def _rpc_result(self, client: httpx.AsyncClient, call: Dict) -> Any:
+        """The "result" of a single JSON-RPC call, or None"""
+        response = await self._rpc_post(client, call)
+        if response.status_code != 200:
+            return None
+        return self._json_loads(response.content).get("result")
+    
     async def close(self) -> None:
         """Close HTTP client"""
         if self._http_client: